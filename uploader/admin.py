@@ -1,3 +1,58 @@
 from django.contrib import admin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+from django.utils.http import content_disposition_header
 
-# Register your models here.
+from .models import RequestProfile
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """请求剖析结果：只读浏览，可下载 .prof 文件"""
+    list_display = ('created_at', 'method', 'path', 'view_name', 'status_code', 'duration_ms', 'query_count', 'query_time_ms', 'trigger')
+    list_filter = ('trigger', 'view_name', 'method')
+    search_fields = ('path',)
+    date_hierarchy = 'created_at'
+    exclude = ('raw_stats', 'queries', 'stats_text')
+    readonly_fields = (
+        'created_at', 'method', 'path', 'view_name', 'status_code', 'trigger',
+        'duration_ms', 'query_count', 'query_time_ms', 'download', 'stats', 'query_list',
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path('<int:profile_id>/download/', self.admin_site.admin_view(self.download_view), name='uploader_requestprofile_download'),
+        ]
+        return urls + super().get_urls()
+
+    def download_view(self, request, profile_id):
+        profile = get_object_or_404(RequestProfile, id=profile_id)
+        response = HttpResponse(bytes(profile.raw_stats), content_type='application/octet-stream')
+        response['Content-Disposition'] = content_disposition_header(True, f'request-{profile.id}.prof')
+        return response
+
+    @admin.display(description='原始数据')
+    def download(self, obj):
+        url = reverse('admin:uploader_requestprofile_download', args=[obj.id])
+        return format_html('<a href="{}">下载 request-{}.prof</a>', url, obj.id)
+
+    @admin.display(description='cProfile 统计')
+    def stats(self, obj):
+        return format_html('<pre style="white-space:pre; overflow-x:auto;">{}</pre>', obj.stats_text)
+
+    @admin.display(description='SQL')
+    def query_list(self, obj):
+        # 最慢的在前
+        queries = sorted(obj.queries or [], key=lambda query: query['ms'], reverse=True)
+        return format_html(
+            '<table>{}</table>',
+            format_html_join('', '<tr><td style="white-space:nowrap">{} ms</td><td><code>{}</code></td></tr>', ((q['ms'], q['sql']) for q in queries)),
+        )
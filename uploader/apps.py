@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete
 
 
 class UploaderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'uploader'
+
+    def ready(self):
+        from .dbtuning import configure_sqlite_connection
+        connection_created.connect(configure_sqlite_connection, dispatch_uid='uploader_sqlite_pragmas')
+
+        from .models import ExtractedInfo, UploadedFile
+        from .reporting import subtract_deleted_info
+        from .retention import release_deleted_upload
+        post_delete.connect(release_deleted_upload, sender=UploadedFile, dispatch_uid='uploader_release_archive')
+        post_delete.connect(subtract_deleted_info, sender=ExtractedInfo, dispatch_uid='uploader_summary_delete')
@@ -0,0 +1,201 @@
+import math
+import time
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from .fragments import bump_upload_versions
+from .ingest import BULK_BATCH_SIZE
+from .models import ExtractedInfo
+from .utils import fiber_total_length
+
+# 与 utils.verify_calculation 相同的容差
+VERIFY_TOLERANCE = 0.0001
+# 稳健 z 分数（Iglewicz & Hoaglin）：0.6745·(x − 中位数) / MAD；MAD 为 0 时改用 1.2533·平均绝对偏差
+MAD_SCALE = 0.6745
+MEAN_AD_SCALE = 1.253314
+DEFAULT_THRESHOLD = 3.5
+DEFAULT_MIN_PEERS = 8
+DEFAULT_CHUNK_SIZE = 20000
+# 写回的分数保留的小数位，重复运行时结果不变、不会重复写入
+SCORE_DIGITS = 3
+
+_LOAD_FIELDS = [
+    'id',
+    'uploaded_file_id',
+    'uploaded_file__construction_unit',
+    'uploaded_file__township',
+    'extraction_status',
+    'total_float',
+    'doc_float',
+    'fiber_info',
+    'verification_passed',
+    'fee_anomaly',
+    'fee_anomaly_score',
+]
+
+
+def _float(value):
+    return math.nan if value is None else float(value)
+
+
+def load_fee_arrays(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """按 id 分块读取提取结果的费用相关列，返回以列名为键的 NumPy 数组
+
+    只取审计需要的列（不加载全文），按 id 递增分块（不用 OFFSET），内存中每块只保留一份元组列表；
+    金额在数据库中转为浮点数再读出，省去逐值构造 Decimal 的开销。
+    施工单位、街道与是否有光缆组合为同行分组，编码成整数 group。
+    """
+    queryset = (queryset if queryset is not None else ExtractedInfo.objects.all()).annotate(
+        total_float=Cast('total_fees', FloatField()),
+        doc_float=Cast('doc_maintenance_total', FloatField()),
+    ).order_by('id')
+    columns = {name: [] for name in (
+        'id', 'upload_id', 'group', 'ok', 'total', 'doc', 'length', 'passed', 'anomaly', 'score',
+    )}
+    groups = {}
+    labels = []
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).values_list(*_LOAD_FIELDS)[:chunk_size])
+        if not rows:
+            break
+        for pk, upload_id, unit, township, status, total, doc, fiber_info, passed, anomaly, score in rows:
+            length = fiber_total_length(fiber_info)
+            key = (unit or '', township or '', length > 0)
+            code = groups.get(key)
+            if code is None:
+                code = groups[key] = len(labels)
+                labels.append(key)
+            columns['id'].append(pk)
+            columns['upload_id'].append(upload_id)
+            columns['group'].append(code)
+            columns['ok'].append(status == '成功')
+            columns['total'].append(_float(total))
+            columns['doc'].append(_float(doc))
+            columns['length'].append(float(length))
+            columns['passed'].append(passed)
+            columns['anomaly'].append(anomaly)
+            columns['score'].append(_float(score))
+        last_id = rows[-1][0]
+
+    dtypes = {'id': np.int64, 'upload_id': np.int64, 'group': np.int64, 'ok': bool, 'passed': bool, 'anomaly': bool}
+    arrays = {name: np.array(values, dtype=dtypes.get(name, np.float64)) for name, values in columns.items()}
+    arrays['labels'] = labels
+    return arrays
+
+
+def verify_totals(total, doc):
+    """向量化的 verify_calculation：文档中有维护费合计且与费用总计一致"""
+    with np.errstate(invalid='ignore'):
+        return ~np.isnan(doc) & (np.abs(total - doc) < VERIFY_TOLERANCE)
+
+
+def _group_medians(values, groups, group_count):
+    """每组的中位数：按 (组, 值) 排序后取各组中间位置，无样本的组为 NaN"""
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    counts = np.bincount(groups, minlength=group_count)
+    starts = np.cumsum(counts) - counts
+    medians = np.full(group_count, np.nan)
+    present = counts > 0
+    lo = starts[present] + (counts[present] - 1) // 2
+    hi = starts[present] + counts[present] // 2
+    medians[present] = (ordered[lo] + ordered[hi]) / 2
+    return medians, counts
+
+
+def robust_scores(metric, groups, eligible, min_peers=DEFAULT_MIN_PEERS):
+    """每行相对同组中位数的稳健 z 分数
+
+    只有 eligible 的行参与统计和打分；同组参与行少于 min_peers 或组内取值完全相同时为 NaN。
+    """
+    scores = np.full(len(metric), np.nan)
+    if not eligible.any():
+        return scores
+    values = metric[eligible]
+    # 只保留出现过的组，重新编号为 0..k-1
+    present, codes = np.unique(groups[eligible], return_inverse=True)
+    medians, counts = _group_medians(values, codes, len(present))
+    deviation = np.abs(values - medians[codes])
+    mad, _ = _group_medians(deviation, codes, len(present))
+    mean_ad = np.bincount(codes, weights=deviation, minlength=len(present)) / counts
+    scale = np.where(mad > 0, mad / MAD_SCALE, mean_ad * MEAN_AD_SCALE)
+    enough = (counts >= min_peers) & (scale > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(enough[codes], (values - medians[codes]) / scale[codes], np.nan)
+    scores[eligible] = z
+    return scores
+
+
+def fee_metric(total, length):
+    """比较用的费用指标：有光缆时为每米费用的对数，否则为费用的对数（费用分布右偏，取对数后更接近对称）"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.log(np.where(length > 0, total / length, total))
+
+
+def _write_back(arrays, rows, passed, anomaly, scores):
+    """只更新有变化的行；逐行 UPDATE 用 executemany 一次提交，比 bulk_update 生成的 CASE 语句快得多"""
+    table = connection.ops.quote_name(ExtractedInfo._meta.db_table)
+    sql = (
+        f'UPDATE {table} SET verification_passed = %s, fee_anomaly = %s, fee_anomaly_score = %s WHERE id = %s'
+    )
+    params = [
+        (bool(passed[i]), bool(anomaly[i]), None if np.isnan(scores[i]) else float(scores[i]), int(arrays['id'][i]))
+        for i in rows
+    ]
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for start in range(0, len(params), DEFAULT_CHUNK_SIZE):
+                cursor.executemany(sql, params[start:start + DEFAULT_CHUNK_SIZE])
+        # 上传 id 去重后分块，IN 列表不超过 SQLite 的变量数上限（常见编译默认 32766）
+        upload_ids = np.unique(arrays['upload_id'][rows]).tolist()
+        for start in range(0, len(upload_ids), BULK_BATCH_SIZE):
+            bump_upload_versions(upload_ids[start:start + BULK_BATCH_SIZE])
+
+
+def audit_fees(queryset=None, threshold=DEFAULT_THRESHOLD, min_peers=DEFAULT_MIN_PEERS,
+               chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, top=20):
+    """重新验算全部提取结果，并标记费用异常（显著高于同施工单位、同街道同类文档）的行
+
+    返回统计信息；dry_run 时只计算、不写回。
+    """
+    timings = {}
+    started = time.perf_counter()
+    arrays = load_fee_arrays(queryset, chunk_size)
+    timings['load'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    total, length = arrays['total'], arrays['length']
+    passed = verify_totals(total, arrays['doc'])
+    eligible = arrays['ok'] & (total > 0)
+    scores = np.round(robust_scores(fee_metric(total, length), arrays['group'], eligible, min_peers), SCORE_DIGITS)
+    # 只标记偏高的一侧：费用偏低通常是少算，不属于本审计关心的多报
+    with np.errstate(invalid='ignore'):
+        anomaly = scores > threshold
+    old_scores = arrays['score']
+    score_changed = ~((np.isnan(scores) & np.isnan(old_scores)) | (np.abs(scores - old_scores) < 10 ** -SCORE_DIGITS / 2))
+    changed = np.flatnonzero((passed != arrays['passed']) | (anomaly != arrays['anomaly']) | score_changed)
+    timings['compute'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if not dry_run and len(changed):
+        _write_back(arrays, changed, passed, anomaly, scores)
+    timings['write'] = time.perf_counter() - started
+
+    flagged = np.flatnonzero(anomaly)
+    worst = flagged[np.argsort(-scores[flagged])][:top]
+    return {
+        'rows': len(total),
+        'groups': len(arrays['labels']),
+        'scored': int((~np.isnan(scores)).sum()),
+        'verification_passed': int(passed.sum()),
+        'verification_changed': int((passed != arrays['passed']).sum()),
+        'anomalies': len(flagged),
+        'changed': len(changed),
+        'written': 0 if dry_run else len(changed),
+        'top': [(int(arrays['id'][i]), float(scores[i])) for i in worst],
+        'timings': timings,
+    }
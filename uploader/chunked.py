@@ -0,0 +1,230 @@
+import hashlib
+import os
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from .metrics import CHUNKS_RECEIVED
+from .progress import valid_token
+
+# 未完成的分块上传写在存储下的该目录中，完成后由存储改名移入最终位置，不再复制
+PARTIAL_DIR = 'uploads/partial'
+
+_READ_BLOCK = 64 * 1024
+
+
+class ChunkedUploadError(Exception):
+    """分块上传协议错误：error 为返回给客户端的错误码，status 为 HTTP 状态码"""
+
+    def __init__(self, error, status=400, **extra):
+        super().__init__(error)
+        self.error = error
+        self.status = status
+        self.extra = extra
+
+
+class AssembledArchive(File):
+    """已拼装完成的分块上传文件
+
+    提供 temporary_file_path()，FileSystemStorage.save()（及内容寻址存储）会把它改名移动到最终位置，
+    与 Django 的 TemporaryUploadedFile 走同一条路径，不产生第二份拷贝。
+    """
+
+    def __init__(self, path, name):
+        super().__init__(None, name)
+        self._path = path
+        self.size = os.path.getsize(path)
+
+    def temporary_file_path(self):
+        return self._path
+
+    def open(self, mode='rb'):
+        self.file = open(self._path, mode)
+        return self
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def chunk_size():
+    return getattr(settings, 'UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)
+
+
+def max_size():
+    return getattr(settings, 'UPLOAD_CHUNKED_MAX_SIZE', 2 * 1024 * 1024 * 1024)
+
+
+def session_timeout():
+    return getattr(settings, 'UPLOAD_CHUNKED_TIMEOUT', 24 * 3600)
+
+
+def _session_key(upload_id):
+    return f'upload:chunked:{upload_id}'
+
+
+def _chunk_key(upload_id, index):
+    return f'upload:chunked:{upload_id}:{index}'
+
+
+def _partial_path(upload_id):
+    return default_storage.path(f'{PARTIAL_DIR}/{upload_id}.part')
+
+
+def purge_stale_partials(max_age=None):
+    """删除超过会话有效期仍未完成的分块文件（会话已从缓存过期，无法再续传）"""
+    max_age = session_timeout() if max_age is None else max_age
+    directory = default_storage.path(PARTIAL_DIR)
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    deadline = time.time() - max_age
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < deadline:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def init_upload(filename, size, sha256=''):
+    """创建上传会话并预分配目标文件，返回会话状态"""
+    filename = os.path.basename(str(filename or '')).strip()
+    if not filename.lower().endswith('.zip'):
+        raise ChunkedUploadError('unsupported_type')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise ChunkedUploadError('invalid_size')
+    if size <= 0 or size > max_size():
+        raise ChunkedUploadError('invalid_size', max_size=max_size())
+    sha256 = str(sha256 or '').lower()
+    if sha256 and (len(sha256) != 64 or any(ch not in '0123456789abcdef' for ch in sha256)):
+        raise ChunkedUploadError('invalid_checksum')
+
+    purge_stale_partials()
+    upload_id = secrets.token_urlsafe(16)
+    path = _partial_path(upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 预分配为最终大小（稀疏文件），各分块按偏移直接写入，乱序、并行、重传都不需要再拼接
+    with open(path, 'wb') as f:
+        f.truncate(size)
+
+    state = {
+        'upload_id': upload_id,
+        'name': filename,
+        'size': size,
+        'chunk_size': chunk_size(),
+        'total_chunks': -(-size // chunk_size()),
+        'sha256': sha256,
+    }
+    cache.set(_session_key(upload_id), state, session_timeout())
+    return {**state, 'received': []}
+
+
+def _load(upload_id):
+    state = cache.get(_session_key(upload_id)) if valid_token(upload_id) else None
+    if state is None or not os.path.exists(_partial_path(upload_id)):
+        raise ChunkedUploadError('not_found', status=404)
+    return state
+
+
+def _received(state):
+    upload_id = state['upload_id']
+    keys = {_chunk_key(upload_id, index): index for index in range(state['total_chunks'])}
+    return sorted(keys[key] for key in cache.get_many(list(keys)))
+
+
+def upload_status(upload_id):
+    """会话状态及已收到的分块序号，客户端据此只补传缺失的分块"""
+    state = _load(upload_id)
+    return {**state, 'received': _received(state)}
+
+
+def write_chunk(upload_id, index, stream, checksum):
+    """把第 index 个分块按偏移写入目标文件
+
+    边读边计算 SHA-256，内存中最多只有一个读缓冲；长度或校验和不符时不记为已收到，
+    该区域会在重传时被覆盖。
+    """
+    state = _load(upload_id)
+    if not 0 <= index < state['total_chunks']:
+        raise ChunkedUploadError('invalid_chunk')
+    checksum = str(checksum or '').lower()
+    if not checksum:
+        raise ChunkedUploadError('checksum_required')
+
+    offset = index * state['chunk_size']
+    expected = min(state['chunk_size'], state['size'] - offset)
+    digest = hashlib.sha256()
+    written = 0
+    # 每个请求各自打开文件、定位到本分块的偏移再写（Windows 没有 os.pwrite），并发写入的区域互不重叠
+    with open(_partial_path(upload_id), 'r+b') as f:
+        f.seek(offset)
+        while written <= expected:
+            block = stream.read(_READ_BLOCK)
+            if not block:
+                break
+            block = block[:expected + 1 - written]
+            digest.update(block)
+            if written + len(block) <= expected:
+                f.write(block)
+            written += len(block)
+
+    if written != expected:
+        CHUNKS_RECEIVED.labels('size_mismatch').inc()
+        raise ChunkedUploadError('size_mismatch', expected=expected, received=written)
+    if digest.hexdigest() != checksum:
+        CHUNKS_RECEIVED.labels('checksum_mismatch').inc()
+        raise ChunkedUploadError('checksum_mismatch', index=index)
+    CHUNKS_RECEIVED.labels('ok').inc()
+    cache.set(_chunk_key(upload_id, index), checksum, session_timeout())
+    # 续期会话，长时间的慢速上传不会中途过期
+    cache.touch(_session_key(upload_id), session_timeout())
+    return index
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def assemble(upload_id):
+    """确认所有分块都已收到并校验整体 SHA-256（如初始化时提供），返回可交给 process_archives 的文件
+
+    文件在 process_archives 存储时改名移入存储（内容已存在时保留原处）；处理完成后调用 discard() 结束会话。
+    """
+    state = _load(upload_id)
+    received = set(_received(state))
+    missing = [index for index in range(state['total_chunks']) if index not in received]
+    if missing:
+        raise ChunkedUploadError('incomplete', status=409, missing=missing)
+    path = _partial_path(upload_id)
+    if state['sha256'] and _file_sha256(path) != state['sha256']:
+        discard(upload_id)
+        raise ChunkedUploadError('checksum_mismatch', status=409)
+    return AssembledArchive(path, state['name'])
+
+
+def discard(upload_id):
+    """结束或放弃上传：删除会话及尚未移走的分块文件"""
+    if not valid_token(upload_id):
+        return
+    state = cache.get(_session_key(upload_id))
+    keys = [_session_key(upload_id)]
+    if state:
+        keys += [_chunk_key(upload_id, index) for index in range(state['total_chunks'])]
+    cache.delete_many(keys)
+    try:
+        os.remove(_partial_path(upload_id))
+    except FileNotFoundError:
+        pass
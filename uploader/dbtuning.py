@@ -0,0 +1,40 @@
+from django.conf import settings
+
+# 每个新 SQLite 连接上执行的 PRAGMA；可在 settings.SQLITE_PRAGMAS 中覆盖
+DEFAULT_SQLITE_PRAGMAS = {
+    # WAL：读写互不阻塞，多个进程可同时读
+    'journal_mode': 'WAL',
+    # 遇到锁时最多等待的毫秒数，而不是立即报 database is locked
+    'busy_timeout': 20000,
+    # WAL 模式下 NORMAL 只在检查点时同步，断电最多丢失最近的提交，不会损坏数据库
+    'synchronous': 'NORMAL',
+    # 负数表示 KiB：每个连接约 64MB 页缓存
+    'cache_size': -64000,
+    # 通过内存映射读取数据库文件
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def sqlite_pragmas():
+    pragmas = dict(DEFAULT_SQLITE_PRAGMAS)
+    pragmas.update(getattr(settings, 'SQLITE_PRAGMAS', None) or {})
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def apply_sqlite_pragmas(cursor, pragmas=None):
+    """在 DB-API 游标上执行 PRAGMA，返回 {名称: 生效后的值}"""
+    applied = {}
+    for name, value in (sqlite_pragmas() if pragmas is None else pragmas).items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+        row = cursor.fetchone()
+        applied[name] = row[0] if row else value
+    return applied
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """connection_created 信号处理：为新建的 SQLite 连接设置 PRAGMA"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_sqlite_pragmas(cursor)
@@ -0,0 +1,117 @@
+import html
+from bisect import bisect_right
+
+from .rules import PRICE_FIELDS, get_rules
+from .utils import EXTRACTION_WHITESPACE_RE
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+
+def _normalized_with_offsets(text):
+    """与 normalize_text_for_extraction 相同的归一化，同时返回每个字符在原文中的位置"""
+    offsets = [index for index, char in enumerate(text) if not EXTRACTION_WHITESPACE_RE.match(char)]
+    return ''.join(text[index] for index in offsets), offsets
+
+
+def match_spans(text, rules=None):
+    """用提取规则在原文中定位命中位置，返回按起点排序的 [(start, end, field)]
+
+    规则作用于去除空白后的文本，命中区间再映射回原文；费用字段与提取时一样只取优先级最高的第一处命中，
+    光缆取全部命中。
+    """
+    rules = rules or get_rules()
+    normalized, offsets = _normalized_with_offsets(text or '')
+    spans = []
+
+    def add(match, field):
+        if match.end() > match.start():
+            spans.append((offsets[match.start()], offsets[match.end() - 1] + 1, field))
+
+    for field in PRICE_FIELDS:
+        for pattern in rules.patterns(field):
+            match = pattern.search(normalized)
+            if match:
+                add(match, field)
+                break
+
+    seen = []
+    for pattern in rules.fiber_patterns:
+        for match in pattern.finditer(normalized):
+            if not any(abs(match.start() - pos) < 10 for pos in seen):
+                seen.append(match.start())
+                add(match, 'fiber_info')
+    return sorted(spans)
+
+
+def _highlight(paragraph, start, spans, rules):
+    """转义段落文本，并用 <mark> 包住与 spans 相交的部分"""
+    end = start + len(paragraph)
+    parts = []
+    cursor = start
+    for span_start, span_end, field in spans:
+        if span_end <= cursor or span_start >= end:
+            continue
+        # 不同字段的命中可能重叠，重叠部分只标记一次
+        span_start = max(span_start, cursor)
+        span_end = min(span_end, end)
+        if span_end <= span_start:
+            continue
+        parts.append(html.escape(paragraph[cursor - start:span_start - start]))
+        parts.append(
+            f'<mark data-field="{field}" title="{html.escape(rules.label(field))}">'
+            f'{html.escape(paragraph[span_start - start:span_end - start])}</mark>'
+        )
+        cursor = span_end
+    parts.append(html.escape(paragraph[cursor - start:]))
+    return ''.join(parts)
+
+
+def document_page(text, page=1, page_size=DEFAULT_PAGE_SIZE, highlight=True, context=None, rules=None):
+    """按段落分页返回文档原文
+
+    highlight 为真时段落以 HTML 返回，命中提取规则的片段包在 <mark> 中；否则返回纯文本。
+    context 不为 None 时忽略分页，只返回命中段落及其前后 context 段。
+    """
+    rules = rules or get_rules()
+    text = text or ''
+    paragraphs = text.split('\n')
+    starts = []
+    position = 0
+    for paragraph in paragraphs:
+        starts.append(position)
+        position += len(paragraph) + 1
+
+    spans = match_spans(text, rules) if highlight or context is not None else []
+    matches = []
+    touched = set()
+    for span_start, span_end, field in spans:
+        index = bisect_right(starts, span_start) - 1
+        last = bisect_right(starts, span_end - 1) - 1
+        touched.update(range(index, last + 1))
+        matches.append({'field': field, 'label': rules.label(field), 'paragraph': index, 'page': index // page_size + 1})
+
+    pages = max(1, -(-len(paragraphs) // page_size))
+    if context is not None:
+        wanted = sorted({i for index in touched for i in range(index - context, index + context + 1) if 0 <= i < len(paragraphs)})
+    else:
+        page = min(max(1, page), pages)
+        wanted = range((page - 1) * page_size, min(len(paragraphs), page * page_size))
+
+    items = []
+    for index in wanted:
+        if highlight:
+            content = _highlight(paragraphs[index], starts[index], spans, rules)
+        else:
+            content = paragraphs[index]
+        items.append({'index': index, 'content': content})
+
+    return {
+        'page': None if context is not None else page,
+        'pages': pages,
+        'page_size': page_size,
+        'paragraph_count': len(paragraphs),
+        'highlighted': bool(highlight),
+        'paragraphs': items,
+        'matches': matches,
+    }
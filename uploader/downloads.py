@@ -0,0 +1,139 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+# 分段响应每次读取的块大小
+RANGE_CHUNK_SIZE = 256 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFileIterator:
+    """按字节区间读取文件；StreamingHttpResponse 结束（含客户端中断）时会调用 close 关闭文件句柄"""
+
+    def __init__(self, file_obj, start, length, chunk_size=RANGE_CHUNK_SIZE):
+        self.file_obj = file_obj
+        self.remaining = length
+        self.chunk_size = chunk_size
+        self.file_obj.seek(start)
+
+    def __iter__(self):
+        while self.remaining > 0:
+            data = self.file_obj.read(min(self.chunk_size, self.remaining))
+            if not data:
+                break
+            self.remaining -= len(data)
+            yield data
+
+    def close(self):
+        self.file_obj.close()
+
+
+def parse_range_header(header, size):
+    """解析单区间 Range 头，返回 (start, end)；多区间或格式不合法返回 None（按完整文件响应），无法满足返回 False"""
+    if not header:
+        return None
+    m = _RANGE_RE.match(header.strip())
+    if not m:
+        return None
+
+    first, last = m.groups()
+    if not first and not last:
+        return None
+    if size == 0:
+        # 空文件上的任何区间都无法满足（RFC 9110 14.1.1）
+        return False
+    if not first:
+        # bytes=-N：最后 N 个字节
+        suffix = int(last)
+        if suffix == 0:
+            return False
+        return max(size - suffix, 0), size - 1
+
+    start = int(first)
+    if start >= size:
+        return False
+    end = int(last) if last else size - 1
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag, last_modified):
+    """If-Range 不匹配时应忽略 Range，返回完整文件"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and if_range_date >= last_modified
+
+
+def _offload_response(path, content_type):
+    """交给前端服务器输出文件（nginx X-Accel-Redirect 或 X-Sendfile），Range 与条件请求由前端服务器处理"""
+    mode = getattr(settings, 'DOWNLOAD_SENDFILE_MODE', None)
+    if mode == 'nginx':
+        # MEDIA_ROOT 与冷存储目录各自映射到一个 internal location
+        locations = [(settings.MEDIA_ROOT, getattr(settings, 'DOWNLOAD_ACCEL_REDIRECT_PREFIX', '/protected-media/'))]
+        if getattr(settings, 'RETENTION_COLD_ROOT', None):
+            locations.append((settings.RETENTION_COLD_ROOT, getattr(settings, 'DOWNLOAD_ACCEL_REDIRECT_COLD_PREFIX', '/protected-cold-media/')))
+        for root, prefix in locations:
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            if not relative.startswith('../'):
+                response = HttpResponse(content_type=content_type)
+                response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(relative)
+                return response
+        return None
+    if mode == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = os.path.abspath(path)
+        return response
+    return None
+
+
+def serve_file(request, path, filename):
+    """以附件形式输出文件，支持单区间 Range、If-None-Match / If-Modified-Since 以及前端服务器转发"""
+    stat = os.stat(path)
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    etag = f'"{size:x}-{stat.st_mtime_ns:x}"'
+    content_type = mimetypes.guess_type(filename)[0] or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    response = _offload_response(path, content_type)
+    if response is None:
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        byte_range = None
+        if _if_range_matches(request, etag, last_modified):
+            byte_range = parse_range_header(request.META.get('HTTP_RANGE'), size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                RangeFileIterator(open(path, 'rb'), start, length),
+                status=206,
+                content_type=content_type,
+            )
+            response['Content-Length'] = str(length)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        else:
+            # FileResponse 会在 WSGI 服务器支持时使用 wsgi.file_wrapper（sendfile）
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response['Content-Length'] = str(size)
+
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
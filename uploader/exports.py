@@ -0,0 +1,287 @@
+import csv
+import io
+import os
+import re
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+from .models import ExtractedInfo, UploadedFile
+from .retention import stored_file_path
+from .utils import format_beijing_datetime, fiber_total_length
+
+# 每次从数据库游标取出的行数，导出一年的数据也不会一次性载入内存
+EXPORT_CHUNK_SIZE = 2000
+
+# 每批写出的行数，避免每行一次网络写入
+EXPORT_BATCH_ROWS = 500
+
+# (查询字段, 表头)
+EXPORT_COLUMNS = [
+    ('uploaded_file_id', '上传ID'),
+    ('uploaded_file__original_filename', 'ZIP文件名'),
+    ('uploaded_file__group_name', '集团名称'),
+    ('uploaded_file__address', '地址'),
+    ('uploaded_file__township', '街道'),
+    ('uploaded_file__construction_unit', '施工单位'),
+    ('uploaded_file__uploaded_at', '上传时间'),
+    ('order_code', '单号'),
+    ('construction_order_code', '建设单号'),
+    ('document_name', '文档名称'),
+    ('archive_path', '所在内层压缩包'),
+    ('extraction_status', '提取状态'),
+    ('construction_email_sent_at', '建设邮件发送时间'),
+    ('field_construction_at', '现场施工时间'),
+    ('resource_entry_at', '资源录入时间'),
+    ('resource_address', '资源地址'),
+    ('construction_completed_at', '建设完成时间'),
+    ('maintenance_fee', '宽带维护费'),
+    ('service_fee', '宽带服务费'),
+    ('terminal_fee', '终端费'),
+    ('total_fees', '费用合计'),
+    ('doc_maintenance_total', '文档维护费合计'),
+    ('overall_total_price', '总体估算'),
+    ('total_price', '总估算'),
+    ('fiber_info', '光缆总长(米)'),
+    ('verification_passed', '验算通过'),
+    ('fee_anomaly', '费用异常'),
+]
+
+DATETIME_FIELDS = {
+    'uploaded_file__uploaded_at',
+    'construction_email_sent_at',
+    'field_construction_at',
+    'resource_entry_at',
+    'construction_completed_at',
+}
+
+
+def export_headers():
+    return [header for _, header in EXPORT_COLUMNS]
+
+
+def export_queryset(upload_queryset):
+    """筛选后的上传记录 -> 需要导出的提取结果（按上传顺序）"""
+    return (
+        ExtractedInfo.objects
+        .filter(uploaded_file__in=upload_queryset.values('id'))
+        .order_by('uploaded_file__uploaded_at', 'uploaded_file_id', 'id')
+    )
+
+
+def iter_export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """逐行产出导出数据，使用 iterator 分块读取，不缓存整个结果集"""
+    fields = [field for field, _ in EXPORT_COLUMNS]
+    for values in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        row = []
+        for field, value in zip(fields, values):
+            if field in DATETIME_FIELDS:
+                value = format_beijing_datetime(value)
+            elif field == 'fiber_info':
+                value = fiber_total_length(value)
+            elif field in ('verification_passed', 'fee_anomaly'):
+                value = '是' if value else '否'
+            row.append(value)
+        yield row
+
+
+class _Echo:
+    """csv.writer 所需的伪文件对象，直接返回写入内容"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """以 UTF-8 BOM 开头的 CSV 流（Excel 可直接打开中文）"""
+    writer = csv.writer(_Echo())
+    yield '\ufeff' + writer.writerow(export_headers())
+
+    batch = []
+    for row in rows:
+        batch.append(writer.writerow(['' if v is None else v for v in row]))
+        if len(batch) >= EXPORT_BATCH_ROWS:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+class ZipStreamSink:
+    """只写缓冲区：zipfile 写入的字节暂存于此，由生成器及时取走（不可 seek，zipfile 会自动使用数据描述符）"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# XML 1.0 不允许的控制字符
+_XML_ILLEGAL_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="提取结果" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+def _xlsx_cell(value):
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)) or hasattr(value, 'as_tuple'):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_XML_ILLEGAL_CHARS.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(v) for v in values) + '</row>'
+
+
+def stream_xlsx(rows):
+    """边生成边输出的单工作表 XLSX（内联字符串，无需共享字符串表）"""
+    sink = ZipStreamSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _XLSX_ROOT_RELS)
+        zf.writestr('xl/workbook.xml', _XLSX_WORKBOOK)
+        zf.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS)
+        yield sink.drain()
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(export_headers()).encode('utf-8'))
+
+            batch = io.StringIO()
+            batch_rows = 0
+            for row in rows:
+                batch.write(_xlsx_row(row))
+                batch_rows += 1
+                if batch_rows >= EXPORT_BATCH_ROWS:
+                    sheet.write(batch.getvalue().encode('utf-8'))
+                    batch = io.StringIO()
+                    batch_rows = 0
+                    data = sink.drain()
+                    if data:
+                        yield data
+            if batch_rows:
+                sheet.write(batch.getvalue().encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+# 打包下载时每次读取源文件的块大小
+BUNDLE_CHUNK_SIZE = 1024 * 1024
+
+BUNDLE_MANIFEST_HEADERS = ['上传ID', '原始文件名', '包内路径', '文件大小(字节)', '集团名称', '地址', '街道', '施工单位', '上传时间', '状态']
+
+
+def bundle_queryset(upload_queryset):
+    """筛选后的上传记录 -> 需要打包的上传（去重，按上传时间）"""
+    return (
+        UploadedFile.objects
+        .filter(id__in=upload_queryset.values('id'))
+        .order_by('uploaded_at', 'id')
+    )
+
+
+def _bundle_entry_name(uploaded_file):
+    # 不同上传可能同名，以上传ID作前缀保证包内路径唯一
+    name = os.path.basename(uploaded_file.original_filename or '') or f'{uploaded_file.id}.zip'
+    return f'{uploaded_file.id}_{name}'
+
+
+def stream_upload_bundle(uploads, chunk_size=BUNDLE_CHUNK_SIZE):
+    """把多个已存储的上传压缩包流式打包为一个 ZIP（存储模式，不二次压缩），末尾附 manifest.csv"""
+    sink = ZipStreamSink()
+    manifest = io.StringIO()
+    manifest_writer = csv.writer(manifest)
+    manifest_writer.writerow(BUNDLE_MANIFEST_HEADERS)
+
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for uploaded_file in uploads.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            entry_name = _bundle_entry_name(uploaded_file)
+            path = stored_file_path(uploaded_file)
+            status = '已打包'
+            size = None
+
+            if not path or not os.path.exists(path):
+                entry_name = ''
+                status = '文件缺失'
+            else:
+                zinfo = zipfile.ZipInfo.from_file(path, entry_name)
+                zinfo.compress_type = zipfile.ZIP_STORED
+                size = zinfo.file_size
+                with open(path, 'rb') as src, zf.open(zinfo, 'w') as dst:
+                    while True:
+                        data = src.read(chunk_size)
+                        if not data:
+                            break
+                        dst.write(data)
+                        yield sink.drain()
+
+            manifest_writer.writerow([
+                uploaded_file.id,
+                uploaded_file.original_filename,
+                entry_name,
+                size if size is not None else '',
+                uploaded_file.group_name or '',
+                uploaded_file.address or '',
+                uploaded_file.township or '',
+                uploaded_file.construction_unit or '',
+                format_beijing_datetime(uploaded_file.uploaded_at) or '',
+                status,
+            ])
+
+        zf.writestr(
+            zipfile.ZipInfo('manifest.csv', date_time=_zip_now()),
+            ('\ufeff' + manifest.getvalue()).encode('utf-8'),
+            compress_type=zipfile.ZIP_DEFLATED,
+        )
+    yield sink.drain()
+
+
+def _zip_now():
+    return time.localtime(time.time())[:6]
@@ -0,0 +1,69 @@
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from django.db.models import Exists, OuterRef, Q
+from django.utils.dateparse import parse_date
+
+from .models import ExtractedInfo, UploadedFile
+
+FILTER_TIMEZONE = ZoneInfo('Asia/Shanghai')
+
+
+def parse_upload_filters(params):
+    """从 GET 参数（或命令行参数字典）中解析仪表盘筛选条件"""
+    return {
+        'q': (params.get('q') or '').strip(),
+        'order_code': (params.get('order_code') or '').strip(),
+        'group_name': (params.get('group_name') or '').strip(),
+        'construction_unit': (params.get('construction_unit') or '').strip(),
+        'start_date': (params.get('start_date') or '').strip(),
+        'end_date': (params.get('end_date') or '').strip(),
+    }
+
+
+def _day_start(value):
+    """将 YYYY-MM-DD 解析为北京时间当天 0 点，无法解析时返回 None"""
+    try:
+        day = parse_date(value) if value else None
+    except ValueError:
+        day = None
+    if not day:
+        return None
+    return datetime.combine(day, time.min, tzinfo=FILTER_TIMEZONE)
+
+
+def _has_extracted_info(**lookups):
+    """关联提取结果的条件写成 EXISTS 子查询：不产生重复行，也不需要 DISTINCT"""
+    return Exists(ExtractedInfo.objects.filter(uploaded_file=OuterRef('pk'), **lookups))
+
+
+def filter_uploaded_files(filters, queryset=None):
+    """按仪表盘筛选条件过滤上传记录（每条上传最多出现一次）"""
+    qs = queryset if queryset is not None else UploadedFile.objects.all()
+
+    if filters.get('order_code'):
+        qs = qs.filter(_has_extracted_info(order_code__icontains=filters['order_code']))
+    if filters.get('group_name'):
+        qs = qs.filter(group_name__icontains=filters['group_name'])
+    if filters.get('construction_unit'):
+        qs = qs.filter(_has_extracted_info(construction_email_sent=True), construction_unit__icontains=filters['construction_unit'])
+    if filters.get('q'):
+        q = filters['q']
+        qs = qs.filter(
+            Q(original_filename__icontains=q)
+            | Q(group_name__icontains=q)
+            | Q(address__icontains=q)
+            | Q(township__icontains=q)
+            | Q(construction_unit__icontains=q)
+            | _has_extracted_info(order_code__icontains=q)
+        )
+
+    # 日期区间按北京时间的自然日计算，结束日期包含当天
+    start = _day_start(filters.get('start_date'))
+    if start:
+        qs = qs.filter(uploaded_at__gte=start)
+    end = _day_start(filters.get('end_date'))
+    if end:
+        qs = qs.filter(uploaded_at__lt=end + timedelta(days=1))
+
+    return qs
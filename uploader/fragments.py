@@ -0,0 +1,95 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils.safestring import mark_safe
+
+from .metrics import FRAGMENT_CACHE_REQUESTS, FRAGMENT_CACHE_SECONDS, timed
+from .models import UploadedFile
+
+SIDEBAR_VERSION_KEY = 'dashboard:sidebar:version'
+
+
+def fragment_timeout():
+    return getattr(settings, 'DASHBOARD_FRAGMENT_TIMEOUT', 7 * 24 * 3600)
+
+
+def sidebar_version():
+    """侧边栏历史列表的全局版本号，保存在共享缓存中"""
+    version = cache.get(SIDEBAR_VERSION_KEY)
+    if version is None:
+        # 以当前时间初始化：缓存被清空或淘汰后不会与旧版本号重复
+        cache.add(SIDEBAR_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(SIDEBAR_VERSION_KEY)
+    return version
+
+
+def _bump_sidebar_version():
+    try:
+        cache.incr(SIDEBAR_VERSION_KEY)
+    except ValueError:
+        cache.set(SIDEBAR_VERSION_KEY, time.time_ns(), None)
+
+
+def bump_sidebar_version():
+    """上传新增、标记、施工单位、处理状态等侧边栏可见内容变化后调用（在事务提交后生效）"""
+    transaction.on_commit(_bump_sidebar_version)
+
+
+async def abump_sidebar_version():
+    """bump_sidebar_version 的异步版本：异步视图不在事务中，数据写入后直接递增"""
+    try:
+        await cache.aincr(SIDEBAR_VERSION_KEY)
+    except ValueError:
+        await cache.aset(SIDEBAR_VERSION_KEY, time.time_ns(), None)
+
+
+def bump_upload_versions(upload_ids, sidebar=False):
+    """递增上传的 content_version，使其结果面板缓存失效
+
+    与数据修改放在同一事务中调用：版本号随数据一起提交，不会出现数据已变而版本未变的窗口。
+    """
+    upload_ids = [pk for pk in set(upload_ids) if pk is not None]
+    if upload_ids:
+        UploadedFile.objects.filter(id__in=upload_ids).update(content_version=F('content_version') + 1)
+    if sidebar:
+        bump_sidebar_version()
+
+
+async def abump_upload_versions(upload_ids, sidebar=False):
+    """bump_upload_versions 的异步版本，在数据写入之后调用
+
+    先写数据后递增版本：期间渲染的片段只会缓存在旧版本下，随即失效，不会把旧数据缓存到新版本下。
+    """
+    upload_ids = [pk for pk in set(upload_ids) if pk is not None]
+    if upload_ids:
+        await UploadedFile.objects.filter(id__in=upload_ids).aupdate(content_version=F('content_version') + 1)
+    if sidebar:
+        await abump_sidebar_version()
+
+
+def bump_info_upload_versions(info_queryset, sidebar=False):
+    """按提取结果查询集递增其所属上传的版本"""
+    bump_upload_versions(info_queryset.values_list('uploaded_file_id', flat=True).distinct(), sidebar=sidebar)
+
+
+def _key(name, *parts):
+    digest = hashlib.md5('\x1f'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'dashboard:{name}:{digest}'
+
+
+def cached_fragment(name, parts, render):
+    """按 (名称, 版本等键值) 缓存渲染好的 HTML 片段；render 只在未命中时调用"""
+    key = _key(name, *parts)
+    with timed(FRAGMENT_CACHE_SECONDS, name, 'get'):
+        html = cache.get(key)
+    FRAGMENT_CACHE_REQUESTS.labels(name, 'miss' if html is None else 'hit').inc()
+    if html is None:
+        with timed(FRAGMENT_CACHE_SECONDS, name, 'render'):
+            html = str(render())
+        with timed(FRAGMENT_CACHE_SECONDS, name, 'set'):
+            cache.set(key, html, fragment_timeout())
+    return mark_safe(html)
@@ -0,0 +1,315 @@
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import ExtractedInfo, UploadedFile
+from .fragments import bump_upload_versions
+from .reporting import track_summary_changes
+from .rules import current_rules_version
+from .utils import (
+    extract_fields_from_text,
+    get_default_construction_order_code,
+    normalize_text_for_extraction,
+)
+
+# 由提取流程产生、重新提取时可以覆盖的字段；
+# 建设单号、邮件/进度时间、资源地址、备注等用户录入的内容不在其中，始终保留
+EXTRACTED_FIELDS = [
+    'order_code',
+    'document_content',
+    'normalized_text',
+    'extraction_status',
+    'extraction_error',
+    'maintenance_fee',
+    'service_fee',
+    'terminal_fee',
+    'other_fees',
+    'total_fees',
+    'doc_maintenance_total',
+    'overall_total_price',
+    'total_price',
+    'fiber_info',
+    'equipment_items',
+    'verification_passed',
+    'verification_message',
+    'rules_version',
+]
+
+# 匹配阶段（extract_fields_from_text）产生的字段；仅重跑规则时只比较和写回这些字段
+MATCHED_FIELDS = [
+    'maintenance_fee',
+    'service_fee',
+    'terminal_fee',
+    'total_fees',
+    'doc_maintenance_total',
+    'overall_total_price',
+    'total_price',
+    'fiber_info',
+    'verification_passed',
+]
+
+BULK_BATCH_SIZE = 500
+
+# 上传写入方式：append 每次上传都新建提取结果；upsert 按 (单号, 文档名) 更新已有结果
+INGEST_MODES = ('append', 'upsert')
+# 默认 append；upsert 需在 settings.UPLOAD_INGEST_MODE 中显式开启
+DEFAULT_INGEST_MODE = 'append'
+
+# 压缩包无法解析时提取流程填入的占位单号，不代表同一张单，不能用来合并结果
+UNKNOWN_ORDER_CODE = '未知'
+
+_CENT = Decimal('0.01')
+
+
+def _money(value):
+    return Decimal(str(float(value))).quantize(_CENT, rounding=ROUND_HALF_UP)
+
+
+def _optional_money(value):
+    # 与原上传流程一致：0 或缺失视为“未找到”
+    return _money(value) if value else None
+
+
+def result_field_values(result):
+    """把 extract_info_from_zip 的单条结果转换为 ExtractedInfo 字段值"""
+    return {
+        'order_code': result.get('order_code'),
+        'document_content': result.get('document_content'),
+        'normalized_text': result.get('normalized_text'),
+        'extraction_status': result.get('extraction_status', '成功'),
+        'extraction_error': result.get('error'),
+        'maintenance_fee': _money(result.get('maintenance_fee', 0)),
+        'service_fee': _money(result.get('service_fee', 0)),
+        'terminal_fee': _money(result.get('terminal_fee', 0)),
+        'other_fees': _money(result.get('other_fees') or 0),
+        'total_fees': _money(result.get('total_fees', 0)),
+        'doc_maintenance_total': _optional_money(result.get('doc_maintenance_total')),
+        'overall_total_price': _optional_money(result.get('overall_total_price')),
+        'total_price': _optional_money(result.get('total_price')),
+        'fiber_info': result.get('fiber_info'),
+        'equipment_items': result.get('equipment_items'),
+        'verification_passed': result.get('verification_passed', False),
+        'verification_message': result.get('verification_message'),
+        'rules_version': result.get('rules_version') or current_rules_version(),
+    }
+
+
+def _new_info(uploaded_file, result):
+    values = result_field_values(result)
+    return ExtractedInfo(
+        uploaded_file=uploaded_file,
+        construction_order_code=get_default_construction_order_code(values['order_code']),
+        document_name=result.get('file_name', ''),
+        archive_path=result.get('archive_path') or '',
+        **values,
+    )
+
+
+def create_extracted_infos(uploaded_file, results):
+    """为一次上传批量写入提取结果（同时更新汇总表）"""
+    with transaction.atomic(), track_summary_changes(ExtractedInfo.objects.filter(uploaded_file=uploaded_file)):
+        infos = ExtractedInfo.objects.bulk_create(
+            [_new_info(uploaded_file, result) for result in results],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        bump_upload_versions([uploaded_file.id])
+    return infos
+
+
+def changed_fields(info, values):
+    """与现有行比较，返回值确有变化的字段"""
+    return [field for field, value in values.items() if getattr(info, field) != value]
+
+
+def bulk_write_changes(changes):
+    """按“变化字段集合”分组批量写回，每行只更新真正变化的字段
+
+    changes: [(ExtractedInfo, {字段: 新值})]
+    """
+    groups = defaultdict(list)
+    for info, values in changes:
+        if not values:
+            continue
+        for field, value in values.items():
+            setattr(info, field, value)
+        groups[tuple(sorted(values))].append(info)
+
+    for fields, infos in groups.items():
+        ExtractedInfo.objects.bulk_update(infos, list(fields), batch_size=BULK_BATCH_SIZE)
+    return sum(len(infos) for infos in groups.values())
+
+
+def archive_error(results):
+    """整个压缩包无法读取时返回错误信息（extract_info_from_zip 只返回一条带 archive_error 的结果），否则返回 None"""
+    for result in results:
+        if result.get('archive_error'):
+            return result.get('error') or '压缩包无法读取'
+    return None
+
+
+def is_usable_result(result):
+    """提取成功且读到了文本的结果；失败或内容为空（如读取出错、缺少 .doc 读取后端）时不能覆盖已有的提取结果"""
+    return result.get('extraction_status', '成功') != '失败' and bool(result.get('normalized_text') or result.get('document_content'))
+
+
+def update_extracted_infos(uploaded_file, results):
+    """用新的提取结果原地更新一次上传的 ExtractedInfo
+
+    按文档名依次匹配已有行，只写入提取字段中值发生变化的部分；新出现的文档新建行，
+    本次结果中不存在的旧行保持不变。返回统计信息。
+    不同内层压缩包中的同名文档按 (archive_path, 文档名) 区分。
+    命中已有行但提取失败或内容为空的结果不写入（保留原有结果），计入 failed。
+    """
+    stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'stale': 0, 'failed': 0}
+    queryset = ExtractedInfo.objects.filter(uploaded_file=uploaded_file)
+
+    with transaction.atomic(), track_summary_changes(queryset):
+        existing = defaultdict(list)
+        for info in queryset.order_by('id'):
+            existing[(info.archive_path, info.document_name)].append(info)
+
+        changes = []
+        new_infos = []
+        for result in results:
+            candidates = existing.get((result.get('archive_path') or '', result.get('file_name', '')))
+            if candidates:
+                info = candidates.pop(0)
+                if not is_usable_result(result):
+                    stats['failed'] += 1
+                    continue
+                values = result_field_values(result)
+                changes.append((info, {f: values[f] for f in changed_fields(info, values)}))
+            else:
+                new_infos.append(_new_info(uploaded_file, result))
+
+        stats['updated'] = bulk_write_changes(changes)
+        stats['unchanged'] = len(changes) - stats['updated']
+        stats['created'] = len(ExtractedInfo.objects.bulk_create(new_infos, batch_size=BULK_BATCH_SIZE))
+        stats['stale'] = sum(len(infos) for infos in existing.values())
+        if stats['updated'] or stats['created']:
+            # 单号可能变化，影响侧边栏筛选结果
+            bump_upload_versions([uploaded_file.id], sidebar=True)
+
+    return stats
+
+
+def ingest_mode():
+    mode = getattr(settings, 'UPLOAD_INGEST_MODE', DEFAULT_INGEST_MODE)
+    return mode if mode in INGEST_MODES else DEFAULT_INGEST_MODE
+
+
+def upsert_extracted_infos(uploaded_file, results):
+    """按 (单号, 文档名) 把新上传的结果合并到已有的提取结果中
+
+    同一单号重新上传修正后的压缩包时，命中的已有行（有多条时取最新的一条）原地更新提取字段，
+    并归到本次上传下；建设单号、邮件/进度时间、资源地址、备注等用户录入的内容保持不变。
+    只写入值确有变化的字段，按变化字段分组批量写回。未命中的结果新建行。返回统计信息。
+    占位单号“未知”（压缩包无法解析）不参与匹配，总是新建行。
+
+    候选行在写入所在的事务中加锁读取：并行处理的两个压缩包不会认领并移动同一行
+    （SQLite 没有行锁，IMMEDIATE 事务开始时即持有写锁，效果相同）。
+    """
+    stats = {'created': 0, 'updated': 0, 'moved': 0, 'unchanged': 0}
+    keys = {
+        (result.get('order_code'), result.get('file_name', ''))
+        for result in results
+        if result.get('order_code') and result.get('order_code') != UNKNOWN_ORDER_CODE
+    }
+    previous_uploads = set()
+    with transaction.atomic():
+        candidates = defaultdict(list)
+        if keys:
+            existing = (
+                ExtractedInfo.objects
+                .select_for_update()
+                .filter(order_code__in={code for code, _ in keys}, document_name__in={name for _, name in keys})
+                .exclude(uploaded_file=uploaded_file)
+                .order_by('-id')
+            )
+            for info in existing:
+                if (info.order_code, info.document_name) in keys:
+                    candidates[(info.order_code, info.document_name)].append(info)
+
+        matched = [info for infos in candidates.values() for info in infos]
+        queryset = ExtractedInfo.objects.filter(Q(uploaded_file=uploaded_file) | Q(pk__in=[info.pk for info in matched]))
+        with track_summary_changes(queryset):
+            changes = []
+            new_infos = []
+            for result in results:
+                infos = candidates.get((result.get('order_code'), result.get('file_name', '')))
+                if not infos:
+                    new_infos.append(_new_info(uploaded_file, result))
+                    continue
+                info = infos.pop(0)
+                values = {**result_field_values(result), 'archive_path': result.get('archive_path') or ''}
+                changed = {f: values[f] for f in changed_fields(info, values)}
+                if changed:
+                    stats['updated'] += 1
+                if info.uploaded_file_id != uploaded_file.id:
+                    previous_uploads.add(info.uploaded_file_id)
+                    changed['uploaded_file'] = uploaded_file
+                    stats['moved'] += 1
+                changes.append((info, changed))
+
+            bulk_write_changes(changes)
+            stats['unchanged'] = len(changes) - stats['updated']
+            stats['created'] = len(ExtractedInfo.objects.bulk_create(new_infos, batch_size=BULK_BATCH_SIZE))
+            if previous_uploads:
+                # 被移走结果的旧上传：文档数随之减少
+                counts = dict(
+                    UploadedFile.objects.filter(id__in=previous_uploads)
+                    .annotate(remaining=Count('extracted_infos'))
+                    .values_list('id', 'remaining')
+                )
+                for upload_id, remaining in counts.items():
+                    UploadedFile.objects.filter(id=upload_id).update(document_count=remaining)
+            bump_upload_versions([uploaded_file.id, *previous_uploads], sidebar=bool(previous_uploads))
+
+    return stats
+
+
+def ingest_extracted_infos(uploaded_file, results, mode=None):
+    """上传流程写入提取结果：按 UPLOAD_INGEST_MODE 新建或按单号合并"""
+    if (mode or ingest_mode()) == 'upsert':
+        return upsert_extracted_infos(uploaded_file, results)
+    create_extracted_infos(uploaded_file, results)
+    return {'created': len(results), 'updated': 0, 'moved': 0, 'unchanged': 0}
+
+
+def rematch_extracted_infos(queryset):
+    """对已存储文本的提取结果只重跑匹配阶段（不解压、不解析文档）
+
+    只写回值确有变化的行；值未变但规则版本落后的行只更新 rules_version。
+    旧数据没有归一化文本时由 document_content 现场归一化并一并补存。返回统计信息。
+    """
+    stats = {'scanned': 0, 'updated': 0, 'version_only': 0, 'unchanged': 0}
+
+    with transaction.atomic(), track_summary_changes(queryset):
+        changes = []
+        version_only = defaultdict(list)
+        for info in queryset.only('id', 'uploaded_file_id', 'document_content', 'normalized_text', 'rules_version', *MATCHED_FIELDS):
+            stats['scanned'] += 1
+            text = info.normalized_text
+            if text is None:
+                text = normalize_text_for_extraction(info.document_content)
+            values = result_field_values(extract_fields_from_text(text))
+            changed = {f: values[f] for f in changed_fields(info, {f: values[f] for f in MATCHED_FIELDS})}
+            if info.normalized_text is None:
+                changed['normalized_text'] = text
+            if changed:
+                changed['rules_version'] = values['rules_version']
+                changes.append((info, changed))
+            elif info.rules_version != values['rules_version']:
+                version_only[values['rules_version']].append(info.id)
+            else:
+                stats['unchanged'] += 1
+
+        stats['updated'] = bulk_write_changes(changes)
+        bump_upload_versions(info.uploaded_file_id for info, values in changes if values)
+        for version, ids in version_only.items():
+            stats['version_only'] += ExtractedInfo.objects.filter(id__in=ids).update(rules_version=version)
+
+    return stats
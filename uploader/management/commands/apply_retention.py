@@ -0,0 +1,73 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from uploader.retention import COMPRESSIONS, due_for_cold, move_to_cold, retention_policy
+
+
+class Command(BaseCommand):
+    help = '按 RETENTION_POLICY 把超过保留天数的上传压缩包迁移到冷存储（可选重新压缩），分批执行，可随时中断后重新运行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='覆盖策略中的 cold_after_days')
+        parser.add_argument('--batch-size', type=int, default=None, help='每批处理的上传数，默认取策略中的 batch_size')
+        parser.add_argument('--max-batches', type=int, default=None, help='本次最多处理的批数（用于限定单次运行时长）')
+        parser.add_argument('--sleep', type=float, default=0, help='两批之间暂停的秒数，降低对磁盘的持续占用')
+        parser.add_argument('--no-recompress', action='store_true', help='只迁移，不重新压缩')
+        parser.add_argument('--dry-run', action='store_true', help='只统计将要迁移的上传')
+
+    def handle(self, *args, **options):
+        policy = retention_policy()
+        days = options['days'] if options['days'] is not None else policy['cold_after_days']
+        if days is None:
+            raise CommandError('未配置 RETENTION_POLICY["cold_after_days"]，可用 --days 指定')
+        if policy['compression'] not in COMPRESSIONS:
+            raise CommandError(f'不支持的压缩方式: {policy["compression"]}（可选 {", ".join(COMPRESSIONS)}）')
+        if options['no_recompress']:
+            policy['recompress'] = False
+        batch_size = max(1, options['batch_size'] or policy['batch_size'])
+
+        cutoff = timezone.now() - timedelta(days=days)
+        due = due_for_cold(cutoff)
+        if options['dry_run']:
+            self.stdout.write(f'上传早于 {cutoff:%Y-%m-%d} 的热存储压缩包: {due.count()} 个')
+            return
+
+        totals = {'moved': 0, 'recompressed': 0, 'failed': 0, 'before': 0, 'after': 0}
+        started = time.monotonic()
+        last_id = 0
+        batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            # 按 ID 递增分批（keyset），失败的上传不会在本次运行中被反复选中
+            batch = list(due.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            for uploaded_file in batch:
+                last_id = uploaded_file.id
+                try:
+                    moved = move_to_cold(uploaded_file, policy)
+                except Exception as e:
+                    totals['failed'] += 1
+                    self.stderr.write(f'#{uploaded_file.id} {uploaded_file.original_filename}: 失败 {e}')
+                    continue
+                totals['moved'] += 1
+                totals['recompressed'] += moved['recompressed']
+                totals['before'] += moved['before']
+                totals['after'] += moved['after']
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f'#{uploaded_file.id} {uploaded_file.original_filename}: {moved["before"]} -> {moved["after"]} 字节')
+            batches += 1
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        saved = totals['before'] - totals['after']
+        self.stdout.write(self.style.SUCCESS(
+            f'迁移 {totals["moved"]} 个压缩包（重新压缩 {totals["recompressed"]} 个），'
+            f'{totals["before"] / 1048576:.1f}MB -> {totals["after"] / 1048576:.1f}MB，节省 {saved / 1048576:.1f}MB；'
+            f'失败 {totals["failed"]} 个，{batches} 批，用时 {time.monotonic() - started:.1f}s'
+        ))
+        remaining = due.count()
+        if remaining:
+            self.stdout.write(f'仍有 {remaining} 个待迁移（含失败的），重新运行即可继续')
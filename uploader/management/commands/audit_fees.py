@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from uploader.models import ExtractedInfo
+
+
+class Command(BaseCommand):
+    help = (
+        '批量审计全部提取结果：重新验算费用总计与文档维护费合计，并标记费用显著高于'
+        '同施工单位、同街道同类文档（按每米光缆费用比较）的行'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=3.5, help='稳健 z 分数超过该值时标记为异常')
+        parser.add_argument('--min-peers', type=int, default=8, help='同组至少有多少条可比结果才打分')
+        parser.add_argument('--chunk-size', type=int, default=20000, help='每次从数据库读取的行数')
+        parser.add_argument('--top', type=int, default=20, help='列出分数最高的异常条数')
+        parser.add_argument('--dry-run', action='store_true', help='只计算并报告，不写回数据库')
+
+    def handle(self, *args, **options):
+        try:
+            from uploader.audit import audit_fees
+        except ImportError as e:
+            raise CommandError(f'费用审计需要 numpy（pip install numpy）: {e}')
+
+        stats = audit_fees(
+            threshold=options['threshold'],
+            min_peers=max(2, options['min_peers']),
+            chunk_size=max(1, options['chunk_size']),
+            dry_run=options['dry_run'],
+            top=max(0, options['top']),
+        )
+        timings = stats['timings']
+        self.stdout.write(
+            f'{stats["rows"]} 条结果，{stats["groups"]} 个分组，其中 {stats["scored"]} 条有同组可比；'
+            f'读取 {timings["load"]:.2f}s，计算 {timings["compute"]:.2f}s，写回 {timings["write"]:.2f}s'
+        )
+        self.stdout.write(
+            f'验算通过 {stats["verification_passed"]} 条（与已保存结果不同 {stats["verification_changed"]} 条）；'
+            f'费用异常 {stats["anomalies"]} 条'
+        )
+
+        if stats['top']:
+            infos = ExtractedInfo.objects.select_related('uploaded_file').in_bulk([pk for pk, _ in stats['top']])
+            for pk, score in stats['top']:
+                info = infos[pk]
+                upload = info.uploaded_file
+                self.stdout.write(
+                    f'  #{pk} z={score:.1f} {info.order_code or "-"} {info.document_name} '
+                    f'{info.total_fees}元 [{upload.construction_unit or "未知单位"} / {upload.township or "未知街道"}]'
+                )
+
+        if options['dry_run']:
+            self.stdout.write(f'试运行：{stats["changed"]} 条需要更新，未写回')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'更新 {stats["written"]} 条'))
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from uploader.models import ExtractedInfo, UploadedFile
+from uploader.views import _async_http_client, get_township_from_address, get_township_from_address_async
+
+BENCH_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class _AmapStub(BaseHTTPRequestHandler):
+    """模拟高德接口：每个请求等待 server.latency 秒后返回固定结果"""
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        if self.path.startswith('/v3/geocode/geo'):
+            data = {'status': '1', 'geocodes': [{'location': '102.7,25.0'}]}
+        else:
+            data = {'status': '1', 'regeocode': {'addressComponent': {'township': '五华街道'}}}
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def _seed(uploads, documents):
+    upload_rows = UploadedFile.objects.bulk_create([
+        UploadedFile(original_filename=f'EOSC_{n}_KC+集团{n}+地址{n}.zip', file_type='zip', is_processed=True, document_count=documents)
+        for n in range(uploads)
+    ])
+    infos = ExtractedInfo.objects.bulk_create([
+        ExtractedInfo(uploaded_file=upload, order_code=f'EOSC_{upload.id}_KC', document_name=f'{n}.docx', extraction_status='成功')
+        for upload in upload_rows
+        for n in range(documents)
+    ])
+    return [upload.id for upload in upload_rows], [info.id for info in infos]
+
+
+def _click_plan(upload_ids, info_ids, count):
+    """模拟仪表盘上的点击：标记、进度、资源地址、备注轮流出现"""
+    plan = []
+    for n in range(count):
+        info_id = info_ids[n % len(info_ids)]
+        kind = n % 4
+        if kind == 0:
+            plan.append((reverse('toggle_upload_mark', args=[upload_ids[n % len(upload_ids)]]), {}))
+        elif kind == 1:
+            action = 'set' if n // 4 % 2 == 0 else 'unset'
+            plan.append((reverse('update_construction_status', args=[info_id]), {'type': 'field_construction', 'action': action}))
+        elif kind == 2:
+            plan.append((reverse('update_resource_address', args=[info_id]), {'resource_address': f'机房{n}'}))
+        else:
+            plan.append((reverse('add_construction_remark', args=[info_id]), {'content': f'基准测试备注{n}'}))
+    return plan
+
+
+class Command(BaseCommand):
+    help = (
+        'JSON 接口并发基准测试：在临时数据库上对比同步处理（WSGI，固定线程数）与异步处理（ASGI，单个事件循环）的吞吐量，'
+        '同时有若干个慢速街道解析（本地模拟的高德接口）在途'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400, help='每种方式发出的点击请求数')
+        parser.add_argument('--concurrency', type=int, default=50, help='同时在途的点击请求数（模拟的并发用户）')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI 方式的工作线程数（相当于 gunicorn --threads）')
+        parser.add_argument('--geocodes', type=int, default=16, help='开始时同时发起的街道解析数')
+        parser.add_argument('--geocode-latency', type=float, default=0.5, help='模拟高德接口每次请求的延迟（秒）')
+        parser.add_argument('--mode', choices=['wsgi', 'asgi', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='asgi-bench-')
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _AmapStub)
+        server.latency = options['geocode_latency']
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        setup_test_environment()
+        connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(
+                AMAP_API_KEY='benchmark',
+                AMAP_API_BASE=f'http://127.0.0.1:{server.server_address[1]}',
+                CACHES=BENCH_CACHES,
+                PROFILING_ENABLED=False,
+            ):
+                upload_ids, info_ids = _seed(20, 5)
+                plan = _click_plan(upload_ids, info_ids, options['requests'])
+                client_kind = 'httpx' if _async_http_client() is not None else '线程中的 urllib（未安装 httpx）'
+                self.stdout.write(
+                    f'{len(plan)} 个点击请求，并发 {options["concurrency"]}；{options["geocodes"]} 个街道解析，'
+                    f'每次高德请求延迟 {options["geocode_latency"]:g}s；异步解析使用 {client_kind}'
+                )
+                modes = ['wsgi', 'asgi'] if options['mode'] == 'both' else [options['mode']]
+                results = {}
+                for mode in modes:
+                    run = self._run_wsgi if mode == 'wsgi' else self._run_asgi
+                    results[mode] = run(plan, options)
+                    self._report(mode, results[mode], len(plan), options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            server.shutdown()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if len(results) == 2 and results['asgi']['elapsed']:
+            ratio = results['wsgi']['elapsed'] / results['asgi']['elapsed']
+            self.stdout.write(self.style.SUCCESS(f'点击吞吐量：ASGI 为 WSGI 的 {ratio:.1f} 倍'))
+
+    def _report(self, mode, result, count, options):
+        latencies = result['latencies']
+        self.stdout.write(
+            f'{mode.upper():<5} {count / result["elapsed"]:>8.0f} 次/秒（p50 {_percentile(latencies, 0.5) * 1000:.1f}ms，'
+            f'p95 {_percentile(latencies, 0.95) * 1000:.1f}ms，失败 {result["errors"]}）；'
+            f'街道解析全部完成用时 {result["geocode_elapsed"]:.2f}s'
+            + (f'（{options["threads"]} 个线程）' if mode == 'wsgi' else '')
+        )
+
+    def _run_wsgi(self, plan, options):
+        """同步视图链：请求与街道解析在同一组线程中排队，每个慢速解析占用一个线程直到返回"""
+        local = threading.local()
+        latencies, errors = [], []
+
+        def click(path, payload):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client()
+            started = time.perf_counter()
+            response = client.post(path, json.dumps(payload), content_type='application/json')
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+        with ThreadPoolExecutor(options['threads']) as pool:
+            started = time.perf_counter()
+            geocodes = [pool.submit(get_township_from_address, f'地址{n}') for n in range(options['geocodes'])]
+            clicks = [pool.submit(click, path, payload) for path, payload in plan]
+            wait(clicks)
+            elapsed = time.perf_counter() - started
+            wait(geocodes)
+            geocode_elapsed = time.perf_counter() - started
+        for future in clicks:
+            future.result()
+        return {'elapsed': elapsed, 'geocode_elapsed': geocode_elapsed, 'latencies': latencies, 'errors': len(errors)}
+
+    def _run_asgi(self, plan, options):
+        """异步视图链：请求与街道解析都在同一个事件循环中，等待高德响应时不占用线程"""
+        latencies, errors = [], []
+
+        async def run():
+            client = AsyncClient()
+            semaphore = asyncio.Semaphore(options['concurrency'])
+
+            async def click(path, payload):
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.post(path, json.dumps(payload), content_type='application/json')
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+
+            started = time.perf_counter()
+            geocodes = [asyncio.create_task(get_township_from_address_async(f'地址{n}')) for n in range(options['geocodes'])]
+            await asyncio.gather(*(click(path, payload) for path, payload in plan))
+            elapsed = time.perf_counter() - started
+            await asyncio.gather(*geocodes)
+            return elapsed, time.perf_counter() - started
+
+        elapsed, geocode_elapsed = asyncio.run(run())
+        return {'elapsed': elapsed, 'geocode_elapsed': geocode_elapsed, 'latencies': latencies, 'errors': len(errors)}
@@ -0,0 +1,144 @@
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from uploader.dbtuning import apply_sqlite_pragmas, sqlite_pragmas
+
+SEED_ROWS = 2000
+
+
+def _profiles():
+    return {
+        # Django 默认：回滚日志、延迟事务、5 秒超时
+        'baseline': {
+            'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+            'begin': 'BEGIN',
+            'timeout': 5.0,
+        },
+        # 当前配置：dbtuning 的 PRAGMA + IMMEDIATE 写事务
+        'tuned': {
+            'pragmas': sqlite_pragmas(),
+            'begin': 'BEGIN IMMEDIATE',
+            'timeout': sqlite_pragmas().get('busy_timeout', 20000) / 1000,
+        },
+    }
+
+
+def _prepare(path, profile):
+    conn = sqlite3.connect(path, isolation_level=None)
+    apply_sqlite_pragmas(conn.cursor(), profile['pragmas'])
+    conn.executescript('''
+        CREATE TABLE bench (id INTEGER PRIMARY KEY, value INTEGER NOT NULL, touched_at REAL);
+        CREATE TABLE bench_log (id INTEGER PRIMARY KEY, bench_id INTEGER NOT NULL, created_at REAL NOT NULL);
+        CREATE INDEX bench_log_bench_id ON bench_log (bench_id);
+    ''')
+    conn.execute('BEGIN')
+    conn.executemany('INSERT INTO bench (id, value) VALUES (?, 0)', [(i,) for i in range(1, SEED_ROWS + 1)])
+    conn.execute('COMMIT')
+    conn.close()
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def _worker(role, path, profile, seconds, results):
+    """写进程模拟状态点击（读后写 + 日志），读进程模拟仪表盘查询"""
+    conn = sqlite3.connect(path, timeout=profile['timeout'], isolation_level=None)
+    cursor = conn.cursor()
+    apply_sqlite_pragmas(cursor, profile['pragmas'])
+    rng = random.Random(os.getpid())
+    ops = errors = 0
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            if role == 'writer':
+                row_id = rng.randint(1, SEED_ROWS)
+                cursor.execute(profile['begin'])
+                cursor.execute('SELECT value FROM bench WHERE id = ?', (row_id,))
+                cursor.fetchone()
+                cursor.execute('UPDATE bench SET value = value + 1, touched_at = ? WHERE id = ?', (time.time(), row_id))
+                cursor.execute('INSERT INTO bench_log (bench_id, created_at) VALUES (?, ?)', (row_id, time.time()))
+                cursor.execute('COMMIT')
+            else:
+                cursor.execute('SELECT count(*), sum(value) FROM bench WHERE touched_at IS NOT NULL')
+                cursor.fetchall()
+                cursor.execute('SELECT bench_id, count(*) FROM bench_log GROUP BY bench_id ORDER BY 2 DESC LIMIT 20')
+                cursor.fetchall()
+            ops += 1
+            latencies.append(time.perf_counter() - started)
+        except sqlite3.OperationalError:
+            errors += 1
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+    conn.close()
+    results.put((role, ops, errors, _percentile(latencies, 0.95)))
+
+
+class Command(BaseCommand):
+    help = '并发读写基准测试：对比 Django 默认 SQLite 配置与 dbtuning 配置的吞吐量和锁错误'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4, help='写进程数')
+        parser.add_argument('--readers', type=int, default=4, help='读进程数')
+        parser.add_argument('--seconds', type=float, default=5.0, help='每种配置运行的秒数')
+        parser.add_argument('--profile', choices=['baseline', 'tuned', 'both'], default='both')
+        parser.add_argument('--dir', default=None, help='临时数据库所在目录（应与生产数据库位于同类磁盘）')
+
+    def _run(self, name, profile, workdir, options):
+        path = os.path.join(workdir, f'{name}.sqlite3')
+        _prepare(path, profile)
+
+        ctx = multiprocessing.get_context()
+        results = ctx.Queue()
+        roles = ['writer'] * options['writers'] + ['reader'] * options['readers']
+        processes = [ctx.Process(target=_worker, args=(role, path, profile, options['seconds'], results)) for role in roles]
+        for process in processes:
+            process.start()
+        rows = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        summary = {}
+        for role in ('writer', 'reader'):
+            role_rows = [row for row in rows if row[0] == role]
+            summary[role] = {
+                'ops': sum(row[1] for row in role_rows),
+                'errors': sum(row[2] for row in role_rows),
+                'p95': max((row[3] for row in role_rows), default=0.0),
+            }
+        seconds = options['seconds']
+        self.stdout.write(
+            f'{name:<9} 写 {summary["writer"]["ops"] / seconds:>8.0f} 次/秒（锁错误 {summary["writer"]["errors"]}，p95 {summary["writer"]["p95"] * 1000:.1f}ms）  '
+            f'读 {summary["reader"]["ops"] / seconds:>8.0f} 次/秒（锁错误 {summary["reader"]["errors"]}，p95 {summary["reader"]["p95"] * 1000:.1f}ms）'
+        )
+        return summary
+
+    def handle(self, *args, **options):
+        profiles = _profiles()
+        names = ['baseline', 'tuned'] if options['profile'] == 'both' else [options['profile']]
+        self.stdout.write(
+            f'{options["writers"]} 个写进程 + {options["readers"]} 个读进程，每种配置 {options["seconds"]:g} 秒；'
+            f'tuned PRAGMA: {profiles["tuned"]["pragmas"]}'
+        )
+
+        workdir = tempfile.mkdtemp(prefix='sqlite-bench-', dir=options['dir'])
+        try:
+            results = {name: self._run(name, profiles[name], workdir, options) for name in names}
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if len(results) == 2 and results['baseline']['writer']['ops']:
+            ratio = results['tuned']['writer']['ops'] / results['baseline']['writer']['ops']
+            self.stdout.write(self.style.SUCCESS(f'写吞吐量提升 {ratio:.1f} 倍'))
@@ -0,0 +1,69 @@
+import os
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from uploader.models import UploadedFile
+from uploader.retention import COLD, cold_storage, release_archive
+from uploader.storage import BLOB_DIR, blob_lock, blob_name, file_sha256, pin_blob, unpin_blob
+
+
+class Command(BaseCommand):
+    help = '把启用内容寻址存储之前按日期路径保存的压缩包改为按内容哈希存放，相同内容合并为一份'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='每批处理的上传数')
+        parser.add_argument('--dry-run', action='store_true', help='只统计，不移动文件、不修改记录')
+
+    def handle(self, *args, **options):
+        legacy = (
+            UploadedFile.objects
+            .exclude(file='').exclude(file__isnull=True)
+            .exclude(file__startswith=f'{BLOB_DIR}/')
+            .order_by('id')
+        )
+        if options['dry_run']:
+            self.stdout.write(f'待转换的上传: {legacy.count()} 个')
+            return
+
+        totals = {'converted': 0, 'merged': 0, 'missing': 0, 'freed': 0}
+        last_id = 0
+        batch_size = max(1, options['batch_size'])
+        while True:
+            batch = list(legacy.filter(id__gt=last_id).only('id', 'file', 'storage_tier')[:batch_size])
+            if not batch:
+                break
+            for uploaded_file in batch:
+                last_id = uploaded_file.id
+                storage = cold_storage() if uploaded_file.storage_tier == COLD else default_storage
+                old_name = uploaded_file.file.name
+                source = storage.path(old_name)
+                if not os.path.exists(source):
+                    totals['missing'] += 1
+                    self.stderr.write(f'#{uploaded_file.id}: 文件不存在 {old_name}')
+                    continue
+                size = os.path.getsize(source)
+                new_name = blob_name(file_sha256(source), os.path.splitext(old_name)[1].lower() or '.zip')
+                target = storage.path(new_name)
+                # 合并到已有文件与登记待引用标记在同一把锁内，记录改名前该文件不会因其他引用删除而被删掉
+                with blob_lock(storage):
+                    if os.path.exists(target):
+                        totals['merged'] += 1
+                        totals['freed'] += size
+                    else:
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        file_move_safe(source, target, allow_overwrite=False)
+                    pin = pin_blob(storage, new_name)
+                try:
+                    UploadedFile.objects.filter(pk=uploaded_file.pk, file=old_name).update(file=new_name)
+                finally:
+                    unpin_blob(storage, pin)
+                # 旧路径不再被引用时删除（已改名移走的不存在，delete 不报错）
+                release_archive(old_name, uploaded_file.storage_tier)
+                totals['converted'] += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'转换 {totals["converted"]} 个上传，其中 {totals["merged"]} 个与已有内容合并，'
+            f'释放 {totals["freed"] / 1048576:.1f}MB；缺失文件 {totals["missing"]} 个'
+        ))
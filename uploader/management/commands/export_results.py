@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from uploader.exports import export_queryset, iter_export_rows, stream_csv, stream_xlsx
+from uploader.filters import parse_upload_filters, filter_uploaded_files
+
+
+class Command(BaseCommand):
+    help = '按仪表盘筛选条件流式导出提取结果（CSV / XLSX）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv', help='导出格式，默认 csv')
+        parser.add_argument('--output', '-o', help='输出文件路径；CSV 可省略以输出到标准输出')
+        parser.add_argument('--q', default='', help='关键字（文件名/集团/地址/街道/施工单位/单号）')
+        parser.add_argument('--order-code', default='', help='单号')
+        parser.add_argument('--group-name', default='', help='集团名称')
+        parser.add_argument('--construction-unit', default='', help='施工单位（仅含已发送建设邮件的上传）')
+        parser.add_argument('--start-date', default='', help='上传开始日期 YYYY-MM-DD（北京时间，含当天）')
+        parser.add_argument('--end-date', default='', help='上传结束日期 YYYY-MM-DD（北京时间，含当天）')
+
+    def handle(self, *args, **options):
+        if options['format'] == 'xlsx' and not options['output']:
+            raise CommandError('XLSX 导出必须指定 --output')
+
+        filters = parse_upload_filters(options)
+        rows = iter_export_rows(export_queryset(filter_uploaded_files(filters)))
+
+        if options['format'] == 'xlsx':
+            with open(options['output'], 'wb') as fh:
+                for chunk in stream_xlsx(rows):
+                    fh.write(chunk)
+        elif options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as fh:
+                for chunk in stream_csv(rows):
+                    fh.write(chunk)
+        else:
+            for chunk in stream_csv(rows):
+                sys.stdout.write(chunk)
+            sys.stdout.flush()
+            return
+
+        self.stderr.write(f'已导出到 {options["output"]}')
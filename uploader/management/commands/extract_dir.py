@@ -0,0 +1,136 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from uploader.utils import extract_info_from_zip
+
+
+def _init_worker():
+    # spawn 启动的子进程需要重新加载 Django 配置（只用到提取规则等设置，不连接数据库）；提取流程会大量 print，静默
+    django.setup()
+    sys.stdout = open(os.devnull, 'w')
+
+
+def _extract(zip_path, max_depth):
+    return extract_info_from_zip(zip_path, os.path.basename(zip_path), max_depth=max_depth)
+
+
+def find_archives(root):
+    """root 为 ZIP 文件时只处理它本身，为目录时递归查找其中的 .zip，按路径排序"""
+    if os.path.isfile(root):
+        return [root]
+    archives = []
+    for path, dirs, names in os.walk(root):
+        dirs.sort()
+        archives.extend(os.path.join(path, name) for name in sorted(names) if name.lower().endswith('.zip'))
+    return archives
+
+
+class Command(BaseCommand):
+    help = '离线批量提取目录中的 ZIP：每个文档输出一行 JSON（JSONL），结束时输出吞吐统计；不读写数据库、不调用高德接口'
+
+    # 不做系统检查，也不访问数据库，在没有数据库的机器上也能运行
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='ZIP 文件或包含 ZIP 的目录（递归查找）')
+        parser.add_argument('-o', '--output', default='-', help='JSONL 输出文件，默认 - 表示标准输出')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行进程数；0 表示在当前进程内逐个提取')
+        parser.add_argument('--max-depth', type=int, default=None, help='内层 ZIP 最多展开的层数，默认 UPLOAD_ARCHIVE_MAX_DEPTH')
+        parser.add_argument('--no-content', action='store_true', help='不输出 document_content（全文），减小输出体积')
+
+    def handle(self, *args, **options):
+        root = options['path']
+        if not os.path.exists(root):
+            raise CommandError(f'路径不存在: {root}')
+        archives = find_archives(root)
+        base = root if os.path.isdir(root) else os.path.dirname(root)
+
+        if options['output'] == '-':
+            # JSONL 占用标准输出，统计信息写到标准错误
+            output = contextlib.nullcontext(self.stdout)
+            summary = self.stderr
+        else:
+            output = open(options['output'], 'w', encoding='utf-8')
+            summary = self.stdout
+
+        totals = {'archives': 0, 'failed_archives': 0, 'documents': 0, 'failed_documents': 0, 'bytes': 0}
+        started = time.monotonic()
+
+        def write(out, zip_path, results, error):
+            relative = os.path.relpath(zip_path, base).replace(os.sep, '/')
+            totals['archives'] += 1
+            totals['bytes'] += os.path.getsize(zip_path)
+            if error:
+                totals['failed_archives'] += 1
+                results = [{'extraction_status': '失败', 'error': error}]
+            for result in results:
+                if options['no_content']:
+                    result.pop('document_content', None)
+                if not error:
+                    totals['documents'] += 1
+                    totals['failed_documents'] += result.get('extraction_status') == '失败'
+                out.write(json.dumps({'zip': relative, **result}, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n')
+            out.flush()
+
+        with output as out:
+            for zip_path, results, error in self._extract_all(archives, options):
+                write(out, zip_path, results, error)
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        summary.write(
+            f'处理 {totals["archives"]} 个压缩包（失败 {totals["failed_archives"]} 个），'
+            f'{totals["documents"]} 个文档（提取失败 {totals["failed_documents"]} 个），'
+            f'{totals["bytes"] / 1048576:.1f}MB，用时 {elapsed:.1f}s；'
+            f'{totals["archives"] / elapsed:.1f} 个压缩包/s，{totals["documents"] / elapsed:.1f} 个文档/s，'
+            f'{totals["bytes"] / 1048576 / elapsed:.1f}MB/s'
+        )
+
+    def _extract_all(self, archives, options):
+        """逐个产出 (压缩包路径, 提取结果, 错误)；并行时按完成先后"""
+        workers = options['workers']
+        if workers <= 0:
+            with open(os.devnull, 'w') as devnull:
+                for zip_path in archives:
+                    try:
+                        # 提取流程的 print 不能混入标准输出上的 JSONL
+                        with contextlib.redirect_stdout(devnull):
+                            results = _extract(zip_path, options['max_depth'])
+                    except Exception as e:
+                        yield zip_path, [], str(e)
+                        continue
+                    yield zip_path, results, None
+            return
+
+        pending = iter(archives)
+        in_flight = {}
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker) as executor:
+            def submit_next():
+                for zip_path in pending:
+                    in_flight[executor.submit(_extract, zip_path, options['max_depth'])] = zip_path
+                    return True
+                return False
+
+            # 只保持有限个任务在途，结果按完成先后输出
+            for _ in range(workers * 2):
+                if not submit_next():
+                    break
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    zip_path = in_flight.pop(future)
+                    submit_next()
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        yield zip_path, [], str(e)
+                        continue
+                    yield zip_path, results, None
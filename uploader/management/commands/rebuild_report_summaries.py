@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from uploader.reporting import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = '根据全部提取结果重建费用与建设进度汇总表'
+
+    def handle(self, *args, **options):
+        count = rebuild_summaries()
+        self.stdout.write(self.style.SUCCESS(f'汇总表已重建，共 {count} 个分组'))
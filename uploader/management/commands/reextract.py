@@ -0,0 +1,209 @@
+import contextlib
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from uploader.filters import filter_uploaded_files
+from uploader.fragments import bump_sidebar_version
+from uploader.ingest import archive_error, update_extracted_infos
+from uploader.models import ExtractedInfo, UploadedFile
+from uploader.retention import stored_file_path
+from uploader.rules import current_rules_version
+from uploader.utils import extract_info_from_zip
+
+
+def _extract(zip_path, original_name, quiet):
+    # 提取流程会大量 print，工作进程默认静默
+    if not quiet:
+        return extract_info_from_zip(zip_path, original_name)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return extract_info_from_zip(zip_path, original_name)
+
+
+class Checkpoint:
+    """记录已完成的上传ID；筛选条件不变时，中断后重新运行会跳过这些上传"""
+
+    def __init__(self, path, signature, rules_version):
+        self.path = path
+        self.signature = signature
+        self.rules_version = rules_version
+        self.done = set()
+        self.failed = {}
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return False
+        if data.get('signature') != self.signature:
+            return False
+        self.done = set(data.get('done') or [])
+        self.failed = {int(k): v for k, v in (data.get('failed') or {}).items()}
+        return True
+
+    def save(self):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump({
+                'signature': self.signature,
+                'rules_version': self.rules_version,
+                'done': sorted(self.done),
+                'failed': self.failed,
+            }, fh, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class Command(BaseCommand):
+    help = '使用当前提取规则重新提取已存储的上传压缩包，原地更新提取结果（保留备注、进度、资源地址、建设单号等人工数据）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', default='', help='上传开始日期 YYYY-MM-DD（北京时间，含当天）')
+        parser.add_argument('--end-date', default='', help='上传结束日期 YYYY-MM-DD（北京时间，含当天）')
+        parser.add_argument('--failed-only', action='store_true', help='仅处理处理失败或含提取失败文档的上传')
+        parser.add_argument('--rules-version', default=None, help='仅处理含指定规则版本结果的上传（空字符串表示版本未知的旧数据）')
+        parser.add_argument('--outdated', action='store_true', help='仅处理含非当前规则版本结果的上传')
+        parser.add_argument('--ids', nargs='*', type=int, help='仅处理指定的上传ID')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行进程数')
+        parser.add_argument('--checkpoint', default=None, help='断点文件路径，默认 MEDIA_ROOT/reextract.checkpoint.json')
+        parser.add_argument('--restart', action='store_true', help='忽略已有断点，从头开始')
+        parser.add_argument('--dry-run', action='store_true', help='只列出将要处理的上传')
+
+    def _select_uploads(self, options, rules_version):
+        qs = filter_uploaded_files({
+            'start_date': options['start_date'],
+            'end_date': options['end_date'],
+        }).exclude(file='').exclude(file__isnull=True)
+
+        if options['ids']:
+            qs = qs.filter(id__in=options['ids'])
+        if options['failed_only']:
+            qs = qs.filter(
+                Q(processing_error__isnull=False) & ~Q(processing_error='')
+                | Q(extracted_infos__extraction_status='失败')
+            )
+        if options['rules_version'] is not None:
+            qs = qs.filter(extracted_infos__rules_version=options['rules_version'])
+        if options['outdated']:
+            qs = qs.filter(id__in=ExtractedInfo.objects.exclude(rules_version=rules_version).values('uploaded_file_id'))
+        return qs.distinct().order_by('id')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        rules_version = current_rules_version()
+        signature_source = {k: options[k] for k in ('start_date', 'end_date', 'failed_only', 'rules_version', 'outdated', 'ids')}
+        signature_source['target_rules_version'] = rules_version
+        signature = hashlib.sha1(json.dumps(signature_source, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+        checkpoint_path = options['checkpoint'] or os.path.join(settings.MEDIA_ROOT, 'reextract.checkpoint.json')
+        checkpoint = Checkpoint(checkpoint_path, signature, rules_version)
+        if not options['restart'] and checkpoint.load():
+            self.stdout.write(f'从断点继续：已完成 {len(checkpoint.done)} 个上传')
+
+        uploads = [
+            (upload_id, original_filename)
+            for upload_id, original_filename in self._select_uploads(options, rules_version).values_list('id', 'original_filename')
+            if upload_id not in checkpoint.done
+        ]
+        self.stdout.write(f'待处理上传: {len(uploads)}（规则版本 {rules_version}，{workers} 个进程）')
+        if options['dry_run'] or not uploads:
+            for upload_id, name in uploads:
+                self.stdout.write(f'  #{upload_id} {name}')
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(checkpoint_path)), exist_ok=True)
+        totals = {'created': 0, 'updated': 0, 'unchanged': 0, 'stale': 0, 'failed': 0}
+        started = time.monotonic()
+        processed = 0
+
+        pending = iter(uploads)
+        in_flight = {}
+        quiet = options['verbosity'] < 2
+        # 与上传处理相同：spawn 启动的子进程不继承父进程已打开的数据库连接，先重新加载 Django 配置；
+        # 初始化函数不能定义在本模块中，否则子进程在 django.setup() 之前就会因导入模型而失败
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        ) as executor:
+            def submit_next():
+                for upload_id, original_filename in pending:
+                    uploaded_file = UploadedFile.objects.filter(id=upload_id).first()
+                    path = stored_file_path(uploaded_file) if uploaded_file else None
+                    if not path or not os.path.exists(path):
+                        checkpoint.failed[upload_id] = '文件不存在'
+                        self.stderr.write(f'#{upload_id} {original_filename}: 文件不存在，跳过')
+                        continue
+                    future = executor.submit(_extract, path, original_filename, quiet)
+                    in_flight[future] = uploaded_file
+                    return True
+                return False
+
+            # 只保持有限个任务在途，避免一次性提交全部上传
+            for _ in range(workers * 2):
+                if not submit_next():
+                    break
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    uploaded_file = in_flight.pop(future)
+                    try:
+                        results = future.result()
+                        error = archive_error(results)
+                        if error:
+                            # 压缩包本身无法读取：只记录处理错误，已有的提取结果保持不变
+                            uploaded_file.processing_error = error
+                            uploaded_file.save(update_fields=['processing_error'])
+                            checkpoint.failed[uploaded_file.id] = error
+                            self.stderr.write(f'#{uploaded_file.id} {uploaded_file.original_filename}: 压缩包无法读取 {error}')
+                        else:
+                            stats = update_extracted_infos(uploaded_file, results)
+                            uploaded_file.document_count = uploaded_file.extracted_infos.count()
+                            uploaded_file.is_processed = True
+                            uploaded_file.processed_at = timezone.now()
+                            uploaded_file.processing_error = None
+                            uploaded_file.save(update_fields=['document_count', 'is_processed', 'processed_at', 'processing_error'])
+                            for key, value in stats.items():
+                                totals[key] += value
+                            self.stdout.write(
+                                f'#{uploaded_file.id} {uploaded_file.original_filename}: '
+                                f'更新 {stats["updated"]}，新增 {stats["created"]}，未变 {stats["unchanged"]}，'
+                                f'未匹配旧行 {stats["stale"]}，提取失败保留原结果 {stats["failed"]}'
+                            )
+                            if stats['failed']:
+                                # 可能是暂时性的读取错误，不计入已完成，重新运行时再次尝试
+                                checkpoint.failed[uploaded_file.id] = f'{stats["failed"]} 个文档提取失败，已保留原结果'
+                            else:
+                                checkpoint.failed.pop(uploaded_file.id, None)
+                                checkpoint.done.add(uploaded_file.id)
+                    except Exception as e:
+                        # 失败的上传不计入已完成，重新运行时会再次尝试
+                        checkpoint.failed[uploaded_file.id] = str(e)
+                        self.stderr.write(f'#{uploaded_file.id} {uploaded_file.original_filename}: 失败 {e}')
+
+                    checkpoint.save()
+                    processed += 1
+                    submit_next()
+
+        # 处理状态显示在仪表盘侧边栏
+        bump_sidebar_version()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'完成 {processed} 个上传，用时 {elapsed:.1f}s；'
+            f'更新 {totals["updated"]} 行，新增 {totals["created"]} 行，未变 {totals["unchanged"]} 行，'
+            f'提取失败保留原结果 {totals["failed"]} 行，失败 {len(checkpoint.failed)} 个上传'
+        ))
+        if not checkpoint.failed:
+            os.remove(checkpoint_path)
+        else:
+            raise CommandError(f'{len(checkpoint.failed)} 个上传处理失败，详见断点文件 {checkpoint_path}；修复后重新运行即可只重试这些上传')
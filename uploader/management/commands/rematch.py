@@ -0,0 +1,64 @@
+import contextlib
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from uploader.filters import filter_uploaded_files
+from uploader.ingest import rematch_extracted_infos
+from uploader.models import ExtractedInfo
+from uploader.rules import current_rules_version
+
+
+class Command(BaseCommand):
+    help = '对已存储的归一化文本只重跑费用/光缆匹配规则（不解压、不解析Word），只写回值发生变化的行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', default='', help='上传开始日期 YYYY-MM-DD（北京时间，含当天）')
+        parser.add_argument('--end-date', default='', help='上传结束日期 YYYY-MM-DD（北京时间，含当天）')
+        parser.add_argument('--ids', nargs='*', type=int, help='仅处理指定上传ID下的提取结果')
+        parser.add_argument('--outdated', action='store_true', help='仅处理规则版本不是当前版本的提取结果')
+        parser.add_argument('--batch-size', type=int, default=500, help='每个事务处理的行数')
+
+    def handle(self, *args, **options):
+        rules_version = current_rules_version()
+        uploads = filter_uploaded_files({
+            'start_date': options['start_date'],
+            'end_date': options['end_date'],
+        })
+        if options['ids']:
+            uploads = uploads.filter(id__in=options['ids'])
+
+        # 提取失败的行没有可用文本，交给 reextract 处理
+        qs = ExtractedInfo.objects.filter(
+            uploaded_file__in=uploads.values('id'),
+            extraction_status='成功',
+        ).exclude(normalized_text__isnull=True, document_content__isnull=True)
+        if options['outdated']:
+            qs = qs.exclude(rules_version=rules_version)
+
+        ids = list(qs.order_by('id').values_list('id', flat=True))
+        self.stdout.write(f'待匹配提取结果: {len(ids)}（规则版本 {rules_version}）')
+
+        batch_size = max(1, options['batch_size'])
+        totals = {'scanned': 0, 'updated': 0, 'version_only': 0, 'unchanged': 0}
+        started = time.monotonic()
+        with open(os.devnull, 'w') as devnull:
+            for offset in range(0, len(ids), batch_size):
+                batch = ExtractedInfo.objects.filter(id__in=ids[offset:offset + batch_size]).order_by('id')
+                # 匹配函数会大量 print，默认静默
+                quiet = contextlib.redirect_stdout(devnull) if options['verbosity'] < 2 else contextlib.nullcontext()
+                with quiet:
+                    stats = rematch_extracted_infos(batch)
+                for key, value in stats.items():
+                    totals[key] += value
+                if options['verbosity'] >= 1:
+                    self.stdout.write(f'  {totals["scanned"]}/{len(ids)}，已更新 {totals["updated"]}')
+
+        elapsed = time.monotonic() - started
+        rate = totals['scanned'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'完成：扫描 {totals["scanned"]} 行，值变化并写回 {totals["updated"]} 行，'
+            f'仅更新规则版本 {totals["version_only"]} 行，未变 {totals["unchanged"]} 行；'
+            f'用时 {elapsed:.1f}s（{rate:.0f} 行/秒）'
+        ))
@@ -0,0 +1,191 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# 多进程部署（gunicorn/uwsgi 多个 worker、上传提取进程池）时设置环境变量 PROMETHEUS_MULTIPROC_DIR，
+# 各进程把指标写入该目录下的 mmap 文件，/metrics 读取时汇总；该目录须在服务启动前创建并清空
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+_STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+_QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+ARCHIVES_PROCESSED = Counter(
+    'wordextractor_archives_processed_total',
+    '已处理的上传压缩包数',
+    ['result'],  # saved / failed / rejected
+)
+DOCUMENTS_PROCESSED = Counter(
+    'wordextractor_documents_processed_total',
+    '已提取的文档数，按提取状态区分',
+    ['extraction_status'],
+)
+EXTRACTION_STAGE_SECONDS = Histogram(
+    'wordextractor_extraction_stage_seconds',
+    '提取流程各阶段耗时：unzip 每个压缩包，read / match 每个文档，save 每个压缩包写库',
+    ['stage'],
+    buckets=_STAGE_BUCKETS,
+)
+CHUNKS_RECEIVED = Counter(
+    'wordextractor_upload_chunks_total',
+    '分块上传收到的分块数',
+    ['result'],  # ok / size_mismatch / checksum_mismatch
+)
+GEOCODE_REQUESTS = Counter(
+    'wordextractor_geocode_requests_total',
+    '高德接口调用次数',
+    ['endpoint', 'result'],  # result: ok / error
+)
+GEOCODE_SECONDS = Histogram(
+    'wordextractor_geocode_seconds',
+    '高德接口调用耗时',
+    ['endpoint'],
+    buckets=_STAGE_BUCKETS,
+)
+FRAGMENT_CACHE_REQUESTS = Counter(
+    'wordextractor_fragment_cache_requests_total',
+    '仪表盘片段缓存读取次数',
+    ['fragment', 'result'],  # result: hit / miss
+)
+FRAGMENT_CACHE_SECONDS = Histogram(
+    'wordextractor_fragment_cache_seconds',
+    '仪表盘片段缓存读写耗时',
+    ['fragment', 'operation'],  # operation: get / set / render
+    buckets=_STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    'wordextractor_request_seconds',
+    '视图处理耗时（流式响应只计到响应对象返回）',
+    ['view'],
+    buckets=_STAGE_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    'wordextractor_request_queries',
+    '每个请求执行的 SQL 次数',
+    ['view'],
+    buckets=_QUERY_BUCKETS,
+)
+
+
+@contextmanager
+def timed(histogram, *labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(*labels).observe(time.perf_counter() - started)
+
+
+_collecting = threading.local()
+
+
+@contextmanager
+def observe_stage(stage):
+    """记录提取阶段耗时：with observe_stage('unzip'): ...
+
+    在 collect_stage_timings() 中时只把耗时追加到收集列表，由调用方带回请求进程再写入直方图。
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timings = getattr(_collecting, 'timings', None)
+        if timings is None:
+            EXTRACTION_STAGE_SECONDS.labels(stage).observe(elapsed)
+        else:
+            timings.append((stage, elapsed))
+
+
+@contextmanager
+def collect_stage_timings():
+    """收集代码块中各阶段的耗时 [(阶段, 秒)]，不写入本进程的直方图"""
+    previous = getattr(_collecting, 'timings', None)
+    _collecting.timings = timings = []
+    try:
+        yield timings
+    finally:
+        _collecting.timings = previous
+
+
+def record_stage_timings(timings):
+    for stage, seconds in timings:
+        EXTRACTION_STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def call_collecting_stages(func, *args, **kwargs):
+    """调用 func 并返回 (结果, 阶段耗时)
+
+    提取在 spawn 进程池中执行，子进程里记录的指标不会出现在请求进程的 /metrics 中
+    （除非启用 PROMETHEUS_MULTIPROC_DIR），因此耗时随结果一起返回，由请求进程调用 record_stage_timings 写入。
+    """
+    with collect_stage_timings() as timings:
+        result = func(*args, **kwargs)
+    return result, timings
+
+
+def record_documents(results):
+    for result in results:
+        DOCUMENTS_PROCESSED.labels(result.get('extraction_status') or '未知').inc()
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return (match.url_name if match else None) or 'unmatched'
+
+
+class RequestMetricsMiddleware:
+    """按 URL 名称记录视图耗时和 SQL 次数（不依赖 DEBUG 下的 connection.queries）
+
+    同时支持同步和异步请求链：ASGI 下不会迫使异步视图切换到线程中执行。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = _QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        view = _view_label(request)
+        REQUEST_SECONDS.labels(view).observe(time.perf_counter() - started)
+        REQUEST_QUERIES.labels(view).observe(queries.count)
+        return response
+
+    async def __acall__(self, request):
+        # 异步 ORM 的查询在 sync_to_async 的线程中执行，execute_wrapper 捕获不到，异步请求只记录耗时
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        REQUEST_SECONDS.labels(_view_label(request)).observe(time.perf_counter() - started)
+        return response
+
+
+def render_metrics():
+    """返回 (文本, Content-Type)；多进程模式下汇总目录中所有进程的指标"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0011_extractedinfo_resource_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='上传月份（北京时间，取当月1日）')),
+                ('construction_unit', models.CharField(blank=True, default='', help_text='施工单位（空表示未映射）', max_length=255)),
+                ('township', models.CharField(blank=True, default='', help_text='街道（空表示未解析）', max_length=255)),
+                ('document_count', models.IntegerField(default=0, help_text='文档数量')),
+                ('total_fees', models.DecimalField(decimal_places=2, default=0, help_text='费用总计合计', max_digits=16)),
+                ('overall_total_price', models.DecimalField(decimal_places=2, default=0, help_text='总体花费合计', max_digits=16)),
+                ('fiber_length', models.FloatField(default=0, help_text='光缆长度合计（米）')),
+                ('email_sent_count', models.IntegerField(default=0, help_text='已发送建设邮件数')),
+                ('field_construction_count', models.IntegerField(default=0, help_text='已现场施工数')),
+                ('resource_entry_count', models.IntegerField(default=0, help_text='已资源录入数')),
+                ('completed_count', models.IntegerField(default=0, help_text='已建设完成数')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-month', 'construction_unit', 'township'],
+                'constraints': [models.UniqueConstraint(fields=('month', 'construction_unit', 'township'), name='uniq_report_summary_bucket')],
+            },
+        ),
+    ]
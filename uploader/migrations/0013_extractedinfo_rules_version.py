@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0012_reportsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractedinfo',
+            name='rules_version',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='生成本条结果的提取规则版本', max_length=50),
+        ),
+    ]
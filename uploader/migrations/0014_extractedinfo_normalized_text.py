@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0013_extractedinfo_rules_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractedinfo',
+            name='normalized_text',
+            field=models.TextField(blank=True, help_text='去除空白后的文本，规则变更时可直接重新匹配', null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0014_extractedinfo_normalized_text'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='extractedinfo',
+            name='uploader_ex_uploade_75b9c8_idx',
+        ),
+        migrations.AddIndex(
+            model_name='extractedinfo',
+            index=models.Index(fields=['uploaded_file', 'extracted_at'], name='uploader_ex_uploade_d46384_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='extractedinfo',
+            index=models.Index(condition=models.Q(('construction_email_sent', True)), fields=['uploaded_file'], name='uploader_ex_email_sent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['uploaded_at'], name='uploader_up_uploade_a45ad7_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0015_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='content_version',
+            field=models.PositiveIntegerField(default=0, help_text='结果内容版本，提取结果或建设信息变化时递增（仪表盘片段缓存键）'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0016_uploadedfile_content_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(help_text='请求路径（含查询参数）', max_length=1000)),
+                ('view_name', models.CharField(db_index=True, help_text='视图函数（模块.函数名）', max_length=255)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('trigger', models.CharField(choices=[('header', '请求头'), ('query', '查询参数'), ('sample', '抽样')], max_length=10)),
+                ('duration_ms', models.FloatField(help_text='视图总耗时（毫秒）')),
+                ('query_count', models.IntegerField(default=0, help_text='SQL 次数')),
+                ('query_time_ms', models.FloatField(default=0, help_text='SQL 总耗时（毫秒）')),
+                ('queries', models.JSONField(blank=True, default=list, help_text='逐条 SQL 及耗时')),
+                ('stats_text', models.TextField(blank=True, help_text='cProfile 统计（按累计耗时排序）')),
+                ('raw_stats', models.BinaryField(blank=True, help_text='pstats 原始数据，可下载后用 snakeviz 等工具查看')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
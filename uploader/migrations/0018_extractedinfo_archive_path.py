@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0017_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractedinfo',
+            name='archive_path',
+            field=models.CharField(blank=True, default='', help_text='文档所在的内层压缩包路径，直接位于上传压缩包中时为空', max_length=500),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0018_extractedinfo_archive_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, help_text='迁移到冷存储的时间', null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='storage_tier',
+            field=models.CharField(choices=[('hot', '热存储'), ('cold', '冷存储')], default='hot', help_text='压缩包所在存储层级', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['storage_tier', 'uploaded_at'], name='uploader_up_tier_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:58
+
+import uploader.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0019_uploadedfile_storage_tier'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadedfile',
+            name='file',
+            field=models.FileField(blank=True, db_index=True, null=True, upload_to=uploader.models.file_upload_path),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0020_uploadedfile_file_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractedinfo',
+            name='fee_anomaly',
+            field=models.BooleanField(default=False, help_text='费用明显高于同施工单位、同街道的同类文档'),
+        ),
+        migrations.AddField(
+            model_name='extractedinfo',
+            name='fee_anomaly_score',
+            field=models.FloatField(blank=True, help_text='每米费用（无光缆时为费用）相对同组中位数的稳健 z 分数，同组样本不足时为空', null=True),
+        ),
+    ]
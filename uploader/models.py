@@ -13,7 +13,8 @@ def file_upload_path(instance, filename):
 class UploadedFile(models.Model):
     """上传文件模型"""
     # 文件信息
-    file = models.FileField(upload_to=file_upload_path, null=True, blank=True)
+    # 内容寻址存储下多条上传可共用一个文件，释放文件时按 file 统计引用数
+    file = models.FileField(upload_to=file_upload_path, null=True, blank=True, db_index=True)
     original_filename = models.CharField(max_length=255)
     file_size = models.IntegerField(help_text="文件大小（字节）", default=0)
     file_type = models.CharField(max_length=50, help_text="文件类型，如zip、doc、docx")
@@ -31,12 +32,23 @@ class UploadedFile(models.Model):
     
     # 统计信息
     document_count = models.IntegerField(default=0, help_text="提取到的文档数量")
+    content_version = models.PositiveIntegerField(default=0, help_text="结果内容版本，提取结果或建设信息变化时递增（仪表盘片段缓存键）")
+
+    # 存储层级（见 retention.py）：hot 在 MEDIA_ROOT 下，cold 在 RETENTION_COLD_ROOT 下，相对路径不变
+    storage_tier = models.CharField(max_length=10, choices=[('hot', '热存储'), ('cold', '冷存储')], default='hot', help_text="压缩包所在存储层级")
+    archived_at = models.DateTimeField(null=True, blank=True, help_text="迁移到冷存储的时间")
     
     def __str__(self):
         return self.original_filename
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            # 侧边栏历史记录与日期筛选按上传时间排序/过滤
+            models.Index(fields=['uploaded_at']),
+            # 保留策略按层级和上传时间挑选待迁移的压缩包
+            models.Index(fields=['storage_tier', 'uploaded_at'], name='uploader_up_tier_idx'),
+        ]
 
 
 class ExtractedInfo(models.Model):
@@ -57,7 +69,9 @@ class ExtractedInfo(models.Model):
     construction_completed_at = models.DateTimeField(null=True, blank=True, help_text="建设完成时间")
     
     document_name = models.CharField(max_length=255, help_text="文档文件名", default="")
+    archive_path = models.CharField(max_length=500, help_text="文档所在的内层压缩包路径，直接位于上传压缩包中时为空", default="", blank=True)
     document_content = models.TextField(help_text="从Word中提取的完整文本", null=True, blank=True)
+    normalized_text = models.TextField(help_text="去除空白后的文本，规则变更时可直接重新匹配", null=True, blank=True)
     extraction_status = models.CharField(max_length=20, default="待处理")
     extraction_error = models.TextField(null=True, blank=True)
     
@@ -80,6 +94,11 @@ class ExtractedInfo(models.Model):
     # 验证信息
     verification_passed = models.BooleanField(default=False)
     verification_message = models.TextField(null=True, blank=True, help_text="验证消息")
+    rules_version = models.CharField(max_length=50, default='', blank=True, db_index=True, help_text="生成本条结果的提取规则版本")
+
+    # 费用审计（见 audit.py，由 audit_fees 命令批量写入）
+    fee_anomaly = models.BooleanField(default=False, help_text="费用明显高于同施工单位、同街道的同类文档")
+    fee_anomaly_score = models.FloatField(null=True, blank=True, help_text="每米费用（无光缆时为费用）相对同组中位数的稳健 z 分数，同组样本不足时为空")
     
     # 时间信息
     extracted_at = models.DateTimeField(auto_now_add=True)
@@ -91,7 +110,16 @@ class ExtractedInfo(models.Model):
         ordering = ['-extracted_at']
         indexes = [
             models.Index(fields=['order_code']),
-            models.Index(fields=['uploaded_file']),
+            # 按上传读取提取结果并按提取时间排序（也覆盖只按 uploaded_file 的查询）
+            models.Index(fields=['uploaded_file', 'extracted_at']),
+            # 施工单位筛选：按上传查找已发送建设邮件的提取结果。
+            # SQLite 中布尔条件编译为裸列（WHERE "construction_email_sent"），以它开头的复合索引无法用于查找，
+            # 因此用只包含已发送行的部分索引
+            models.Index(
+                fields=['uploaded_file'],
+                condition=models.Q(construction_email_sent=True),
+                name='uploader_ex_email_sent_idx',
+            ),
         ]
 
 
@@ -104,3 +132,59 @@ class ConstructionRemark(models.Model):
     class Meta:
         ordering = ['-created_at']
 
+
+
+class ReportSummary(models.Model):
+    """按月份、施工单位、街道汇总的费用与建设进度统计（随提取与状态更新增量维护）"""
+    month = models.DateField(help_text="上传月份（北京时间，取当月1日）")
+    construction_unit = models.CharField(max_length=255, default='', blank=True, help_text="施工单位（空表示未映射）")
+    township = models.CharField(max_length=255, default='', blank=True, help_text="街道（空表示未解析）")
+
+    document_count = models.IntegerField(default=0, help_text="文档数量")
+    total_fees = models.DecimalField(max_digits=16, decimal_places=2, default=0, help_text="费用总计合计")
+    overall_total_price = models.DecimalField(max_digits=16, decimal_places=2, default=0, help_text="总体花费合计")
+    fiber_length = models.FloatField(default=0, help_text="光缆长度合计（米）")
+
+    email_sent_count = models.IntegerField(default=0, help_text="已发送建设邮件数")
+    field_construction_count = models.IntegerField(default=0, help_text="已现场施工数")
+    resource_entry_count = models.IntegerField(default=0, help_text="已资源录入数")
+    completed_count = models.IntegerField(default=0, help_text="已建设完成数")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.construction_unit or '-'} {self.township or '-'}"
+
+    class Meta:
+        ordering = ['-month', 'construction_unit', 'township']
+        constraints = [
+            models.UniqueConstraint(fields=['month', 'construction_unit', 'township'], name='uniq_report_summary_bucket'),
+        ]
+
+
+class RequestProfile(models.Model):
+    """单次请求的性能剖析结果（由 ProfilingMiddleware 按需或抽样采集）"""
+    TRIGGER_CHOICES = [
+        ('header', '请求头'),
+        ('query', '查询参数'),
+        ('sample', '抽样'),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=1000, help_text="请求路径（含查询参数）")
+    view_name = models.CharField(max_length=255, db_index=True, help_text="视图函数（模块.函数名）")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    duration_ms = models.FloatField(help_text="视图总耗时（毫秒）")
+    query_count = models.IntegerField(default=0, help_text="SQL 次数")
+    query_time_ms = models.FloatField(default=0, help_text="SQL 总耗时（毫秒）")
+    queries = models.JSONField(default=list, blank=True, help_text="逐条 SQL 及耗时")
+    stats_text = models.TextField(blank=True, help_text="cProfile 统计（按累计耗时排序）")
+    raw_stats = models.BinaryField(blank=True, help_text="pstats 原始数据，可下载后用 snakeviz 等工具查看")
+
+    def __str__(self):
+        return f"{self.method} {self.path} {self.duration_ms:.0f}ms"
+
+    class Meta:
+        ordering = ['-created_at']
@@ -0,0 +1,111 @@
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+from .models import RequestProfile
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_PARAM = '_profile'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class _QueryTimer:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({'sql': sql, 'ms': round((time.perf_counter() - started) * 1000, 3)})
+
+
+def _trigger(request):
+    """返回触发方式；未触发时返回 None。请求头/查询参数只对已登录的 staff 生效"""
+    if request.headers.get(PROFILE_HEADER) == '1':
+        trigger = 'header'
+    elif request.GET.get(PROFILE_QUERY_PARAM) == '1':
+        trigger = 'query'
+    else:
+        rate = _setting('PROFILING_SAMPLE_RATE', 0.0)
+        return 'sample' if rate and random.random() < rate else None
+    user = getattr(request, 'user', None)
+    return trigger if user is not None and user.is_staff else None
+
+
+def _prune():
+    keep = _setting('PROFILING_MAX_PROFILES', 500)
+    cutoff = RequestProfile.objects.order_by('-id').values_list('id', flat=True)[keep:keep + 1].first()
+    if cutoff is not None:
+        RequestProfile.objects.filter(id__lte=cutoff).delete()
+
+
+class ProfilingMiddleware:
+    """按需剖析 uploader 视图：cProfile 统计 + 逐条 SQL 耗时，结果存入 RequestProfile（在 admin 中浏览）
+
+    staff 用户可用请求头 X-Profile: 1 或查询参数 ?_profile=1 触发，PROFILING_SAMPLE_RATE 设置抽样比例。
+    未触发时只做几次字典查找和一次随机数比较。需放在 MIDDLEWARE 末尾：触发时由本中间件调用视图。
+    异步视图以 async_to_sync 调用：异步 ORM 的查询会回到调用线程执行，SQL 与其调用栈都能记录，
+    事件循环中执行的部分不在 cProfile 统计内。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not _setting('PROFILING_ENABLED', True):
+            return None
+        if not getattr(view_func, '__module__', '').startswith('uploader.'):
+            return None
+        trigger = _trigger(request)
+        if trigger is None:
+            return None
+
+        view = async_to_sync(view_func) if iscoroutinefunction(view_func) else view_func
+        profiler = cProfile.Profile()
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            profiler.enable()
+            try:
+                response = view(request, *view_args, **view_kwargs)
+            finally:
+                profiler.disable()
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        stats.sort_stats('cumulative').print_stats(_setting('PROFILING_STATS_LIMIT', 60))
+        profile = RequestProfile.objects.create(
+            method=request.method,
+            path=request.get_full_path()[:1000],
+            view_name=f'{view_func.__module__}.{getattr(view_func, "__name__", "")}',
+            status_code=getattr(response, 'status_code', None),
+            trigger=trigger,
+            duration_ms=round(duration_ms, 3),
+            query_count=len(timer.queries),
+            query_time_ms=round(sum(query['ms'] for query in timer.queries), 3),
+            queries=timer.queries,
+            stats_text=stats.stream.getvalue(),
+            raw_stats=marshal.dumps(stats.stats),
+        )
+        _prune()
+        response['X-Profile-Id'] = str(profile.id)
+        return response
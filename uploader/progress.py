@@ -0,0 +1,170 @@
+import asyncio
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+
+# 浏览器生成的进度令牌：只允许字母数字、下划线和连字符，避免拼出任意缓存键
+TOKEN_RE = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+# 结束事件：收到后事件流关闭
+DONE_EVENT = 'done'
+
+
+def valid_token(token):
+    return bool(token) and bool(TOKEN_RE.match(token))
+
+
+def progress_timeout():
+    return getattr(settings, 'UPLOAD_PROGRESS_TIMEOUT', 3600)
+
+
+def _seq_key(token):
+    return f'upload:progress:{token}:seq'
+
+
+def _event_key(token, seq):
+    return f'upload:progress:{token}:{seq}'
+
+
+@contextmanager
+def _sequence_lock():
+    """分配序号期间持有的跨进程锁
+
+    FileBasedCache 的 incr 是先读后写，多个提取进程同时递增会拿到相同序号、互相覆盖事件，
+    因此用缓存目录下的文件锁串行化；Redis 的 INCR 本身是原子的，LocMemCache 只在单个进程内且自带锁，都不需要额外加锁。
+    """
+    backend = caches['default']
+    if not isinstance(backend, FileBasedCache):
+        yield
+        return
+    os.makedirs(backend._dir, exist_ok=True)
+    # 不以 .djcache 结尾，不会被缓存的清理和 clear() 删除
+    with open(os.path.join(backend._dir, 'progress.lock'), 'wb') as lock_file:
+        locks.lock(lock_file, locks.LOCK_EX)
+        try:
+            yield
+        finally:
+            locks.unlock(lock_file)
+
+
+def emit_progress(token, event, **data):
+    """追加一条进度事件到共享缓存（多个工作进程都能读到），返回事件序号"""
+    seq_key = _seq_key(token)
+    with _sequence_lock():
+        cache.add(seq_key, 0, progress_timeout())
+        try:
+            seq = cache.incr(seq_key)
+        except ValueError:
+            # 计数键恰好过期：重新开始计数
+            cache.set(seq_key, 1, progress_timeout())
+            seq = 1
+    cache.set(_event_key(token, seq), {'event': event, 'data': data}, progress_timeout())
+    return seq
+
+
+def _ignore(event, **data):
+    return None
+
+
+def _report(token, context, event, **data):
+    emit_progress(token, event, **{**context, **data})
+
+
+def progress_reporter(token, **context):
+    """返回写入该令牌进度事件的回调 reporter(event, **data)；令牌无效时返回空操作
+
+    context 中的键值（如第几个文件）会附加到每条事件上。回调可以被 pickle，
+    能随任务一起交给提取进程池。
+    """
+    if not valid_token(token):
+        return _ignore
+    return partial(_report, token, context)
+
+
+def read_events(token, after=0):
+    """读取序号大于 after 的事件，返回 [(seq, event, data)]"""
+    last = cache.get(_seq_key(token)) or 0
+    if last <= after:
+        return []
+    return _collect_events(token, after, last, cache.get_many(_event_keys(token, after, last)))
+
+
+async def aread_events(token, after=0):
+    """read_events 的异步版本"""
+    last = await cache.aget(_seq_key(token)) or 0
+    if last <= after:
+        return []
+    return _collect_events(token, after, last, await cache.aget_many(_event_keys(token, after, last)))
+
+
+def _event_keys(token, after, last):
+    return [_event_key(token, seq) for seq in range(after + 1, last + 1)]
+
+
+def _collect_events(token, after, last, found):
+    events = []
+    for seq in range(after + 1, last + 1):
+        item = found.get(_event_key(token, seq))
+        if item is None:
+            # 序号已递增但事件尚未写入：下次轮询再读，保证不跳过事件
+            break
+        events.append((seq, item['event'], item['data']))
+    return events
+
+
+def format_sse(seq, event, data):
+    payload = json.dumps(data, ensure_ascii=False)
+    return f'id: {seq}\nevent: {event}\ndata: {payload}\n\n'
+
+
+def event_stream(token, last_id=0, poll_interval=0.5, max_seconds=None, keepalive=15.0):
+    """SSE 事件流生成器：轮询缓存中的新事件，只读缓存、不访问数据库
+
+    收到结束事件或超过 max_seconds 后结束；空闲时定期发送注释行保持连接。
+    WSGI 部署下使用（等待期间占用一个工作线程），ASGI 下使用 aevent_stream。
+    """
+    if max_seconds is None:
+        max_seconds = progress_timeout()
+    deadline = time.monotonic() + max_seconds
+    last_sent = time.monotonic()
+    # 断线重连时浏览器会等待 retry 毫秒后携带 Last-Event-ID 继续
+    yield 'retry: 2000\n\n'
+    while time.monotonic() < deadline:
+        for seq, event, data in read_events(token, last_id):
+            last_id = seq
+            last_sent = time.monotonic()
+            yield format_sse(seq, event, data)
+            if event == DONE_EVENT:
+                return
+        if time.monotonic() - last_sent >= keepalive:
+            last_sent = time.monotonic()
+            yield ': keepalive\n\n'
+        time.sleep(poll_interval)
+
+
+async def aevent_stream(token, last_id=0, poll_interval=0.5, max_seconds=None, keepalive=15.0):
+    """event_stream 的异步生成器版本：轮询间隔用 asyncio.sleep 等待，连接期间不占用线程"""
+    if max_seconds is None:
+        max_seconds = progress_timeout()
+    deadline = time.monotonic() + max_seconds
+    last_sent = time.monotonic()
+    yield 'retry: 2000\n\n'
+    while time.monotonic() < deadline:
+        for seq, event, data in await aread_events(token, last_id):
+            last_id = seq
+            last_sent = time.monotonic()
+            yield format_sse(seq, event, data)
+            if event == DONE_EVENT:
+                return
+        if time.monotonic() - last_sent >= keepalive:
+            last_sent = time.monotonic()
+            yield ': keepalive\n\n'
+        await asyncio.sleep(poll_interval)
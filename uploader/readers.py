@@ -0,0 +1,257 @@
+import importlib.util
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from functools import lru_cache
+from html import unescape
+
+from django.conf import settings
+
+
+class ReaderBackend:
+    """文档读取后端
+
+    name: 名称（可在 settings.DOCUMENT_READERS 中引用）
+    formats: 支持的扩展名，如 ('.docx',)
+    platforms: 支持的 sys.platform 前缀，None 表示不限
+    requires: 依赖的顶层模块名，用 find_spec 检查是否安装，检查时不导入
+    priority: 越小越先尝试，按速度排列
+    read: read(path) -> 文本行列表；依赖在这里才导入
+    streams: read 是否也接受可 seek 的文件对象；为 False 时对内存中的文档先写入单个临时文件
+    """
+
+    def __init__(self, name, formats, read, requires=(), platforms=None, priority=100, streams=True):
+        self.name = name
+        self.formats = tuple(ext.lower() for ext in formats)
+        self.read = read
+        self.requires = tuple(requires)
+        self.platforms = tuple(platforms) if platforms else None
+        self.priority = priority
+        self.streams = streams
+
+    def available(self):
+        if self.platforms and not sys.platform.startswith(self.platforms):
+            return False
+        return all(importlib.util.find_spec(module) is not None for module in self.requires)
+
+    def __repr__(self):
+        return f'<ReaderBackend {self.name}>'
+
+
+_BACKENDS = {}
+
+
+def register_backend(backend):
+    """注册（或按名称替换）读取后端"""
+    _BACKENDS[backend.name] = backend
+    backends_for_format.cache_clear()
+    return backend
+
+
+def unregister_backend(name):
+    _BACKENDS.pop(name, None)
+    backends_for_format.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def backends_for_format(ext):
+    """某扩展名可用的后端，按优先级排列；settings.DOCUMENT_READERS 可指定启用的后端及顺序"""
+    enabled = getattr(settings, 'DOCUMENT_READERS', None)
+    if enabled:
+        candidates = [_BACKENDS[name] for name in enabled if name in _BACKENDS]
+    else:
+        candidates = sorted(_BACKENDS.values(), key=lambda backend: backend.priority)
+    return tuple(backend for backend in candidates if ext.lower() in backend.formats and backend.available())
+
+
+def read_document(source, name=None):
+    """依次尝试该格式可用的后端，返回第一个读出非空内容的结果（文本行列表）
+
+    source 为文件路径，或可 seek 的文件对象（此时由 name 确定格式，如压缩包内直接读出的文档）。
+    """
+    ext = os.path.splitext(name or source)[1].lower()
+    backends = backends_for_format(ext)
+    if not backends:
+        print(f"没有可处理 {ext} 文件的读取后端")
+        return []
+    temp_path = None
+    try:
+        for backend in backends:
+            target = source
+            if not isinstance(source, str):
+                if backend.streams:
+                    source.seek(0)
+                else:
+                    # 只能按路径读取的后端（如 win32com）：落盘的只是这一个文档
+                    if temp_path is None:
+                        temp_path = _spill_to_temp(source, ext)
+                    target = temp_path
+            try:
+                lines = backend.read(target)
+            except Exception as e:
+                print(f"{backend.name} 读取失败: {e}")
+                continue
+            if any(line.strip() for line in lines):
+                print(f"使用 {backend.name} 读取，约 {len(lines)} 行")
+                return lines
+            print(f"{backend.name} 未读出内容")
+    finally:
+        if temp_path is not None:
+            os.remove(temp_path)
+    print("无法提取文档内容")
+    return []
+
+
+def _spill_to_temp(stream, ext):
+    stream.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as f:
+        shutil.copyfileobj(stream, f)
+    return f.name
+
+
+def read_with_python_docx(file_path):
+    from docx import Document
+
+    doc = Document(file_path)
+    full_text = [para.text for para in doc.paragraphs if para.text.strip()]
+    # 表格按行输出，单元格以制表符分隔
+    for table in doc.tables:
+        for row in table.rows:
+            row_text = [cell.text.strip() for cell in row.cells if cell.text.strip()]
+            if row_text:
+                full_text.append('\t'.join(row_text))
+    return full_text
+
+
+def read_with_docx2txt(file_path):
+    import docx2txt
+
+    return docx2txt.process(file_path).split('\n')
+
+
+def extract_text_with_win32com(file_path, max_retries=3):
+    """使用win32com优化提取Word文档内容，增加重试机制和错误处理"""
+    text = ""
+    word = None
+    doc = None
+    
+    for retry in range(max_retries):
+        try:
+            # 在多线程环境中需要初始化COM
+            import pythoncom
+            pythoncom.CoInitialize()
+            
+            # 使用 win32com 自动化 Word。某些情况下 win32com 的 gen_py 缓存会损坏，
+            # 导致类似 "module 'win32com.gen_py.xxx' has no attribute 'CLSIDToPackageMap'" 的错误。
+            # 为提高鲁棒性，按以下顺序尝试：
+            # 1) 优先使用 DispatchEx（更适合多线程，且通常能避免 gen_py 的一些问题）
+            # 2) 若失败，尝试使用 gencache.EnsureDispatch（可能会触发生成/修复 gen_py）
+            # 3) 若 EnsureDispatch 失败，尝试 gencache.Rebuild 再 EnsureDispatch
+            import win32com.client
+            try:
+                # DispatchEx 在多线程或并发环境下更安全
+                word = win32com.client.DispatchEx("Word.Application")
+            except Exception as de:
+                # DispatchEx 失败时，尝试通过 gencache 修复生成的缓存并使用 Dispatch
+                try:
+                    from win32com.client import gencache
+                    try:
+                        # EnsureDispatch 有时会修复缺失的 gen_py 模块
+                        gencache.EnsureDispatch("Word.Application")
+                    except Exception:
+                        # 如果 EnsureDispatch 也失败，尝试 Rebuild 再 EnsureDispatch
+                        try:
+                            gencache.Rebuild()
+                            gencache.EnsureDispatch("Word.Application")
+                        except Exception:
+                            # 如果仍然失败，让外层捕获并记录错误
+                            raise
+                    # 最终以普通 Dispatch 取得对象
+                    word = win32com.client.Dispatch("Word.Application")
+                except Exception as e_gencache:
+                    # 最后尝试使用动态派生（dynamic.Dispatch）以绕开 gen_py 缓存问题
+                    try:
+                        from win32com.client import dynamic
+                        word = dynamic.Dispatch("Word.Application")
+                    except Exception as e_dynamic:
+                        # 将原始错误与 gencache / dynamic 错误都记录并抛出，以便外层捕获
+                        raise RuntimeError(f"win32com Dispatch 失败: DispatchEx error={de}; gencache error={e_gencache}; dynamic error={e_dynamic}")
+
+            # 设置可见性和警告行为
+            word.Visible = False
+            word.DisplayAlerts = False
+            
+            # 使用绝对路径并确保文件存在
+            abs_path = os.path.abspath(file_path)
+            if not os.path.exists(abs_path):
+                raise FileNotFoundError(f"文件不存在: {abs_path}")
+            
+            # 尝试打开文档
+            if file_path.lower().endswith('.doc'):
+                doc = word.Documents.Open(abs_path)
+            else:
+                doc = word.Documents.Open(abs_path)
+            
+            # 短暂延迟确保文档完全加载
+            time.sleep(0.5)
+            
+            # 提取文本内容
+            text = doc.Content.Text
+            
+            # 清理资源
+            if doc:
+                doc.Close(SaveChanges=False)
+                doc = None
+            if word:
+                word.Quit()
+                word = None
+                
+            break  # 成功提取，退出重试循环
+            
+        except Exception as e:
+            # 清理资源
+            if doc:
+                try:
+                    doc.Close(SaveChanges=False)
+                except:
+                    pass
+            if word:
+                try:
+                    word.Quit()
+                except:
+                    pass
+            word = None
+            doc = None
+            
+            if retry < max_retries - 1:
+                print(f"win32com提取尝试 {retry+1} 失败: {e}，将重试...")
+                time.sleep(1)  # 重试前等待1秒
+            else:
+                print(f"win32com提取失败（所有尝试）: {e}")
+    
+    return text
+
+
+def read_with_win32com(file_path):
+    return extract_text_with_win32com(file_path).split('\n')
+
+
+def read_docx_xml(file_path):
+    """不依赖第三方库：直接读取 .docx 中的 word/document.xml，按段落拆行"""
+    with zipfile.ZipFile(file_path, 'r') as doc_zip:
+        xml_content = doc_zip.read('word/document.xml').decode('utf-8')
+    xml_content = re.sub(r'</w:p>', '\n', xml_content)
+    xml_content = re.sub(r'<w:tab/>', '\t', xml_content)
+    text = unescape(re.sub(r'<[^>]+>', '', xml_content))
+    return [line for line in text.split('\n') if line.strip()]
+
+
+register_backend(ReaderBackend('python-docx', ['.docx'], read_with_python_docx, requires=['docx'], priority=10))
+register_backend(ReaderBackend('docx2txt', ['.docx'], read_with_docx2txt, requires=['docx2txt'], priority=20))
+# .doc 只能借助本机安装的 Word；启动 Word 很慢，排在纯 Python 后端之后
+register_backend(ReaderBackend('win32com', ['.doc', '.docx'], read_with_win32com, requires=['win32com', 'pythoncom'], platforms=['win32'], priority=30, streams=False))
+register_backend(ReaderBackend('docx-xml', ['.docx'], read_docx_xml, priority=40))
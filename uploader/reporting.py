@@ -0,0 +1,152 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import ExtractedInfo, ReportSummary, UploadedFile
+from .utils import fiber_total_length
+
+REPORT_TIMEZONE = ZoneInfo('Asia/Shanghai')
+
+# 汇总表中按增量累加的字段，顺序与 _contribution 返回值一致
+SUMMARY_VALUE_FIELDS = [
+    'document_count',
+    'total_fees',
+    'overall_total_price',
+    'fiber_length',
+    'email_sent_count',
+    'field_construction_count',
+    'resource_entry_count',
+    'completed_count',
+]
+
+_CONTRIBUTION_FIELDS = [
+    'id',
+    'uploaded_file__uploaded_at',
+    'uploaded_file__construction_unit',
+    'uploaded_file__township',
+    'total_fees',
+    'overall_total_price',
+    'fiber_info',
+    'construction_email_sent',
+    'field_construction_at',
+    'resource_entry_at',
+    'construction_completed_at',
+]
+
+
+def summary_month(dt):
+    """上传时间所在月份（北京时间）的1日"""
+    local = dt.astimezone(REPORT_TIMEZONE)
+    return date(local.year, local.month, 1)
+
+
+def _contribution(row):
+    """单条提取结果对汇总表的贡献：(分组键, 各累加字段的值)"""
+    (_, uploaded_at, unit, township, total_fees, overall_total_price, fiber_info,
+     email_sent, field_at, resource_at, completed_at) = row
+    key = (summary_month(uploaded_at), unit or '', township or '')
+    values = (
+        1,
+        total_fees or Decimal('0'),
+        overall_total_price or Decimal('0'),
+        float(fiber_total_length(fiber_info)),
+        1 if email_sent else 0,
+        1 if field_at else 0,
+        1 if resource_at else 0,
+        1 if completed_at else 0,
+    )
+    return key, values
+
+
+def info_contributions(queryset):
+    """{提取结果ID: (分组键, 贡献值)}"""
+    return {row[0]: _contribution(row) for row in queryset.values_list(*_CONTRIBUTION_FIELDS).iterator()}
+
+
+def apply_contribution_diff(before, after):
+    """比较变更前后的贡献，把差值累加到汇总表"""
+    deltas = defaultdict(lambda: [0] * len(SUMMARY_VALUE_FIELDS))
+    for sign, contributions in ((-1, before), (1, after)):
+        for key, values in contributions.values():
+            delta = deltas[key]
+            for i, value in enumerate(values):
+                delta[i] += sign * value
+
+    with transaction.atomic():
+        for (month, unit, township), delta in deltas.items():
+            if not any(delta):
+                continue
+            summary, _ = ReportSummary.objects.get_or_create(month=month, construction_unit=unit, township=township)
+            ReportSummary.objects.filter(pk=summary.pk).update(**{
+                field: F(field) + value
+                for field, value in zip(SUMMARY_VALUE_FIELDS, delta)
+                if value
+            })
+            # 分组内已无文档时删除该行，保持与重建结果一致
+            ReportSummary.objects.filter(pk=summary.pk, document_count__lte=0).delete()
+
+
+@contextmanager
+def track_summary_changes(queryset):
+    """在代码块前后对比受影响提取结果的贡献并增量更新汇总表
+
+    queryset 为可能受影响的 ExtractedInfo 查询集，代码块中新建的行只要满足该条件也会被计入。
+    变更前的快照、代码块中的写入和差值累加在同一个事务中，快照时锁定这些行：
+    并发修改同一行时后来者等前者提交后再读，不会基于同一份旧值重复累加
+    （SQLite 忽略行锁，IMMEDIATE 事务开始时即持有写锁）。
+    """
+    with transaction.atomic():
+        before = info_contributions(queryset.select_for_update(of=('self',)))
+        yield
+        affected = ExtractedInfo.objects.filter(Q(pk__in=list(before)) | Q(pk__in=queryset.values('pk')))
+        apply_contribution_diff(before, info_contributions(affected))
+
+
+def subtract_deleted_info(sender, instance, **kwargs):
+    """post_delete：删除提取结果（包括删除上传时的级联删除）后从汇总表中减去其贡献
+
+    级联删除时提取结果先于所属上传删除，此时仍能查到上传时间、施工单位和街道。
+    """
+    upload = (
+        UploadedFile.objects
+        .filter(pk=instance.uploaded_file_id)
+        .values_list('uploaded_at', 'construction_unit', 'township')
+        .first()
+    )
+    if upload is None:
+        return
+    row = (
+        instance.pk, *upload, instance.total_fees, instance.overall_total_price, instance.fiber_info,
+        instance.construction_email_sent, instance.field_construction_at, instance.resource_entry_at,
+        instance.construction_completed_at,
+    )
+    apply_contribution_diff({instance.pk: _contribution(row)}, {})
+
+
+def rebuild_summaries():
+    """按全部提取结果重建汇总表，返回写入的分组数"""
+    buckets = defaultdict(lambda: [0] * len(SUMMARY_VALUE_FIELDS))
+    rows = ExtractedInfo.objects.order_by().values_list(*_CONTRIBUTION_FIELDS).iterator(chunk_size=2000)
+    for row in rows:
+        key, values = _contribution(row)
+        bucket = buckets[key]
+        for i, value in enumerate(values):
+            bucket[i] += value
+
+    with transaction.atomic():
+        ReportSummary.objects.all().delete()
+        ReportSummary.objects.bulk_create([
+            ReportSummary(
+                month=month,
+                construction_unit=unit,
+                township=township,
+                **dict(zip(SUMMARY_VALUE_FIELDS, values)),
+            )
+            for (month, unit, township), values in buckets.items()
+        ], batch_size=500)
+    return len(buckets)
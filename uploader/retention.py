@@ -0,0 +1,162 @@
+import os
+import shutil
+import zipfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UploadedFile
+from .storage import blob_lock, is_pinned, pin_blob, unpin_blob
+
+HOT = 'hot'
+COLD = 'cold'
+
+# 重新压缩可选的算法：(压缩方式, 压缩级别)；lzma/bzip2 压缩率更高，但 Windows 资源管理器等部分解压工具不支持
+COMPRESSIONS = {
+    'deflate': (zipfile.ZIP_DEFLATED, 9),
+    'bzip2': (zipfile.ZIP_BZIP2, 9),
+    'lzma': (zipfile.ZIP_LZMA, None),
+}
+
+DEFAULT_POLICY = {
+    'cold_after_days': None,  # 上传超过 N 天的压缩包移入冷存储；None 表示不迁移
+    'recompress': True,       # 提取成功的压缩包迁移时重新压缩（更小时才采用）
+    'compression': 'deflate',
+    'batch_size': 50,
+}
+
+_COPY_BUFFER = 1024 * 1024
+
+
+def retention_policy():
+    return {**DEFAULT_POLICY, **getattr(settings, 'RETENTION_POLICY', {})}
+
+
+def cold_storage():
+    return FileSystemStorage(location=getattr(settings, 'RETENTION_COLD_ROOT', os.path.join(settings.BASE_DIR, 'cold_media')))
+
+
+def stored_file_path(uploaded_file):
+    """上传压缩包当前所在层级中的物理路径；没有文件时返回 None"""
+    if not uploaded_file.file:
+        return None
+    storage = cold_storage() if uploaded_file.storage_tier == COLD else default_storage
+    return storage.path(uploaded_file.file.name)
+
+
+def due_for_cold(cutoff):
+    """上传时间早于 cutoff、仍在热存储中的上传，按 ID 顺序"""
+    return (
+        UploadedFile.objects
+        .filter(storage_tier=HOT, uploaded_at__lt=cutoff)
+        .exclude(file='').exclude(file__isnull=True)
+        .order_by('id')
+    )
+
+
+def recompress_zip(src, dst, compression='deflate'):
+    """逐个成员流式解压再以更高压缩率写入 dst，保留文件名、时间和属性
+
+    读取时逐成员校验 CRC，写完后再对新文件整体校验一次，任何一步失败都抛出异常。
+    """
+    compress_type, level = COMPRESSIONS[compression]
+    with zipfile.ZipFile(src) as zin, zipfile.ZipFile(dst, 'w', compression=compress_type, allowZip64=True) as zout:
+        for info in zin.infolist():
+            member = zipfile.ZipInfo(info.filename, info.date_time)
+            member.external_attr = info.external_attr
+            member.create_system = info.create_system
+            member.comment = info.comment
+            member.compress_type = compress_type
+            member._compresslevel = level
+            if info.is_dir():
+                zout.writestr(member, b'')
+                continue
+            with zin.open(info) as source, zout.open(member, 'w', force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as target:
+                shutil.copyfileobj(source, target, _COPY_BUFFER)
+    with zipfile.ZipFile(dst) as check:
+        bad = check.testzip()
+    if bad is not None:
+        raise zipfile.BadZipFile(f'重新压缩后校验失败: {bad}')
+
+
+def _copy_to_cold(uploaded_file, src, dst, policy):
+    """在冷存储中写好临时文件再改名为 dst，返回是否采用了重新压缩的版本"""
+    tmp = f'{dst}.tmp'
+    before = os.path.getsize(src)
+    recompressed = False
+    try:
+        # 只重新压缩已成功提取文本的压缩包：提取失败的可能需要原样重新处理
+        if policy['recompress'] and uploaded_file.is_processed and not uploaded_file.processing_error:
+            try:
+                recompress_zip(src, tmp, policy['compression'])
+                recompressed = os.path.getsize(tmp) < before
+            except zipfile.BadZipFile:
+                recompressed = False
+        if not recompressed:
+            shutil.copyfile(src, tmp)
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return recompressed
+
+
+def move_to_cold(uploaded_file, policy=None):
+    """把一个上传压缩包迁移到冷存储，返回 {'before', 'after', 'recompressed'}
+
+    先在冷存储中写好临时文件再改名，之后更新 storage_tier，最后释放热存储中的原文件
+    （内容寻址存储中仍有其他热存储上传引用时保留）；中途失败时原文件和数据库记录都保持不变，重新运行即可。
+    """
+    policy = policy or retention_policy()
+    name = uploaded_file.file.name
+    cold = cold_storage()
+    src = default_storage.path(name)
+    dst = cold.path(name)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    before = os.path.getsize(src)
+
+    # dst 只会由 os.replace 产生，已存在说明相同内容的另一条上传已迁移过，直接共用；
+    # 在记录更新之前登记待引用标记，期间冷存储中其他引用被删除也不会删掉 dst
+    with blob_lock(cold):
+        reused = os.path.exists(dst)
+        pin = pin_blob(cold, name)
+    try:
+        recompressed = reused or _copy_to_cold(uploaded_file, src, dst, policy)
+        after = os.path.getsize(dst)
+        updated = UploadedFile.objects.filter(pk=uploaded_file.pk, storage_tier=HOT).update(
+            storage_tier=COLD,
+            archived_at=timezone.now(),
+        )
+    finally:
+        unpin_blob(cold, pin)
+    if updated:
+        uploaded_file.storage_tier = COLD
+        release_archive(name, HOT)
+    return {'before': before, 'after': after, 'recompressed': recompressed and after < before}
+
+
+def release_archive(name, tier=HOT):
+    """某层级中已没有上传引用 name 时删除该文件，返回是否删除
+
+    内容寻址存储中多条上传可能共用同一个文件，引用计数即该层级中 file=name 的上传数，
+    加上已保存或复用了该文件、记录尚未提交的待引用标记（storage.pin_blob）；
+    应在引用它的记录删除（或迁移）之后调用。
+    """
+    if not name:
+        return False
+    storage = cold_storage() if tier == COLD else default_storage
+    with blob_lock(storage):
+        if UploadedFile.objects.filter(file=name, storage_tier=tier).exists() or is_pinned(storage, name):
+            return False
+        storage.delete(name)
+    return True
+
+
+def release_deleted_upload(sender, instance, **kwargs):
+    """post_delete：删除上传记录后，在事务提交时按引用计数释放其压缩包"""
+    if instance.file:
+        name, tier = instance.file.name, instance.storage_tier
+        transaction.on_commit(lambda: release_archive(name, tier))
@@ -0,0 +1,134 @@
+import json
+import os
+import re
+import threading
+
+# 未配置 Django 时（如独立脚本）使用的默认规则文件
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'extraction_rules.json')
+
+# 规则文件中必须定义的费用字段
+PRICE_FIELDS = [
+    'doc_maintenance_total',
+    'overall_total_price',
+    'total_price',
+    'maintenance_fee',
+    'service_fee',
+    'terminal_fee',
+]
+
+
+class RuleSet:
+    """编译后的一版提取规则；创建后不再修改，可被多个线程同时使用"""
+
+    def __init__(self, version, fields, fiber_patterns, fiber_description_patterns, labels):
+        self.version = version
+        self.fields = fields
+        self.fiber_patterns = fiber_patterns
+        self.fiber_description_patterns = fiber_description_patterns
+        self.labels = labels
+
+    def patterns(self, field):
+        return self.fields[field]
+
+    def label(self, field):
+        return self.labels.get(field, field)
+
+
+def _compile_patterns(entries, where):
+    """按 priority 从小到大排序并编译；priority 相同时保持文件中的顺序"""
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f'{where}: 至少需要一条规则')
+    compiled = []
+    for index, entry in enumerate(entries):
+        try:
+            compiled.append((int(entry.get('priority', 0)), index, re.compile(entry['pattern'])))
+        except (AttributeError, KeyError, TypeError, ValueError, re.error) as e:
+            raise ValueError(f'{where}[{index}]: 规则无效 {e}')
+    return tuple(pattern for _, _, pattern in sorted(compiled, key=lambda item: item[:2]))
+
+
+def compile_rules(data):
+    """把规则文件内容编译为 RuleSet；内容不合法时抛出 ValueError"""
+    version = str(data.get('version') or '').strip()
+    if not version:
+        raise ValueError('规则文件缺少 version')
+
+    fields = {}
+    labels = {}
+    for field in PRICE_FIELDS:
+        spec = (data.get('fields') or {}).get(field)
+        if not spec:
+            raise ValueError(f'规则文件缺少字段 {field}')
+        fields[field] = _compile_patterns(spec.get('patterns'), field)
+        labels[field] = spec.get('label') or field
+
+    fiber = data.get('fiber') or {}
+    labels['fiber_info'] = fiber.get('label') or 'fiber_info'
+    return RuleSet(
+        version,
+        fields,
+        _compile_patterns(fiber.get('patterns'), 'fiber'),
+        _compile_patterns(fiber.get('description_patterns'), 'fiber.description_patterns'),
+        labels,
+    )
+
+
+def load_rules(path):
+    with open(path, 'r', encoding='utf-8') as fh:
+        return compile_rules(json.load(fh))
+
+
+def rules_path():
+    try:
+        from django.conf import settings
+        if settings.configured:
+            return str(getattr(settings, 'EXTRACTION_RULES_PATH', DEFAULT_RULES_PATH))
+    except ImportError:
+        pass
+    return DEFAULT_RULES_PATH
+
+
+_lock = threading.Lock()
+_current = None
+_current_path = None
+_current_mtime = None
+
+
+def get_rules():
+    """返回当前进程的规则
+
+    规则文件只在修改时间变化后才重新读取，且只有 version 改变时才重新编译并整体替换，
+    正在使用旧规则的调用不受影响；新文件不合法时继续使用旧规则。
+    """
+    global _current, _current_path, _current_mtime
+
+    path = rules_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+
+    current = _current
+    if current is not None and path == _current_path and mtime == _current_mtime:
+        return current
+
+    with _lock:
+        if _current is not None and path == _current_path and mtime == _current_mtime:
+            return _current
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                data = json.load(fh)
+            if _current is None or path != _current_path or str(data.get('version') or '').strip() != _current.version:
+                _current = compile_rules(data)
+                print(f"已加载提取规则 版本 {_current.version}: {path}")
+        except (OSError, ValueError) as e:
+            if _current is None:
+                raise
+            print(f"提取规则文件 {path} 无效，继续使用版本 {_current.version}: {e}")
+        _current_path = path
+        _current_mtime = mtime
+        return _current
+
+
+def current_rules_version():
+    return get_rules().version
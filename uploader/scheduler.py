@@ -0,0 +1,262 @@
+import asyncio
+import inspect
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .ingest import ingest_extracted_infos
+from .metrics import ARCHIVES_PROCESSED, call_collecting_stages, observe_stage, record_documents, record_stage_timings
+from .models import UploadedFile
+from .progress import progress_reporter
+from .retention import release_archive
+from .storage import ContentAddressedStorage, unpin_blob
+from .utils import extract_info_from_zip
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+_executors_lock = threading.Lock()
+_loop = None
+_geocode_semaphore = None
+
+
+def geocode_workers():
+    return max(1, getattr(settings, 'UPLOAD_GEOCODE_WORKERS', 4))
+
+
+def extract_workers():
+    """提取进程数；0 表示在请求线程内逐个提取（调试或不便启动子进程的环境）"""
+    return max(0, getattr(settings, 'UPLOAD_EXTRACT_WORKERS', min(4, os.cpu_count() or 1)))
+
+
+def _executor(kind, workers):
+    """按类型复用本进程内的线程池/进程池：所有上传请求共享同一组工作者，总并发有上限"""
+    key = (kind, workers)
+    with _executors_lock:
+        executor = _executors.get(key)
+        if executor is None:
+            if kind == 'extract':
+                # spawn 启动的子进程不继承父进程已打开的数据库连接；子进程只解压和解析文档，不访问数据库
+                executor = ProcessPoolExecutor(
+                    workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=django.setup,
+                )
+            else:
+                executor = ThreadPoolExecutor(workers, thread_name_prefix='upload-geocode')
+            _executors[key] = executor
+    return executor
+
+
+def _discard_executor(kind, workers):
+    # 子进程异常退出后进程池不可再用，下次提交时重建
+    with _executors_lock:
+        executor = _executors.pop((kind, workers), None)
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _event_loop():
+    """本进程共享的后台事件循环线程：异步街道解析在这里并发执行，等待高德响应时不占用线程"""
+    global _loop
+    with _executors_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='upload-geocode-loop', daemon=True).start()
+    return _loop
+
+
+async def _limited_geocode(geocode, address):
+    global _geocode_semaphore
+    # 信号量只在事件循环线程中创建和使用；并发上限与线程池方式相同，避免超出高德的 QPS 配额
+    if _geocode_semaphore is None:
+        _geocode_semaphore = asyncio.Semaphore(geocode_workers())
+    async with _geocode_semaphore:
+        return await geocode(address)
+
+
+def _submit_geocode(geocode, address):
+    """geocode 为协程函数时在后台事件循环中执行，否则在线程池中执行；都返回 concurrent.futures.Future"""
+    if inspect.iscoroutinefunction(geocode):
+        return asyncio.run_coroutine_threadsafe(_limited_geocode(geocode, address), _event_loop())
+    return _executor('geocode', geocode_workers()).submit(geocode, address)
+
+
+def _submit_extract(workers, *args, **kwargs):
+    """提交提取任务，Future 的结果为 (提取结果, 阶段耗时)；阶段耗时由请求进程写入指标"""
+    if not workers:
+        future = Future()
+        try:
+            future.set_result(call_collecting_stages(extract_info_from_zip, *args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    try:
+        return _executor('extract', workers).submit(call_collecting_stages, extract_info_from_zip, *args, **kwargs)
+    except BrokenExecutor:
+        _discard_executor('extract', workers)
+        return _executor('extract', workers).submit(call_collecting_stages, extract_info_from_zip, *args, **kwargs)
+
+
+def parse_archive_name(filename):
+    """从 ZIP 文件名（单号+集团名称+地址.zip）解析集团名称和地址"""
+    filename_base = os.path.splitext(filename)[0]
+    filename_base = re.sub(r'\(\d+\)$', '', filename_base)
+    parts = filename_base.split('+')
+    group_name = parts[1] if len(parts) > 1 else ''
+    address = '+'.join(parts[2:]) if len(parts) > 2 else ''
+    return group_name, address
+
+
+def _store_archive(file):
+    """先把上传内容写入存储，提取进程按路径读取；数据库记录等提取完成后再一次性写入
+
+    返回 (实际保存的名称, 待引用标记)：默认的内容寻址存储会改为 blobs/ 下按哈希命名的文件，内容相同时不重复写入，
+    并登记标记，记录提交前相同内容的其他上传被删除时文件不会被释放；其他存储不共用文件，标记为 None。
+    """
+    name = UploadedFile._meta.get_field('file').generate_filename(None, file.name)
+    if isinstance(default_storage, ContentAddressedStorage):
+        return default_storage.save_pinned(name, file)
+    return default_storage.save(name, file), None
+
+
+def _discard_archive(archive):
+    """记录未写入：撤销待引用标记，再按引用计数释放文件"""
+    unpin_blob(default_storage, archive['pin'])
+    release_archive(archive['stored_name'])
+
+
+def _save_archive(archive, results, error):
+    """在一个事务中写入上传记录及其全部提取结果（按 UPLOAD_INGEST_MODE 新建或合并到同单号的已有结果）"""
+    with transaction.atomic():
+        uploaded_file = UploadedFile(
+            original_filename=archive['name'],
+            file_size=archive['size'],
+            file_type='zip',
+            group_name=archive['group_name'] or None,
+            address=archive['address'] or None,
+            township=archive['township'] or None,
+            construction_unit=archive['construction_unit'] or None,
+            is_marked=True,
+        )
+        uploaded_file.file.name = archive['stored_name']
+        if error:
+            uploaded_file.processing_error = error
+        else:
+            uploaded_file.document_count = len(results)
+            uploaded_file.is_processed = True
+            uploaded_file.processed_at = timezone.now()
+        uploaded_file.save()
+        if results and not error:
+            ingest_extracted_infos(uploaded_file, results)
+    return uploaded_file
+
+
+def process_archives(files, geocode, progress_token=None):
+    """并发处理一次上传中的多个 ZIP
+
+    街道解析（网络请求）在后台事件循环（geocode 为协程函数时）或线程池中执行，文档提取（CPU 密集）在进程池中执行，
+    两者互不占用；每个压缩包提取完成后在请求线程中以单个事务写库，写库顺序按完成先后。
+    geocode(address) 返回 (街道, 施工单位)。
+
+    返回与 files 顺序一致的列表，每项为 {'name', 'upload', 'message'}：
+    upload 为写入的 UploadedFile（未写入时为 None），message 为需要提示给用户的错误。
+    """
+    outcomes = [{'name': file.name, 'upload': None, 'message': None} for file in files]
+    archives = {}
+    geocoded = {}
+    extracting = {}
+    workers = extract_workers()
+
+    for index, file in enumerate(files):
+        report = progress_reporter(progress_token, file=index + 1, total_files=len(files), name=file.name)
+        if not file.name.lower().endswith('.zip'):
+            outcomes[index]['message'] = f'仅支持ZIP文件: {file.name}'
+            ARCHIVES_PROCESSED.labels('rejected').inc()
+            report('failed', error='仅支持ZIP文件')
+            continue
+
+        group_name, address = parse_archive_name(file.name)
+        archive = archives[index] = {
+            'name': file.name,
+            'size': file.size,
+            'group_name': group_name,
+            'address': address,
+            'township': None,
+            'construction_unit': None,
+            'stored_name': None,
+            'pin': None,
+            'report': report,
+        }
+        geocoded[index] = _submit_geocode(geocode, address)
+        try:
+            archive['stored_name'], archive['pin'] = _store_archive(file)
+            future = _submit_extract(workers, default_storage.path(archive['stored_name']), file.name, progress=report)
+        except Exception as e:
+            logger.error(f"Error storing {file.name}: {e}")
+            if archive['stored_name']:
+                _discard_archive(archive)
+            report('failed', error=str(e))
+            ARCHIVES_PROCESSED.labels('failed').inc()
+            continue
+        extracting[future] = index
+
+    for future in as_completed(extracting):
+        index = extracting[future]
+        archive = archives[index]
+        report = archive['report']
+
+        results, error = None, None
+        try:
+            results, timings = future.result()
+            record_stage_timings(timings)
+        except BrokenExecutor as e:
+            _discard_executor('extract', workers)
+            error = f'提取进程异常退出: {e}'
+        except Exception as e:
+            error = str(e)
+        if error:
+            logger.error(f"Error processing {archive['name']}: {error}")
+            report('failed', error=error)
+
+        try:
+            archive['township'], archive['construction_unit'] = geocoded[index].result()
+        except Exception as e:
+            logger.error(f"Error geocoding {archive['name']}: {e}")
+        report('geocoded', township=archive['township'] or '', construction_unit=archive['construction_unit'] or '')
+
+        try:
+            with observe_stage('save'):
+                uploaded_file = _save_archive(archive, results, error)
+        except Exception as e:
+            logger.error(f"Error saving {archive['name']}: {e}")
+            report('failed', error=str(e))
+            ARCHIVES_PROCESSED.labels('failed').inc()
+            # 内容寻址存储中相同内容可能已被其他上传引用，按引用计数释放
+            _discard_archive(archive)
+            continue
+        # _save_archive 的事务已提交，引用计数包含本次上传，撤销标记
+        unpin_blob(default_storage, archive['pin'])
+        outcomes[index]['upload'] = uploaded_file
+        ARCHIVES_PROCESSED.labels('failed' if error else 'saved').inc()
+        if not error:
+            # 文档计数在请求进程中记录，未启用多进程指标时也不会丢失
+            record_documents(results or [])
+            report(
+                'saved',
+                upload_id=uploaded_file.id,
+                documents=uploaded_file.document_count,
+                url=reverse('dashboard_with_id', args=[uploaded_file.id]),
+            )
+
+    return outcomes
@@ -0,0 +1,159 @@
+import hashlib
+import os
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.files import File, locks
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+
+# 内容寻址的压缩包存放在存储下的该目录中：blobs/<前两位>/<sha256>.zip
+BLOB_DIR = 'blobs'
+# 存储锁与“待引用”标记：已保存（或复用）文件、但引用它的记录尚未提交时，标记阻止按引用计数删除
+PIN_DIR = 'blob_pins'
+# 超过该时长的标记视为进程异常退出后的残留，不再阻止删除
+PIN_MAX_AGE = 24 * 3600
+
+_READ_BLOCK = 1024 * 1024
+
+
+def blob_name(digest, ext='.zip'):
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{ext}'
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(f'{BLOB_DIR}/')
+
+
+@contextmanager
+def blob_lock(storage):
+    """跨进程的存储锁：“保存或复用文件并登记引用”与“检查引用计数后删除”互斥"""
+    directory = storage.path(PIN_DIR)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'ab') as f:
+        locks.lock(f, locks.LOCK_EX)
+        try:
+            yield
+        finally:
+            locks.unlock(f)
+
+
+def _pin_prefix(name):
+    return hashlib.sha256(name.encode()).hexdigest()[:32]
+
+
+def pin_blob(storage, name):
+    """为 name 登记一个待引用标记并返回标记名；应在 blob_lock 内、确认文件存在后调用"""
+    pin = f'{PIN_DIR}/{_pin_prefix(name)}.{uuid.uuid4().hex}'
+    open(storage.path(pin), 'wb').close()
+    return pin
+
+
+def unpin_blob(storage, pin):
+    """撤销 pin_blob 登记的标记；引用它的记录已提交（或确定不再写入）后调用"""
+    if pin:
+        try:
+            os.remove(storage.path(pin))
+        except FileNotFoundError:
+            pass
+
+
+def is_pinned(storage, name):
+    """name 是否还有未过期的待引用标记；过期的标记顺带删除"""
+    directory = storage.path(PIN_DIR)
+    prefix = f'{_pin_prefix(name)}.'
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.name.startswith(prefix)]
+    except FileNotFoundError:
+        return False
+    pinned = False
+    for entry in entries:
+        try:
+            if time.time() - entry.stat().st_mtime < PIN_MAX_AGE:
+                pinned = True
+            else:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+    return pinned
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """按内容 SHA-256 存放文件的 FileSystemStorage
+
+    忽略传入的文件名，边读边计算哈希，保存到 blobs/ab/<sha256>.zip 并返回该名称；
+    内容相同的上传共用同一个文件，已存在时不再写入。多条 UploadedFile 可以指向同一个文件，
+    删除时由 retention.release_archive() 按引用计数决定是否真正删除（本类的 delete 不做检查）。
+    上传流程用 save_pinned() 保存：复用已有文件与登记待引用标记在同一把锁内完成，
+    记录提交前相同内容的其他上传被删除也不会删掉这个文件。
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # 最终名称由内容决定，不需要为避免重名而改名
+        return name
+
+    def save_pinned(self, name, content):
+        """与 save() 相同，另返回待引用标记：(名称, 标记)
+
+        调用方在引用该文件的记录提交后（或放弃写入时）用 unpin_blob() 撤销标记。
+        """
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        validate_file_name(name, allow_relative_path=True)
+        return self._save_blob(name, content, pin=True)
+
+    def _save(self, name, content):
+        return self._save_blob(name, content)[0]
+
+    def _save_blob(self, name, content, pin=False):
+        ext = os.path.splitext(name)[1].lower() or '.zip'
+        if hasattr(content, 'temporary_file_path'):
+            # 已落盘的上传（TemporaryUploadedFile、分块上传拼好的文件）：只读一遍算哈希，再改名移入
+            source = content.temporary_file_path()
+            return self._commit(blob_name(file_sha256(source), ext), source, pin)
+
+        # 内存中的上传：写临时文件的同时计算哈希，内容重复时丢弃临时文件
+        tmp_dir = self.path(f'{BLOB_DIR}/tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    f.write(chunk)
+            return self._commit(blob_name(digest.hexdigest(), ext), tmp, pin)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _commit(self, name, source, pin):
+        # 已存在时复用；与 release_archive 的检查和删除互斥，复用的文件不会在登记标记前被删掉
+        with blob_lock(self):
+            final = self.path(name)
+            if not os.path.exists(final):
+                self._move_into(source, final)
+            return name, pin_blob(self, name) if pin else None
+
+    def _move_into(self, source, final):
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        try:
+            file_move_safe(source, final, allow_overwrite=False)
+        except FileExistsError:
+            # 并发上传了相同内容，对方已写好同一个文件
+            return
+        if self.file_permissions_mode is not None:
+            os.chmod(final, self.file_permissions_mode)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_READ_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
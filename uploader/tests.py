@@ -1,3 +1,2007 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import zipfile
+import xml.etree.ElementTree as ElementTree
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from urllib.error import URLError
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from . import readers, rules, scheduler, views
+from .audit import robust_scores
+from .downloads import parse_range_header
+from .exports import BUNDLE_MANIFEST_HEADERS, bundle_queryset, export_headers, export_queryset
+from .filters import filter_uploaded_files
+from .ingest import rematch_extracted_infos, update_extracted_infos, result_field_values, upsert_extracted_infos
+from .management.commands import reextract
+from .models import ConstructionRemark, ExtractedInfo, ReportSummary, RequestProfile, UploadedFile
+from .progress import emit_progress, read_events
+from .reporting import SUMMARY_VALUE_FIELDS, rebuild_summaries, track_summary_changes
+from .retention import due_for_cold, release_archive
+from .storage import PIN_DIR
+from .utils import extract_fields_from_text, extract_info_from_zip, format_beijing_datetime
+
+# 测试使用进程内缓存，避免读写项目目录下的文件缓存
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# EXPLAIN QUERY PLAN 中不带索引的全表扫描，例如 "SCAN uploader_extractedinfo"
+FULL_SCAN_RE = re.compile(r'\bSCAN (\w+)(?!\w| USING)')
+
+
+def seed_upload(index, documents=3, email_sent=False, remarks=0):
+    """创建一条已处理的上传及其提取结果；街道、施工单位、建设单号都已填好，GET 时不会访问高德接口"""
+    uploaded_file = UploadedFile.objects.create(
+        original_filename=f'EOSC_{index}_KC+集团{index}+地址{index}.zip',
+        file_type='zip',
+        group_name=f'集团{index}',
+        address=f'地址{index}',
+        township='五华街道',
+        construction_unit=f'施工队{index % 3}',
+        is_processed=True,
+        document_count=documents,
+    )
+    infos = ExtractedInfo.objects.bulk_create([
+        ExtractedInfo(
+            uploaded_file=uploaded_file,
+            order_code=f'EOSC_{index}_KC',
+            construction_order_code=f'EOSC_{index}_JS',
+            construction_email_sent=email_sent,
+            document_name=f'{index}_{n}.docx',
+            document_content=f'文档内容{index}_{n}',
+            extraction_status='成功',
+            total_fees=Decimal('120.50'),
+            fiber_info=[{'length': 100, 'description': '光缆', 'unit': '米'}],
+        )
+        for n in range(documents)
+    ])
+    ConstructionRemark.objects.bulk_create([
+        ConstructionRemark(extracted_info=info, content=f'备注{n}')
+        for info in infos
+        for n in range(remarks)
+    ])
+    return uploaded_file
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DashboardQueryCountTests(TestCase):
+    """仪表盘与批量接口的查询次数不应随数据量增长（缓存未命中时）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for index in range(60):
+            seed_upload(index, email_sent=index % 2 == 0, remarks=1)
+        cls.small = seed_upload(1000, documents=2, remarks=1)
+        cls.large = seed_upload(1001, documents=40, remarks=3)
+
+    def setUp(self):
+        cache.clear()
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_sidebar_history_query_count(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('dashboard'))
+
+    def test_filtered_sidebar_query_count(self):
+        url = reverse('dashboard') + '?q=集团&order_code=EOSC&construction_unit=施工队&start_date=2020-01-01&end_date=2099-12-31'
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertTrue(response.context['history_list'])
+
+    def test_detail_query_count(self):
+        with self.assertNumQueries(4):
+            self.client.get(reverse('dashboard_with_id', args=[self.large.id]))
+
+    def test_detail_query_count_does_not_grow_with_documents(self):
+        small = self._count_queries(reverse('dashboard_with_id', args=[self.small.id]))
+        large = self._count_queries(reverse('dashboard_with_id', args=[self.large.id]))
+        self.assertEqual(small, large)
+
+    def test_bulk_status_query_count_does_not_grow_with_ids(self):
+        def run(ids):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    reverse('bulk_update_construction_status'),
+                    data=json.dumps({'ids': ids, 'type': 'field_construction', 'action': 'set'}),
+                    content_type='application/json',
+                )
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        # 汇总表按 (月份, 施工单位, 街道) 分组维护，查询次数取决于涉及的分组数而不是行数，这里取同一分组内的行
+        rebuild_summaries()
+        ids = list(
+            ExtractedInfo.objects.filter(uploaded_file__construction_unit='施工队0').order_by('id').values_list('id', flat=True)
+        )
+        self.assertGreater(len(ids), 50)
+        self.assertEqual(run(ids[:5]), run(ids[5:]))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DashboardFragmentCacheTests(TestCase):
+    """结果面板与侧边栏片段缓存：命中时不查询，修改接口递增版本后重新渲染"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.uploaded_file = seed_upload(1, documents=3, remarks=1)
+        cls.other = seed_upload(2, documents=2)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('dashboard_with_id', args=[self.uploaded_file.id])
+
+    def post_json(self, name, pk, payload):
+        response = self.client.post(reverse(name, args=[pk]), data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_warm_detail_page_only_reads_upload(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertContains(response, '备注0')
+        self.assertContains(response, self.uploaded_file.original_filename)
+
+    def test_remark_add_and_delete_invalidate_results_panel(self):
+        self.client.get(self.url)
+        info = self.uploaded_file.extracted_infos.first()
+        remark_id = self.post_json('add_construction_remark', info.id, {'content': '机房已勘察'}).json()['remark']['id']
+        self.assertContains(self.client.get(self.url), '机房已勘察')
+
+        response = self.client.post(reverse('delete_construction_remark', args=[remark_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(self.client.get(self.url), '机房已勘察')
+
+    def test_info_endpoints_bump_only_their_upload(self):
+        info = self.uploaded_file.extracted_infos.first()
+        other_version = self.other.content_version
+        self.post_json('update_construction_order_code', info.id, {'construction_order_code': 'NEW_JS'})
+        self.post_json('update_resource_address', info.id, {'resource_address': '机房A'})
+        self.post_json('update_construction_status', info.id, {'type': 'field_construction', 'action': 'set'})
+        self.uploaded_file.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.uploaded_file.content_version, 3)
+        self.assertEqual(self.other.content_version, other_version)
+        self.assertContains(self.client.get(self.url), 'NEW_JS')
+
+    def test_bulk_endpoint_bumps_every_affected_upload(self):
+        ids = list(ExtractedInfo.objects.values_list('id', flat=True))
+        response = self.client.post(
+            reverse('bulk_update_construction_status'),
+            data=json.dumps({'ids': ids, 'type': 'field_construction', 'action': 'set'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(UploadedFile.objects.values_list('content_version', flat=True)), {1})
+
+    def test_mark_and_email_changes_invalidate_sidebar(self):
+        self.client.get(self.url)
+        # 侧边栏版本在事务提交后递增，TestCase 中需手动执行 on_commit 回调
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_json('toggle_upload_mark', self.uploaded_file.id, {})
+        self.assertContains(self.client.get(self.url), '☆')
+
+        filtered = reverse('dashboard') + '?construction_unit=施工队'
+        self.assertNotContains(self.client.get(filtered), self.other.original_filename)
+        info = self.other.extracted_infos.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_json('update_construction_email_sent', info.id, {'construction_email_sent': True})
+        self.assertContains(self.client.get(filtered), self.other.original_filename)
+
+
+def make_zip(documents):
+    """在内存中生成包含若干 .docx 的压缩包，documents: {文件名: [段落]}"""
+    import docx
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, lines in documents.items():
+            document = docx.Document()
+            for line in lines:
+                document.add_paragraph(line)
+            content = io.BytesIO()
+            document.save(content)
+            archive.writestr(name, content.getvalue())
+    return buffer.getvalue()
+
+
+class TempMediaMixin:
+    """上传文件写入临时目录"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.media_root = media_root
+
+
+# 进度事件写在进程内缓存中，提取放在请求线程里才能读到子流程的事件
+@override_settings(CACHES=TEST_CACHES, AMAP_API_KEY=None, UPLOAD_EXTRACT_WORKERS=0)
+class UploadProgressTests(TempMediaMixin, TestCase):
+    """上传进度事件：处理流程写入缓存，SSE 接口只读缓存"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def read_stream(self, token, **headers):
+        response = self.client.get(reverse('upload_progress', args=[token]), **headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_upload_emits_progress_for_each_archive(self):
+        token = 'test-token-1234'
+        lines = ['宽带维护费（含税）：100元', '维护费（含税）合计：100元']
+        files = [
+            SimpleUploadedFile('EOSC_1_KC+集团1+地址1.zip', make_zip({'a.docx': lines, 'b.docx': lines})),
+            SimpleUploadedFile('EOSC_2_KC+集团2+地址2.zip', make_zip({'c.docx': lines})),
+        ]
+        response = self.client.post(reverse('dashboard'), {'files': files, 'progress_token': token})
+        self.assertEqual(response.status_code, 302)
+
+        events = read_events(token)
+        names = [event for _, event, _ in events]
+        self.assertEqual(names[0], 'received')
+        self.assertEqual(names[-1], 'done')
+        self.assertEqual(names.count('saved'), 2)
+        self.assertEqual(names.count('geocoded'), 2)
+        documents = [data for _, event, data in events if event == 'document']
+        self.assertEqual(sorted((d['file'], d['current'], d['total']) for d in documents), [(1, 1, 2), (1, 2, 2), (2, 1, 1)])
+        # 写库顺序取决于完成先后，跳转目标固定为最后提交的文件
+        saved = {data['file']: data for _, event, data in events if event == 'saved'}
+        self.assertEqual(events[-1][2]['url'], saved[2]['url'])
+        self.assertEqual(response.url, saved[2]['url'])
+
+    def test_stream_replays_events_without_database_queries(self):
+        token = 'test-token-5678'
+        emit_progress(token, 'received', files=['a.zip'])
+        emit_progress(token, 'saved', file=1, upload_id=7)
+        emit_progress(token, 'done', url='/dashboard/7/')
+        with self.assertNumQueries(0):
+            body = self.read_stream(token)
+        self.assertIn('id: 1\nevent: received\ndata: {"files": ["a.zip"]}', body)
+        self.assertTrue(body.rstrip().endswith('data: {"url": "/dashboard/7/"}'))
+
+        # 断线重连只收到 Last-Event-ID 之后的事件
+        resumed = self.read_stream(token, HTTP_LAST_EVENT_ID='2')
+        self.assertNotIn('event: saved', resumed)
+        self.assertIn('id: 3\nevent: done', resumed)
+
+    def test_concurrent_emitters_get_distinct_sequence_numbers(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        file_cache = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+        token = 'test-token-race'
+        seqs = []
+
+        def emit(worker):
+            for n in range(25):
+                seqs.append(emit_progress(token, 'document', worker=worker, current=n))
+
+        # 各线程使用各自的缓存实例，与多个提取进程一样只通过缓存目录共享状态
+        with override_settings(CACHES=file_cache):
+            threads = [threading.Thread(target=emit, args=(worker,)) for worker in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            events = read_events(token)
+        self.assertEqual(sorted(seqs), list(range(1, 201)))
+        self.assertEqual(len({(data['worker'], data['current']) for _, _, data in events}), 200)
+
+    async def test_asgi_stream_waits_without_blocking_a_thread(self):
+        token = 'test-token-async'
+        await sync_to_async(emit_progress)(token, 'received', files=['a.zip'])
+
+        async def finish_later():
+            await asyncio.sleep(0.1)
+            await sync_to_async(emit_progress)(token, 'done', url='/dashboard/7/')
+
+        task = asyncio.create_task(finish_later())
+        # 等待新事件时只能让出事件循环，不能阻塞线程
+        with mock.patch('uploader.progress.time.sleep', side_effect=AssertionError('blocking sleep')):
+            response = await self.async_client.get(reverse('upload_progress', args=[token]))
+            self.assertTrue(response.is_async)
+            body = ''.join([chunk.decode('utf-8') async for chunk in response.streaming_content])
+        await task
+        self.assertIn('id: 1\nevent: received', body)
+        self.assertIn('id: 2\nevent: done', body)
+
+    def test_invalid_token_is_rejected(self):
+        response = self.client.get(reverse('upload_progress', args=['bad token!']))
+        self.assertEqual(response.status_code, 400)
+
+
+DOCUMENT_LINES = ['宽带维护费（含税）：100元', '维护费（含税）合计：100元']
+
+
+@override_settings(CACHES=TEST_CACHES, AMAP_API_KEY=None, UPLOAD_EXTRACT_WORKERS=2)
+class ConcurrentUploadTests(TempMediaMixin, TestCase):
+    """一次上传多个压缩包：进程池并发提取，消息与跳转目标按提交顺序确定"""
+
+    def upload(self, files):
+        return self.client.post(reverse('dashboard'), {'files': files})
+
+    def test_archives_are_processed_in_parallel_and_redirect_to_last_submitted(self):
+        files = [
+            SimpleUploadedFile('EOSC_1_KC+集团1+地址1.zip', make_zip({f'{n}.docx': DOCUMENT_LINES for n in range(3)})),
+            SimpleUploadedFile('说明.txt', b'not a zip'),
+            SimpleUploadedFile('EOSC_2_KC+集团2+地址2.zip', make_zip({'a.docx': DOCUMENT_LINES})),
+            SimpleUploadedFile('坏文件.zip', b'not a zip either'),
+        ]
+        response = self.upload(files)
+
+        uploads = {upload.original_filename: upload for upload in UploadedFile.objects.all()}
+        self.assertEqual(set(uploads), {'EOSC_1_KC+集团1+地址1.zip', 'EOSC_2_KC+集团2+地址2.zip', '坏文件.zip'})
+        self.assertEqual(uploads['EOSC_1_KC+集团1+地址1.zip'].extracted_infos.count(), 3)
+        self.assertEqual(uploads['EOSC_1_KC+集团1+地址1.zip'].group_name, '集团1')
+        self.assertEqual(uploads['EOSC_2_KC+集团2+地址2.zip'].extracted_infos.get().extraction_status, '成功')
+        self.assertEqual(uploads['坏文件.zip'].extracted_infos.get().extraction_status, '失败')
+        self.assertTrue(all(upload.is_processed for upload in uploads.values()))
+
+        self.assertRedirects(response, reverse('dashboard_with_id', args=[uploads['坏文件.zip'].id]), fetch_redirect_response=False)
+        messages = [str(message) for message in response.wsgi_request._messages]
+        self.assertEqual(messages, ['仅支持ZIP文件: 说明.txt'])
+
+    @override_settings(UPLOAD_EXTRACT_WORKERS=0)
+    def test_failed_write_leaves_no_partial_archive(self):
+        files = [SimpleUploadedFile('EOSC_3_KC+集团3+地址3.zip', make_zip({'a.docx': DOCUMENT_LINES, 'b.docx': DOCUMENT_LINES}))]
+        with mock.patch('uploader.scheduler.ingest_extracted_infos', side_effect=RuntimeError('disk full')):
+            response = self.upload(files)
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertFalse(UploadedFile.objects.exists())
+        self.assertFalse(ExtractedInfo.objects.exists())
+        # 存储锁文件不算存档
+        stored = [
+            name for path, _, names in os.walk(self.media_root) for name in names
+            if os.path.relpath(path, self.media_root) != PIN_DIR
+        ]
+        self.assertEqual(stored, [])
+
+
+def fake_amap(endpoint, params, timeout_seconds):
+    """代替 views._amap_fetch：地理编码返回坐标，逆地理编码返回五华街道"""
+    if endpoint.endswith('/geo'):
+        return {'status': '1', 'geocodes': [{'location': '102.7,25.0'}]}
+    return {'status': '1', 'regeocode': {'addressComponent': {'township': '五华街道'}}}
+
+
+@override_settings(CACHES=TEST_CACHES, AMAP_API_KEY='test-key', UPLOAD_EXTRACT_WORKERS=0)
+class AsyncGeocodeTests(TempMediaMixin, TestCase):
+    """异步街道解析：上传时在调度器的事件循环中执行，失败时与同步版本一样返回 None"""
+
+    def setUp(self):
+        super().setUp()
+        for target, value in [('uploader.views._amap_fetch', fake_amap), ('uploader.views._async_http_client', lambda: None)]:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_upload_geocodes_through_event_loop(self):
+        self.client.post(reverse('dashboard'), {'files': [SimpleUploadedFile('EOSC_1_KC+集团1+地址1.zip', make_zip({'a.docx': DOCUMENT_LINES}))]})
+        self.assertEqual(UploadedFile.objects.get().township, '五华街道')
+
+    async def test_async_lookup_matches_sync_and_swallows_errors(self):
+        self.assertEqual(await views.get_township_from_address_async('五华区+某路1号'), '五华街道')
+        self.assertEqual(views.get_township_from_address('五华区+某路1号'), '五华街道')
+        with mock.patch('uploader.views._amap_fetch', side_effect=URLError('timeout')):
+            self.assertIsNone(await views.get_township_from_address_async('五华区+某路1号'))
+        self.assertIsNone(await views.get_township_from_address_async(''))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AsyncEndpointTests(TestCase):
+    """小型 JSON 接口为异步视图，经 ASGI 请求链处理，结果与同步调用一致"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.uploaded_file = seed_upload(1, documents=2)
+
+    def setUp(self):
+        cache.clear()
+
+    async def post_json(self, name, pk, payload=None):
+        return await self.async_client.post(reverse(name, args=[pk]), json.dumps(payload or {}), content_type='application/json')
+
+    async def test_json_endpoints_under_asgi(self):
+        await sync_to_async(rebuild_summaries)()
+        info = await ExtractedInfo.objects.filter(uploaded_file=self.uploaded_file).order_by('id').afirst()
+        response = await self.post_json('toggle_upload_mark', self.uploaded_file.id)
+        self.assertEqual(response.json(), {'ok': True, 'is_marked': False})
+
+        response = await self.post_json('update_construction_status', info.id, {'type': 'completed', 'action': 'set'})
+        self.assertEqual(response.json()['error'], 'resource_address_required')
+        await self.post_json('update_resource_address', info.id, {'resource_address': '机房A'})
+        response = await self.post_json('update_construction_status', info.id, {'type': 'completed', 'action': 'set'})
+        self.assertTrue(response.json()['field_construction_at'])
+        self.assertTrue(response.json()['construction_completed_at'])
+
+        remark_id = (await self.post_json('add_construction_remark', info.id, {'content': '机房已勘察'})).json()['remark']['id']
+        self.assertEqual((await self.post_json('delete_construction_remark', remark_id)).status_code, 200)
+        self.assertEqual((await self.post_json('delete_construction_remark', remark_id)).status_code, 404)
+        self.assertEqual((await self.post_json('update_resource_address', 999999)).status_code, 404)
+
+        upload = await UploadedFile.objects.aget(id=self.uploaded_file.id)
+        self.assertFalse(upload.is_marked)
+        self.assertGreater(upload.content_version, self.uploaded_file.content_version)
+        # 进度变更在事务中增量维护汇总表，与全量重建一致
+        summaries = ReportSummary.objects.order_by('month', 'construction_unit', 'township').values_list('completed_count', 'field_construction_count', 'total_fees')
+        summary = [row async for row in summaries]
+        await sync_to_async(rebuild_summaries)()
+        self.assertEqual(summary, [row async for row in summaries])
+        self.assertEqual(summary[0][:2], (1, 1))
+
+    async def test_get_is_rejected(self):
+        response = await self.async_client.get(reverse('toggle_upload_mark', args=[self.uploaded_file.id]))
+        self.assertEqual(response.status_code, 405)
+
+
+def make_nested_zip():
+    """外层（无单号）/ 目录下的内层压缩包（带单号）/ 更深一层的压缩包"""
+    deeper = make_zip({'c.docx': DOCUMENT_LINES})
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('EOSC_1_KC.docx', zipfile.ZipFile(io.BytesIO(make_zip({'x.docx': DOCUMENT_LINES}))).read('x.docx'))
+        inner = io.BytesIO(make_zip({'b.docx': DOCUMENT_LINES}))
+        with zipfile.ZipFile(inner, 'a') as inner_archive:
+            inner_archive.writestr('deeper.zip', deeper)
+        # 内层压缩包以 deflate 压缩存放，读取时只能顺序解压
+        archive.writestr('folder/EOSC_9_KC+集团9.zip', inner.getvalue(), compress_type=zipfile.ZIP_DEFLATED)
+    return buffer.getvalue()
+
+
+@override_settings(CACHES=TEST_CACHES, AMAP_API_KEY=None, UPLOAD_EXTRACT_WORKERS=0)
+class NestedArchiveTests(TempMediaMixin, TestCase):
+    """压缩包中的内层 ZIP 以流方式逐层展开，不解压到磁盘"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def extract(self, **kwargs):
+        path = os.path.join(self.media_root, '批量.zip')
+        with open(path, 'wb') as f:
+            f.write(make_nested_zip())
+        with mock.patch.object(zipfile.ZipFile, 'extractall', side_effect=AssertionError('extractall')), \
+                mock.patch.object(zipfile.ZipFile, 'extract', side_effect=AssertionError('extract')):
+            return extract_info_from_zip(path, '批量.zip', **kwargs)
+
+    def test_nested_archives_are_walked_with_archive_path(self):
+        results = self.extract()
+        self.assertEqual(
+            [(r['archive_path'], r['file_name'], r['order_code'], r['extraction_status']) for r in results],
+            [
+                ('', 'EOSC_1_KC.docx', 'EOSC_1_KC', '成功'),
+                ('folder/EOSC_9_KC+集团9.zip', 'b.docx', 'EOSC_9_KC', '成功'),
+                ('folder/EOSC_9_KC+集团9.zip/deeper.zip', 'c.docx', 'EOSC_9_KC', '成功'),
+            ],
+        )
+        self.assertTrue(all(r['maintenance_fee'] == 100 for r in results))
+
+    def test_archives_beyond_depth_limit_are_reported(self):
+        results = self.extract(max_depth=1)
+        self.assertEqual(len(results), 3)
+        self.assertEqual((results[2]['archive_path'], results[2]['file_name']), ('folder/EOSC_9_KC+集团9.zip', 'deeper.zip'))
+        self.assertEqual(results[2]['extraction_status'], '失败')
+        self.assertIn('超过 1 层', results[2]['error'])
+
+    def test_upload_stores_archive_path(self):
+        self.client.post(reverse('dashboard'), {'files': [SimpleUploadedFile('批量.zip', make_nested_zip())]})
+        upload = UploadedFile.objects.get()
+        self.assertEqual(
+            list(upload.extracted_infos.order_by('id').values_list('archive_path', 'document_name')),
+            [('', 'EOSC_1_KC.docx'), ('folder/EOSC_9_KC+集团9.zip', 'b.docx'), ('folder/EOSC_9_KC+集团9.zip/deeper.zip', 'c.docx')],
+        )
+        response = self.client.get(reverse('dashboard_with_id', args=[upload.id]))
+        self.assertContains(response, 'folder/EOSC_9_KC+集团9.zip/deeper.zip / c.docx')
+
+
+class ExtractDirCommandTests(SimpleTestCase):
+    """extract_dir 离线批量提取：输出 JSONL，不访问数据库（SimpleTestCase 中访问数据库会直接报错）"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        os.makedirs(os.path.join(self.root, 'sub'))
+        for name, content in [
+            ('EOSC_1_KC+集团1.zip', make_zip({'a.docx': DOCUMENT_LINES, 'b.docx': DOCUMENT_LINES})),
+            ('sub/批量.zip', make_nested_zip()),
+            ('sub/坏文件.zip', b'not a zip'),
+            ('sub/说明.txt', b'skip'),
+        ]:
+            with open(os.path.join(self.root, name), 'wb') as f:
+                f.write(content)
+
+    def test_writes_one_line_per_document_and_summary(self):
+        output = os.path.join(self.root, 'out.jsonl')
+        stdout = io.StringIO()
+        call_command('extract_dir', self.root, output=output, workers=0, no_content=True, stdout=stdout)
+        with open(output, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(
+            [(line['zip'], line['file_name'], line['extraction_status']) for line in lines],
+            [
+                ('EOSC_1_KC+集团1.zip', 'a.docx', '成功'),
+                ('EOSC_1_KC+集团1.zip', 'b.docx', '成功'),
+                ('sub/坏文件.zip', '坏文件.zip', '失败'),
+                ('sub/批量.zip', 'EOSC_1_KC.docx', '成功'),
+                ('sub/批量.zip', 'b.docx', '成功'),
+                ('sub/批量.zip', 'c.docx', '成功'),
+            ],
+        )
+        self.assertEqual(lines[0]['maintenance_fee'], 100)
+        self.assertNotIn('document_content', lines[0])
+        self.assertIn('处理 3 个压缩包', stdout.getvalue())
+        self.assertIn('6 个文档（提取失败 1 个）', stdout.getvalue())
+
+    def test_streams_to_stdout_with_summary_on_stderr(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('extract_dir', os.path.join(self.root, 'EOSC_1_KC+集团1.zip'), workers=0, stdout=stdout, stderr=stderr)
+        lines = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual([line['zip'] for line in lines], ['EOSC_1_KC+集团1.zip'] * 2)
+        self.assertTrue(lines[0]['document_content'])
+        self.assertIn('2 个文档', stderr.getvalue())
+
+
+@override_settings(CACHES=TEST_CACHES, AMAP_API_KEY=None, UPLOAD_EXTRACT_WORKERS=0, UPLOAD_INGEST_MODE='upsert')
+class UpsertIngestTests(TempMediaMixin, TestCase):
+    """同一单号重新上传：按 (单号, 文档名) 原地更新提取字段，保留人工录入的信息"""
+
+    NAME = 'EOSC_7_KC+集团7+地址7.zip'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def upload(self, documents):
+        self.client.post(reverse('dashboard'), {'files': [SimpleUploadedFile(self.NAME, make_zip(documents))]})
+        return UploadedFile.objects.latest('id')
+
+    def test_reupload_updates_rows_in_place(self):
+        first = self.upload({'a.docx': DOCUMENT_LINES, 'b.docx': DOCUMENT_LINES})
+        info = first.extracted_infos.get(document_name='a.docx')
+        info.construction_order_code = '人工单号'
+        info.field_construction_at = first.uploaded_at
+        info.resource_address = '机房A'
+        info.save()
+        ConstructionRemark.objects.create(extracted_info=info, content='机房已勘察')
+        rebuild_summaries()
+
+        corrected = ['宽带维护费（含税）：200元', '维护费（含税）合计：200元']
+        second = self.upload({'a.docx': corrected, 'c.docx': DOCUMENT_LINES})
+
+        self.assertEqual(ExtractedInfo.objects.count(), 3)
+        info.refresh_from_db()
+        self.assertEqual(info.uploaded_file_id, second.id)
+        self.assertEqual(info.maintenance_fee, Decimal('200.00'))
+        self.assertEqual(info.construction_order_code, '人工单号')
+        self.assertEqual(info.resource_address, '机房A')
+        self.assertIsNotNone(info.field_construction_at)
+        self.assertEqual(list(info.remarks.values_list('content', flat=True)), ['机房已勘察'])
+        # 新上传中没有的文档仍留在原上传下
+        self.assertEqual(list(first.extracted_infos.values_list('document_name', flat=True)), ['b.docx'])
+        first.refresh_from_db()
+        self.assertEqual(first.document_count, 1)
+        self.assertEqual(sorted(second.extracted_infos.values_list('document_name', flat=True)), ['a.docx', 'c.docx'])
+
+        # 增量维护的汇总表与全量重建一致
+        incremental = sorted(ReportSummary.objects.values_list('month', 'construction_unit', 'township', 'document_count', 'total_fees', 'field_construction_count'))
+        rebuild_summaries()
+        self.assertEqual(incremental, sorted(ReportSummary.objects.values_list('month', 'construction_unit', 'township', 'document_count', 'total_fees', 'field_construction_count')))
+
+    def test_unchanged_fields_are_not_written(self):
+        self.upload({'a.docx': DOCUMENT_LINES})
+        with CaptureQueriesContext(connection) as queries:
+            second = self.upload({'a.docx': DOCUMENT_LINES})
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "uploader_extractedinfo"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"uploaded_file_id"', updates[0])
+        self.assertNotIn('"maintenance_fee"', updates[0])
+        self.assertEqual(ExtractedInfo.objects.get().uploaded_file_id, second.id)
+
+    def test_unknown_order_code_placeholders_are_not_merged(self):
+        for _ in range(2):
+            self.client.post(reverse('dashboard'), {'files': [SimpleUploadedFile('坏文件.zip', b'not a zip')]})
+        infos = list(ExtractedInfo.objects.order_by('id'))
+        self.assertEqual([info.order_code for info in infos], ['未知', '未知'])
+        # 两次无关的失败各自保留在自己的上传下
+        self.assertEqual(len({info.uploaded_file_id for info in infos}), 2)
+
+    def test_candidates_are_read_in_the_write_transaction(self):
+        first = self.upload({'a.docx': DOCUMENT_LINES})
+        second = UploadedFile.objects.create(original_filename=self.NAME, file_type='zip')
+        result = {'order_code': 'EOSC_7_KC', 'file_name': 'a.docx', 'extraction_status': '成功', 'maintenance_fee': 200}
+        outer = set(connection.savepoint_ids)
+        savepoints = {}
+
+        def record(execute, sql, params, many, context):
+            if sql.startswith('SELECT') and '"order_code" IN' in sql:
+                # atomic(savepoint=False)（如 bulk_update 内部）记为 None，不是新的保存点
+                savepoints['read'] = [sid for sid in connection.savepoint_ids if sid][-1]
+            elif sql.startswith('UPDATE "uploader_extractedinfo"'):
+                savepoints['write'] = list(connection.savepoint_ids)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            stats = upsert_extracted_infos(second, [result])
+        self.assertEqual(stats['moved'], 1)
+        self.assertFalse(first.extracted_infos.exists())
+        # 候选行在本次合并自己开启的事务中读取，认领写入时该事务仍未提交
+        self.assertNotIn(savepoints['read'], outer)
+        self.assertIn(savepoints['read'], savepoints['write'])
+
+    @override_settings(UPLOAD_INGEST_MODE='append')
+    def test_append_mode_keeps_duplicates(self):
+        self.upload({'a.docx': DOCUMENT_LINES})
+        self.upload({'a.docx': DOCUMENT_LINES})
+        self.assertEqual(ExtractedInfo.objects.count(), 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReportSummaryTests(TestCase):
+    """汇总表增量维护：单条修改、批量操作、删除之后都与全量重建的结果一致"""
+
+    SUMMARY_FIELDS = ['month', 'construction_unit', 'township', *SUMMARY_VALUE_FIELDS]
+
+    def setUp(self):
+        cache.clear()
+        self.uploads = [seed_upload(index) for index in range(4)]
+        ExtractedInfo.objects.filter(uploaded_file=self.uploads[1]).update(total_fees=Decimal('88.00'), overall_total_price=Decimal('300.00'))
+        rebuild_summaries()
+        self.info_ids = list(ExtractedInfo.objects.order_by('id').values_list('id', flat=True))
+
+    def summaries(self):
+        return sorted(ReportSummary.objects.values_list(*self.SUMMARY_FIELDS))
+
+    def assertMatchesRebuild(self):
+        incremental = self.summaries()
+        rebuild_summaries()
+        self.assertEqual(incremental, self.summaries())
+
+    def post(self, name, payload, *args):
+        response = self.client.post(reverse(name, args=args), json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_single_updates(self):
+        info_id = self.info_ids[0]
+        self.post('update_construction_status', {'type': 'field_construction', 'action': 'set'}, info_id)
+        self.post('update_resource_address', {'resource_address': '机房A'}, info_id)
+        self.post('update_construction_status', {'type': 'resource_entry', 'action': 'set'}, info_id)
+        self.post('update_construction_status', {'type': 'completed', 'action': 'set'}, info_id)
+        self.post('update_construction_email_sent', {'construction_email_sent': True}, self.info_ids[1])
+        self.post('update_construction_unit', {'construction_unit': '施工队9'}, self.uploads[2].id)
+        self.assertMatchesRebuild()
+        self.post('update_construction_status', {'type': 'field_construction', 'action': 'unset'}, info_id)
+        self.assertMatchesRebuild()
+
+    def test_bulk_actions(self):
+        self.post('bulk_update_construction_status', {'ids': self.info_ids, 'type': 'field_construction', 'action': 'set'})
+        self.post('bulk_update_construction_email_sent', {'ids': self.info_ids[:5], 'construction_email_sent': True})
+        self.assertMatchesRebuild()
+        self.post('bulk_update_construction_status', {'ids': self.info_ids[2:], 'type': 'field_construction', 'action': 'unset'})
+        self.post('bulk_update_construction_email_sent', {'ids': self.info_ids[:2], 'construction_email_sent': False})
+        self.assertMatchesRebuild()
+
+    def test_deletes(self):
+        ExtractedInfo.objects.filter(id=self.info_ids[0]).update(field_construction_at=timezone.now())
+        rebuild_summaries()
+        ExtractedInfo.objects.get(id=self.info_ids[0]).delete()
+        self.assertMatchesRebuild()
+        # 删除上传时级联删除的提取结果同样从汇总表中减去，分组清空后不留空行
+        self.uploads[1].delete()
+        self.assertMatchesRebuild()
+        UploadedFile.objects.filter(id__in=[self.uploads[0].id, self.uploads[3].id]).delete()
+        self.assertMatchesRebuild()
+        self.assertEqual(
+            sorted(ReportSummary.objects.values_list('construction_unit', 'document_count')),
+            [('施工队2', 3)],
+        )
+
+    def test_snapshot_is_taken_in_the_write_transaction(self):
+        outer = set(connection.savepoint_ids)
+        savepoints = {}
+
+        def record(execute, sql, params, many, context):
+            if sql.startswith('SELECT') and 'uploader_extractedinfo' in sql and 'read' not in savepoints:
+                savepoints['read'] = [sid for sid in connection.savepoint_ids if sid][-1]
+            elif sql.startswith('UPDATE "uploader_reportsummary"'):
+                savepoints['apply'] = list(connection.savepoint_ids)
+            return execute(sql, params, many, context)
+
+        queryset = ExtractedInfo.objects.filter(id=self.info_ids[0])
+        with connection.execute_wrapper(record):
+            with track_summary_changes(queryset):
+                queryset.update(field_construction_at=timezone.now())
+        # 快照在 track_summary_changes 自己开启的事务中读取，累加差值时该事务仍未提交
+        self.assertNotIn(savepoints['read'], outer)
+        self.assertIn(savepoints['read'], savepoints['apply'])
+        self.assertMatchesRebuild()
+
+
+@override_settings(CACHES=TEST_CACHES, AMAP_API_KEY=None, UPLOAD_EXTRACT_WORKERS=0)
+class ReextractCommandTests(TempMediaMixin, TestCase):
+    """reextract：在 spawn 进程池中重新提取，原地更新提取字段，中断后按断点继续"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.checkpoint = os.path.join(self.media_root, 'reextract.json')
+
+    def upload(self, name):
+        self.client.post(reverse('dashboard'), {'files': [SimpleUploadedFile(name, make_zip({'a.docx': DOCUMENT_LINES}))]})
+        return UploadedFile.objects.latest('id')
+
+    def reextract(self, *ids):
+        call_command(
+            'reextract', ids=list(ids), workers=1, checkpoint=self.checkpoint,
+            stdout=io.StringIO(), stderr=io.StringIO(),
+        )
+
+    def test_updates_extracted_fields_and_keeps_user_edits(self):
+        upload = self.upload('EOSC_1_KC+集团1+地址1.zip')
+        info = upload.extracted_infos.get()
+        ExtractedInfo.objects.filter(id=info.id).update(
+            maintenance_fee=0, rules_version='旧规则',
+            construction_order_code='人工单号', resource_address='机房A', field_construction_at=timezone.now(),
+        )
+        ConstructionRemark.objects.create(extracted_info=info, content='机房已勘察')
+
+        self.reextract(upload.id)
+
+        info.refresh_from_db()
+        self.assertEqual(info.maintenance_fee, Decimal('100.00'))
+        self.assertNotEqual(info.rules_version, '旧规则')
+        self.assertEqual(info.construction_order_code, '人工单号')
+        self.assertEqual(info.resource_address, '机房A')
+        self.assertIsNotNone(info.field_construction_at)
+        self.assertEqual(list(info.remarks.values_list('content', flat=True)), ['机房已勘察'])
+        self.assertEqual(upload.extracted_infos.count(), 1)
+        # 全部成功后删除断点文件
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def overwrite_archive(self, upload, content):
+        with open(upload.file.path, 'wb') as f:
+            f.write(content)
+
+    def assert_rows_kept(self, upload, info):
+        self.assertEqual(list(upload.extracted_infos.values_list('id', flat=True)), [info.id])
+        kept = upload.extracted_infos.get()
+        self.assertEqual((kept.total_fees, kept.doc_maintenance_total), (info.total_fees, info.doc_maintenance_total))
+        self.assertEqual((kept.document_content, kept.extraction_status), (info.document_content, '成功'))
+
+    def test_failed_documents_keep_existing_results(self):
+        upload = self.upload('EOSC_1_KC+集团1+地址1.zip')
+        info = upload.extracted_infos.get()
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('a.docx', b'not a docx')
+        self.overwrite_archive(upload, buffer.getvalue())
+
+        with self.assertRaises(CommandError):
+            self.reextract(upload.id)
+        self.assert_rows_kept(upload, info)
+        upload.refresh_from_db()
+        self.assertIsNone(upload.processing_error)
+        # 失败的上传留在断点文件中，重新运行时再次尝试
+        with open(self.checkpoint, encoding='utf-8') as f:
+            self.assertIn(str(upload.id), json.load(f)['failed'])
+
+    def test_unreadable_archive_records_error_and_keeps_rows(self):
+        upload = self.upload('EOSC_1_KC+集团1+地址1.zip')
+        info = upload.extracted_infos.get()
+        self.overwrite_archive(upload, b'not a zip')
+
+        with self.assertRaises(CommandError):
+            self.reextract(upload.id)
+        self.assert_rows_kept(upload, info)
+        upload.refresh_from_db()
+        self.assertIn('不是有效的ZIP文件', upload.processing_error)
+
+    def test_empty_results_do_not_overwrite_existing_rows(self):
+        upload = seed_upload(1, documents=2)
+        first, second = upload.extracted_infos.order_by('id')
+        results = [
+            # 没有 .doc 读取后端时：状态为成功，但没有文本、费用为 0
+            {'order_code': first.order_code, 'file_name': first.document_name, 'document_content': '', 'normalized_text': ''},
+            {'order_code': second.order_code, 'file_name': second.document_name, 'extraction_status': '失败', 'error': '读取超时'},
+            {'order_code': second.order_code, 'file_name': '新文档.docx', 'extraction_status': '失败', 'error': '读取超时'},
+        ]
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = update_extracted_infos(upload, results)
+        self.assertEqual(stats, {'created': 1, 'updated': 0, 'unchanged': 0, 'stale': 0, 'failed': 2})
+        for info in (first, second):
+            kept = ExtractedInfo.objects.get(pk=info.pk)
+            self.assertEqual((kept.total_fees, kept.document_content), (info.total_fees, info.document_content))
+        # 新出现的文档照常新建（失败行）
+        self.assertEqual(upload.extracted_infos.get(document_name='新文档.docx').extraction_status, '失败')
+
+    def test_resumes_from_checkpoint(self):
+        first = self.upload('EOSC_1_KC+集团1+地址1.zip')
+        second = self.upload('EOSC_2_KC+集团2+地址2.zip')
+        update = reextract.update_extracted_infos
+
+        def fail_second(uploaded_file, results):
+            if uploaded_file.id == second.id:
+                raise RuntimeError('中断')
+            return update(uploaded_file, results)
+
+        with mock.patch.object(reextract, 'update_extracted_infos', side_effect=fail_second):
+            with self.assertRaises(CommandError):
+                self.reextract(first.id, second.id)
+        with open(self.checkpoint, encoding='utf-8') as f:
+            state = json.load(f)
+        self.assertEqual(state['done'], [first.id])
+        self.assertEqual(list(state['failed']), [str(second.id)])
+
+        # 重新运行只处理上次未完成的上传
+        with mock.patch.object(reextract, 'update_extracted_infos', wraps=update) as resumed:
+            self.reextract(first.id, second.id)
+        self.assertEqual([call.args[0].id for call in resumed.call_args_list], [second.id])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RematchTests(TestCase):
+    """只重跑匹配规则：值未变的行不写，规则版本落后的只改版本，值变化的行只写变化的字段"""
+
+    TEXT = '宽带维护费（含税）：100元维护费（含税）合计：100元'
+
+    def setUp(self):
+        cache.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.values = result_field_values(extract_fields_from_text(self.TEXT))
+        self.upload = UploadedFile.objects.create(original_filename='EOSC_1_KC+集团1+地址1.zip', is_processed=True)
+        self.current = self.create('current.docx')
+        self.outdated = self.create('outdated.docx', rules_version='旧规则')
+        self.changed = self.create('changed.docx', maintenance_fee=Decimal('80.00'), total_fees=Decimal('80.00'), verification_passed=False)
+        self.legacy = self.create('legacy.docx', normalized_text=None, document_content='宽带维护费（含税）： 100元\n维护费（含税）合计：100 元')
+
+    def create(self, name, **overrides):
+        fields = {**self.values, 'normalized_text': self.TEXT, 'document_content': self.TEXT, **overrides}
+        return ExtractedInfo.objects.create(uploaded_file=self.upload, document_name=name, **fields)
+
+    def rematch(self):
+        table = ExtractedInfo._meta.db_table
+        with CaptureQueriesContext(connection) as queries, contextlib.redirect_stdout(io.StringIO()):
+            stats = rematch_extracted_infos(ExtractedInfo.objects.order_by('id'))
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith(f'UPDATE "{table}"')]
+        return stats, updates
+
+    def written_ids(self, updates):
+        return {int(pk) for sql in updates for pk in re.findall(r'"id" IN \(([\d, ]+)\)', sql)[0].split(',')}
+
+    def test_only_changed_rows_are_written(self):
+        stats, updates = self.rematch()
+        self.assertEqual(stats, {'scanned': 4, 'updated': 2, 'version_only': 1, 'unchanged': 1})
+        self.assertEqual(self.written_ids(updates), {self.outdated.id, self.changed.id, self.legacy.id})
+
+        # 版本落后的行只更新 rules_version
+        version_only = [sql for sql in updates if f'IN ({self.outdated.id})' in sql]
+        self.assertEqual(len(version_only), 1)
+        self.assertEqual(re.findall(r'SET "(\w+)"', version_only[0]), ['rules_version'])
+        # 值变化的行只写回变化的字段
+        changed = [sql for sql in updates if f'= {self.changed.id})' in sql]
+        self.assertTrue(changed)
+        for sql in changed:
+            self.assertNotIn('"service_fee"', sql)
+            self.assertNotIn('"fiber_info"', sql)
+
+        self.changed.refresh_from_db()
+        self.assertEqual((self.changed.maintenance_fee, self.changed.total_fees), (Decimal('100.00'), Decimal('100.00')))
+        self.assertTrue(self.changed.verification_passed)
+        self.outdated.refresh_from_db()
+        self.assertEqual(self.outdated.rules_version, self.values['rules_version'])
+        # 旧数据现场归一化并补存
+        self.legacy.refresh_from_db()
+        self.assertEqual(self.legacy.normalized_text, self.TEXT)
+
+    def test_second_run_writes_nothing(self):
+        self.rematch()
+        stats, updates = self.rematch()
+        self.assertEqual(stats, {'scanned': 4, 'updated': 0, 'version_only': 0, 'unchanged': 4})
+        self.assertEqual(updates, [])
+
+    def test_command_outdated_skips_current_rows(self):
+        out = io.StringIO()
+        call_command('rematch', outdated=True, verbosity=0, stdout=out)
+        self.assertIn('待匹配提取结果: 1', out.getvalue())
+        self.outdated.refresh_from_db()
+        self.assertEqual(self.outdated.rules_version, self.values['rules_version'])
+        self.changed.refresh_from_db()
+        self.assertEqual(self.changed.maintenance_fee, Decimal('80.00'))
+
+
+class ExtractionRulesTests(SimpleTestCase):
+    """提取规则：按 priority 依次尝试；规则文件 version 改变后替换，同版本或不合法的修改不生效"""
+
+    TEXT = '宽带维护费（含税）：100元宽带维护费：300元'
+
+    def setUp(self):
+        with open(rules.DEFAULT_RULES_PATH, encoding='utf-8') as f:
+            self.data = json.load(f)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'rules.json')
+        self.writes = 0
+        override = override_settings(EXTRACTION_RULES_PATH=self.path)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def write_rules(self, version, patterns):
+        data = {**self.data, 'version': version, 'fields': {
+            **self.data['fields'],
+            'maintenance_fee': {'label': '宽带维护费', 'patterns': patterns},
+        }}
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        # 两次写入可能落在同一时间刻度内，显式设置递增的修改时间
+        self.writes += 1
+        os.utime(self.path, (self.writes, self.writes))
+
+    def get_rules(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return rules.get_rules()
+
+    def maintenance_fee(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            info = extract_fields_from_text(self.TEXT)
+        return info['maintenance_fee'], info['rules_version']
+
+    def test_patterns_are_tried_by_priority_then_file_order(self):
+        compiled = rules.compile_rules({**self.data, 'fields': {**self.data['fields'], 'maintenance_fee': {'patterns': [
+            {'priority': 20, 'pattern': 'a'},
+            {'priority': 10, 'pattern': 'b'},
+            {'pattern': 'c'},
+            {'priority': 10, 'pattern': 'd'},
+        ]}}})
+        self.assertEqual([p.pattern for p in compiled.patterns('maintenance_fee')], ['c', 'b', 'd', 'a'])
+
+        self.write_rules('1', [
+            {'priority': 20, 'pattern': '宽带维护费（含税）：(\\d+)元'},
+            {'priority': 10, 'pattern': '宽带维护费：(\\d+)元'},
+        ])
+        self.assertEqual(self.maintenance_fee(), (300.0, '1'))
+
+    def test_rules_are_swapped_when_version_changes(self):
+        self.write_rules('1', [{'priority': 10, 'pattern': '宽带维护费（含税）：(\\d+)元'}])
+        first = self.get_rules()
+        self.assertEqual(self.maintenance_fee(), (100.0, '1'))
+
+        # 同一版本号下修改规则不会重新编译
+        self.write_rules('1', [{'priority': 10, 'pattern': '宽带维护费：(\\d+)元'}])
+        self.assertIs(self.get_rules(), first)
+        self.assertEqual(self.maintenance_fee(), (100.0, '1'))
+
+        self.write_rules('2', [{'priority': 10, 'pattern': '宽带维护费：(\\d+)元'}])
+        second = self.get_rules()
+        self.assertIsNot(second, first)
+        self.assertEqual(self.maintenance_fee(), (300.0, '2'))
+        # 已取得的旧规则对象不受替换影响
+        self.assertEqual(first.patterns('maintenance_fee')[0].pattern, '宽带维护费（含税）：(\\d+)元')
+
+    def test_invalid_rules_keep_the_previous_version(self):
+        self.write_rules('1', [{'priority': 10, 'pattern': '宽带维护费（含税）：(\\d+)元'}])
+        self.assertEqual(self.maintenance_fee(), (100.0, '1'))
+        self.write_rules('3', [{'priority': 10, 'pattern': '宽带维护费：(\\d+元'}])
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(rules.current_rules_version(), '1')
+        self.assertIn('继续使用版本 1', out.getvalue())
+        self.assertEqual(self.maintenance_fee(), (100.0, '1'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FeeAuditTests(TestCase):
+    """费用审计：批量重新验算，并按施工单位、街道与同类文档比较每米费用"""
+
+    def setUp(self):
+        cache.clear()
+        self.peers = UploadedFile.objects.create(original_filename='同组.zip', township='五华街道', construction_unit='施工队1')
+        self.other = UploadedFile.objects.create(original_filename='其他.zip', township='盘龙街道', construction_unit='施工队2')
+        infos = [
+            ExtractedInfo(
+                uploaded_file=self.peers, document_name=f'{n}.docx', extraction_status='成功',
+                total_fees=Decimal(100 + n), doc_maintenance_total=Decimal(100 + n),
+                fiber_info=[{'length': 100 + n * 2, 'unit': '米'}],
+            )
+            for n in range(10)
+        ]
+        # 每米费用是同组的十倍
+        infos.append(ExtractedInfo(
+            uploaded_file=self.peers, document_name='贵.docx', extraction_status='成功',
+            total_fees=Decimal('1000.00'), fiber_info=[{'length': 100, 'unit': '米'}],
+        ))
+        # 同样的费用放在另一组，同组样本不足，不打分
+        infos.append(ExtractedInfo(
+            uploaded_file=self.other, document_name='单独.docx', extraction_status='成功',
+            total_fees=Decimal('1000.00'), fiber_info=[{'length': 100, 'unit': '米'}],
+        ))
+        ExtractedInfo.objects.bulk_create(infos)
+
+    def audit(self, **options):
+        out = io.StringIO()
+        call_command('audit_fees', stdout=out, **options)
+        return out.getvalue()
+
+    def test_flags_outlier_and_recomputes_verification(self):
+        version = self.peers.content_version
+        self.audit()
+        flagged = ExtractedInfo.objects.get(fee_anomaly=True)
+        self.assertEqual(flagged.document_name, '贵.docx')
+        self.assertGreater(flagged.fee_anomaly_score, 3.5)
+        self.assertIsNone(ExtractedInfo.objects.get(document_name='单独.docx').fee_anomaly_score)
+        self.assertEqual(ExtractedInfo.objects.filter(verification_passed=True).count(), 10)
+        self.peers.refresh_from_db()
+        self.assertGreater(self.peers.content_version, version)
+
+        # 结果不变时不再写入
+        self.assertIn('更新 0 条', self.audit())
+
+    def test_version_bumps_are_deduplicated_and_chunked(self):
+        # 另一组的结果验算状态过期，重新验算后会改变
+        ExtractedInfo.objects.filter(document_name='单独.docx').update(verification_passed=True)
+        with mock.patch('uploader.audit.BULK_BATCH_SIZE', 1), \
+                mock.patch('uploader.audit.bump_upload_versions') as bump:
+            self.audit()
+        # 12 行结果只涉及 2 个上传，每次最多 1 个 id
+        self.assertEqual(sorted(call.args[0] for call in bump.call_args_list), [[self.peers.id], [self.other.id]])
+
+    def test_dry_run_writes_nothing(self):
+        output = self.audit(dry_run=True)
+        self.assertIn('贵.docx', output)
+        self.assertFalse(ExtractedInfo.objects.filter(fee_anomaly=True).exists())
+        self.assertFalse(ExtractedInfo.objects.filter(verification_passed=True).exists())
+
+    def test_robust_scores_match_per_group_median(self):
+        metric = np.array([1.0, 2.0, 3.0, 4.0, 100.0, 5.0, 5.0, 5.0])
+        groups = np.array([0, 0, 0, 0, 0, 1, 1, 1])
+        scores = robust_scores(metric, groups, np.ones(8, dtype=bool), min_peers=3)
+        # 第 0 组中位数 3、MAD 1；第 1 组取值完全相同，无法打分
+        np.testing.assert_allclose(scores[:5], 0.6745 * (metric[:5] - 3))
+        self.assertTrue(np.isnan(scores[5:]).all())
+
+
+@override_settings(CACHES=TEST_CACHES, AMAP_API_KEY=None, UPLOAD_EXTRACT_WORKERS=0)
+class RetentionTests(TempMediaMixin, TestCase):
+    """保留策略：旧压缩包分批迁移到冷存储并重新压缩，下载对两个层级透明"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.cold_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cold_root, ignore_errors=True)
+        cold = override_settings(RETENTION_COLD_ROOT=self.cold_root)
+        cold.enable()
+        self.addCleanup(cold.disable)
+
+        self.contents = {}
+        for name, content in [
+            ('EOSC_1_KC+集团1+地址1.zip', make_zip({'a.docx': DOCUMENT_LINES * 50, 'b.docx': DOCUMENT_LINES})),
+            ('EOSC_2_KC+集团2+地址2.zip', make_zip({'a.docx': DOCUMENT_LINES * 50})),
+            ('坏文件.zip', b'not a zip'),
+        ]:
+            self.contents[name] = content
+            self.client.post(reverse('dashboard'), {'files': [SimpleUploadedFile(name, content)]})
+        UploadedFile.objects.update(uploaded_at=timezone.now() - timedelta(days=200))
+        UploadedFile.objects.create(original_filename='新上传.zip', file='uploads/new.zip')
+
+    def retention(self, **options):
+        out = io.StringIO()
+        call_command('apply_retention', days=180, stdout=out, stderr=io.StringIO(), **options)
+        return out.getvalue()
+
+    def test_moves_in_bounded_batches_and_serves_both_tiers(self):
+        self.retention(batch_size=2, max_batches=1)
+        self.assertEqual(UploadedFile.objects.filter(storage_tier='cold').count(), 2)
+        self.retention(batch_size=2)
+        self.assertEqual(UploadedFile.objects.filter(storage_tier='cold').count(), 3)
+        self.assertEqual(UploadedFile.objects.get(original_filename='新上传.zip').storage_tier, 'hot')
+
+        for upload in UploadedFile.objects.filter(storage_tier='cold'):
+            self.assertIsNotNone(upload.archived_at)
+            self.assertFalse(os.path.exists(os.path.join(self.media_root, upload.file.name)))
+            response = self.client.get(reverse('download_file', args=[upload.id]))
+            self.assertEqual(response.status_code, 200)
+            body = b''.join(response.streaming_content)
+            original = self.contents[upload.original_filename]
+            if upload.original_filename == '坏文件.zip':
+                # 无法重新压缩的原样保存
+                self.assertEqual(body, original)
+                continue
+            # 重新压缩后更小，成员内容不变
+            self.assertLess(len(body), len(original))
+            with zipfile.ZipFile(io.BytesIO(body)) as cold, zipfile.ZipFile(io.BytesIO(original)) as hot:
+                self.assertEqual(cold.namelist(), hot.namelist())
+                for name in hot.namelist():
+                    self.assertEqual(cold.read(name), hot.read(name))
+
+    def test_no_recompress_copies_archives_unchanged(self):
+        self.retention(no_recompress=True)
+        for upload in UploadedFile.objects.filter(storage_tier='cold'):
+            with open(os.path.join(self.cold_root, upload.file.name), 'rb') as f:
+                self.assertEqual(f.read(), self.contents[upload.original_filename])
+
+
+@override_settings(CACHES=TEST_CACHES, AMAP_API_KEY=None, UPLOAD_EXTRACT_WORKERS=0)
+class ContentAddressedStorageTests(TempMediaMixin, TestCase):
+    """内容寻址存储：相同内容只存一份，按引用计数删除，冷热迁移与旧文件转换都能共用"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.cold_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cold_root, ignore_errors=True)
+        cold = override_settings(RETENTION_COLD_ROOT=self.cold_root)
+        cold.enable()
+        self.addCleanup(cold.disable)
+        self.content = make_zip({'a.docx': DOCUMENT_LINES * 20})
+
+    def upload(self, name):
+        self.client.post(reverse('dashboard'), {'files': [SimpleUploadedFile(name, self.content)]})
+        return UploadedFile.objects.get(original_filename=name)
+
+    def blobs(self, root):
+        return sorted(
+            os.path.relpath(os.path.join(path, name), root).replace(os.sep, '/')
+            for path, _, names in os.walk(os.path.join(root, 'blobs')) for name in names
+        )
+
+    def test_identical_uploads_share_one_blob_until_last_reference(self):
+        first = self.upload('EOSC_1_KC+集团1+地址1.zip')
+        second = self.upload('EOSC_1_KC+集团1+地址1(1).zip')
+        digest = hashlib.sha256(self.content).hexdigest()
+        name = f'blobs/{digest[:2]}/{digest}.zip'
+        self.assertEqual((first.file.name, second.file.name), (name, name))
+        self.assertEqual(self.blobs(self.media_root), [name])
+        response = self.client.get(reverse('download_file', args=[second.id]))
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.blobs(self.media_root), [name])
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self.blobs(self.media_root), [])
+
+    def test_shared_blob_moves_to_cold_with_its_last_hot_reference(self):
+        first = self.upload('EOSC_1_KC+集团1+地址1.zip')
+        second = self.upload('EOSC_1_KC+集团1+地址1(1).zip')
+        UploadedFile.objects.update(uploaded_at=timezone.now() - timedelta(days=200))
+        call_command('apply_retention', days=180, batch_size=1, max_batches=1, stdout=io.StringIO())
+        # 第二条仍在热存储，共用的文件保留
+        self.assertEqual(self.blobs(self.media_root), [first.file.name])
+        self.assertEqual(self.blobs(self.cold_root), [first.file.name])
+        response = self.client.get(reverse('download_file', args=[second.id]))
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        call_command('apply_retention', days=180, stdout=io.StringIO())
+        self.assertEqual(set(UploadedFile.objects.values_list('storage_tier', flat=True)), {'cold'})
+        self.assertEqual(self.blobs(self.media_root), [])
+        self.assertEqual(self.blobs(self.cold_root), [first.file.name])
+
+    def test_blob_reused_by_an_upload_in_flight_is_not_released(self):
+        first = self.upload('EOSC_1_KC+集团1+地址1.zip')
+        name = first.file.name
+        save_archive = scheduler._save_archive
+
+        def delete_first_then_save(*args):
+            # 第二次上传已复用文件、记录尚未写入时，唯一已提交的引用被删除
+            first.delete()
+            self.assertFalse(release_archive(name))
+            return save_archive(*args)
+
+        with mock.patch.object(scheduler, '_save_archive', side_effect=delete_first_then_save):
+            second = self.upload('EOSC_1_KC+集团1+地址1(1).zip')
+        self.assertEqual(second.file.name, name)
+        self.assertEqual(self.blobs(self.media_root), [name])
+        response = self.client.get(reverse('download_file', args=[second.id]))
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        # 记录提交后标记撤销，最后一个引用删除时文件随之释放
+        self.assertEqual([n for n in os.listdir(os.path.join(self.media_root, PIN_DIR)) if n != '.lock'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self.blobs(self.media_root), [])
+
+    def test_unreadable_archive_is_reported_by_its_original_name(self):
+        name = 'EOSC_9_KC+集团9+地址9.zip'
+        self.client.post(reverse('dashboard'), {'files': [SimpleUploadedFile(name, b'not a zip')]})
+        upload = UploadedFile.objects.get(original_filename=name)
+        self.assertTrue(upload.file.name.startswith('blobs/'))
+        info = upload.extracted_infos.get()
+        self.assertEqual((info.document_name, info.extraction_status), (name, '失败'))
+        self.assertIn(name, info.extraction_error)
+        self.assertNotIn(os.path.basename(upload.file.name), info.extraction_error)
+
+    def test_dedupe_archives_converts_legacy_paths(self):
+        for index in range(2):
+            path = os.path.join(self.media_root, 'uploads', '2024', f'{index}.zip')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(self.content)
+            UploadedFile.objects.create(original_filename=f'{index}.zip', file=f'uploads/2024/{index}.zip')
+        call_command('dedupe_archives', stdout=io.StringIO())
+        names = set(UploadedFile.objects.values_list('file', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(self.blobs(self.media_root), sorted(names))
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads', '2024')), [])
+
+
+@override_settings(CACHES=TEST_CACHES, AMAP_API_KEY=None, UPLOAD_EXTRACT_WORKERS=0, UPLOAD_CHUNK_SIZE=1024)
+class ChunkedUploadTests(TempMediaMixin, TestCase):
+    """分块上传：校验每个分块，乱序/续传，拼装后交给与表单上传相同的处理流程"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.content = make_zip({f'{n}.docx': DOCUMENT_LINES for n in range(2)})
+
+    def init(self, **payload):
+        payload = {'filename': 'EOSC_5_KC+集团5+地址5.zip', 'size': len(self.content), **payload}
+        return self.client.post(reverse('chunked_upload_init'), json.dumps(payload), content_type='application/json')
+
+    def put_chunk(self, upload_id, index, data=None, checksum=None):
+        if data is None:
+            data = self.content[index * 1024:(index + 1) * 1024]
+        return self.client.put(
+            reverse('chunked_upload_chunk', args=[upload_id, index]),
+            data,
+            content_type='application/octet-stream',
+            headers={'X-Chunk-SHA256': checksum or hashlib.sha256(data).hexdigest()},
+        )
+
+    def finalize(self, *upload_ids):
+        return self.client.post(
+            reverse('chunked_upload_finalize'),
+            json.dumps({'upload_ids': list(upload_ids)}),
+            content_type='application/json',
+        )
+
+    def test_resume_out_of_order_and_finalize(self):
+        session = self.init(sha256=hashlib.sha256(self.content).hexdigest()).json()
+        upload_id, total = session['upload_id'], session['total_chunks']
+        self.assertEqual(total, -(-len(self.content) // 1024))
+        self.assertGreater(total, 2)
+
+        for index in reversed(range(1, total)):
+            self.assertEqual(self.put_chunk(upload_id, index).status_code, 200)
+        # 校验和不符的分块不记为已收到
+        response = self.put_chunk(upload_id, 0, checksum='0' * 64)
+        self.assertEqual(response.json()['error'], 'checksum_mismatch')
+
+        status = self.client.get(reverse('chunked_upload_status', args=[upload_id])).json()
+        self.assertEqual(status['received'], list(range(1, total)))
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['missing'], [0])
+
+        self.put_chunk(upload_id, 0)
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 200)
+        upload = UploadedFile.objects.get()
+        self.assertEqual(response.json()['url'], reverse('dashboard_with_id', args=[upload.id]))
+        self.assertEqual(response.json()['results'][0]['ok'], True)
+        self.assertEqual(upload.group_name, '集团5')
+        self.assertEqual(upload.extracted_infos.count(), 2)
+        with upload.file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        # 分块文件已改名移入存储，会话随之结束
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads', 'partial')), [])
+        self.assertEqual(self.client.get(reverse('chunked_upload_status', args=[upload_id])).status_code, 404)
+
+    def test_chunks_are_written_at_their_offsets_without_pwrite(self):
+        session = self.init().json()
+        upload_id, total = session['upload_id'], session['total_chunks']
+        # 不依赖 POSIX 才有的 os.pwrite（Windows 上不存在）
+        with mock.patch.object(os, 'pwrite', side_effect=AssertionError('os.pwrite'), create=True):
+            for index in reversed(range(total)):
+                self.assertEqual(self.put_chunk(upload_id, index).status_code, 200)
+            # 超长的重传被拒绝后再正确重传，覆盖同一区域
+            self.assertEqual(self.put_chunk(upload_id, 1, data=b'x' * 1025).json()['error'], 'size_mismatch')
+            self.assertEqual(self.put_chunk(upload_id, 1).status_code, 200)
+        with open(os.path.join(self.media_root, 'uploads', 'partial', f'{upload_id}.part'), 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_rejects_wrong_sizes_and_types(self):
+        self.assertEqual(self.init(filename='说明.txt').json()['error'], 'unsupported_type')
+        self.assertEqual(self.init(size=0).json()['error'], 'invalid_size')
+
+        upload_id = self.init().json()['upload_id']
+        self.assertEqual(self.put_chunk(upload_id, 0, data=b'x' * 1025).json()['error'], 'size_mismatch')
+        self.assertEqual(self.put_chunk(upload_id, 0, data=b'x' * 10).json()['error'], 'size_mismatch')
+        self.assertEqual(self.put_chunk(upload_id, 999).json()['error'], 'invalid_chunk')
+        self.assertEqual(self.put_chunk('unknown-upload', 0).status_code, 404)
+
+        self.client.delete(reverse('chunked_upload_status', args=[upload_id]))
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads', 'partial')), [])
+        self.assertEqual(self.finalize(upload_id).status_code, 404)
+        self.assertFalse(UploadedFile.objects.exists())
+
+
+@override_settings(CACHES=TEST_CACHES, AMAP_API_KEY=None, UPLOAD_EXTRACT_WORKERS=0)
+class MetricsTests(TempMediaMixin, TestCase):
+    """/metrics 暴露上传处理、片段缓存与视图耗时指标"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_upload_and_dashboard_metrics(self):
+        saved = self.sample('wordextractor_archives_processed_total', result='saved')
+        rejected = self.sample('wordextractor_archives_processed_total', result='rejected')
+        succeeded = self.sample('wordextractor_documents_processed_total', extraction_status='成功')
+        reads = self.sample('wordextractor_extraction_stage_seconds_count', stage='read')
+        files = [
+            SimpleUploadedFile('EOSC_4_KC+集团4+地址4.zip', make_zip({'a.docx': DOCUMENT_LINES, 'b.docx': DOCUMENT_LINES})),
+            SimpleUploadedFile('说明.txt', b'not a zip'),
+        ]
+        self.client.post(reverse('dashboard'), {'files': files})
+        self.assertEqual(self.sample('wordextractor_archives_processed_total', result='saved') - saved, 1)
+        self.assertEqual(self.sample('wordextractor_archives_processed_total', result='rejected') - rejected, 1)
+        self.assertEqual(self.sample('wordextractor_documents_processed_total', extraction_status='成功') - succeeded, 2)
+        self.assertEqual(self.sample('wordextractor_extraction_stage_seconds_count', stage='read') - reads, 2)
+
+        upload = UploadedFile.objects.get()
+        url = reverse('dashboard_with_id', args=[upload.id])
+        hits = self.sample('wordextractor_fragment_cache_requests_total', fragment='results', result='hit')
+        renders = self.sample('wordextractor_request_seconds_count', view='dashboard_with_id')
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(self.sample('wordextractor_fragment_cache_requests_total', fragment='results', result='hit') - hits, 1)
+        self.assertEqual(self.sample('wordextractor_request_seconds_count', view='dashboard_with_id') - renders, 2)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode('utf-8')
+        self.assertIn('wordextractor_request_queries_bucket{le="1.0",view="dashboard_with_id"}', body)
+        self.assertIn('wordextractor_extraction_stage_seconds_count{stage="unzip"}', body)
+
+    @override_settings(UPLOAD_EXTRACT_WORKERS=1)
+    def test_stage_timings_from_extraction_processes_reach_metrics(self):
+        # 默认配置：提取在 spawn 进程池中执行，且未启用 PROMETHEUS_MULTIPROC_DIR
+        stages = {stage: self.sample('wordextractor_extraction_stage_seconds_count', stage=stage) for stage in ('unzip', 'read', 'match')}
+        files = [SimpleUploadedFile('EOSC_5_KC+集团5+地址5.zip', make_zip({'a.docx': DOCUMENT_LINES, 'b.docx': DOCUMENT_LINES}))]
+        self.client.post(reverse('dashboard'), {'files': files})
+        self.assertEqual(UploadedFile.objects.get().extracted_infos.count(), 2)
+        self.assertEqual(
+            {stage: self.sample('wordextractor_extraction_stage_seconds_count', stage=stage) - before for stage, before in stages.items()},
+            {'unzip': 1, 'read': 2, 'match': 2},
+        )
+
+
+class RangeHeaderTests(SimpleTestCase):
+    """Range 头解析：None 表示按完整文件响应，False 表示无法满足（416）"""
+
+    def test_single_ranges(self):
+        self.assertEqual(parse_range_header('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range_header('bytes=90-', 100), (90, 99))
+        # 结束位置超出文件时截到最后一个字节
+        self.assertEqual(parse_range_header('bytes=95-200', 100), (95, 99))
+
+    def test_suffix_ranges(self):
+        self.assertEqual(parse_range_header('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range_header('bytes=-500', 100), (0, 99))
+        self.assertIs(parse_range_header('bytes=-0', 100), False)
+
+    def test_unsatisfiable_and_ignored_ranges(self):
+        self.assertIs(parse_range_header('bytes=100-', 100), False)
+        self.assertIs(parse_range_header('bytes=150-160', 100), False)
+        for header in ('', None, 'bytes=5-2', 'bytes=0-1,5-6', 'items=0-1', 'bytes=-', 'bytes=a-b'):
+            self.assertIsNone(parse_range_header(header, 100), header)
+
+    def test_any_range_on_empty_file_is_unsatisfiable(self):
+        for header in ('bytes=-5', 'bytes=0-', 'bytes=0-0'):
+            self.assertIs(parse_range_header(header, 0), False, header)
+        self.assertIsNone(parse_range_header('bytes=0-1,5-6', 0))
+
+
+@override_settings(CACHES=TEST_CACHES, DOWNLOAD_SENDFILE_MODE=None)
+class DownloadFileTests(TempMediaMixin, TestCase):
+    """原始压缩包下载：单区间 Range、If-Range 与条件请求"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.content = bytes(range(256)) * 4
+        path = os.path.join(self.media_root, 'uploads', 'a.zip')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(self.content)
+        upload = UploadedFile.objects.create(original_filename='原始.zip', file='uploads/a.zip')
+        self.url = reverse('download_file', args=[upload.id])
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_download_advertises_ranges(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_range_and_suffix_range(self):
+        response, body = self.get(Range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+        response, body = self.get(Range='bytes=-16')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[-16:])
+        self.assertEqual(response['Content-Range'], f'bytes 1008-1023/{len(self.content)}')
+
+    def test_unsatisfiable_range_returns_416(self):
+        response, body = self.get(Range=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+        self.assertEqual(body, b'')
+
+    def test_range_on_empty_file_returns_416(self):
+        with open(os.path.join(self.media_root, 'uploads', 'a.zip'), 'wb'):
+            pass
+        response, body = self.get(Range='bytes=-10')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */0')
+        self.assertEqual(body, b'')
+
+    def test_if_range_mismatch_returns_full_file(self):
+        etag = self.get()[0]['ETag']
+        response, body = self.get(Range='bytes=0-9', If_Range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+        response, body = self.get(Range='bytes=0-9', If_Range=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[:10])
+
+        # 文件在该日期之后修改过：按完整文件响应
+        response, body = self.get(Range='bytes=0-9', If_Range='Mon, 01 Jan 2001 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+    def test_conditional_requests_return_304(self):
+        first = self.get()[0]
+        response, body = self.get(If_None_Match=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(body, b'')
+        self.assertEqual(response['ETag'], first['ETag'])
+
+        response, _ = self.get(If_Modified_Since=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        response, body = self.get(If_None_Match='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BundleDownloadTests(TempMediaMixin, TestCase):
+    """按筛选条件打包下载原始压缩包：热/冷存储的文件原样存入，manifest.csv 记录每条上传"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.cold_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cold_root, ignore_errors=True)
+        cold = override_settings(RETENTION_COLD_ROOT=self.cold_root)
+        cold.enable()
+        self.addCleanup(cold.disable)
+        self.hot = self.create('a.zip', b'hot' * 100, group_name='集团1')
+        self.cold = self.create('b.zip', b'cold' * 100, group_name='集团1', storage_tier='cold')
+        self.missing = UploadedFile.objects.create(original_filename='缺失.zip', file='uploads/gone.zip', group_name='集团1')
+        self.other = self.create('c.zip', b'other', group_name='集团2')
+
+    def create(self, name, content, storage_tier='hot', **fields):
+        root = self.cold_root if storage_tier == 'cold' else self.media_root
+        path = os.path.join(root, 'uploads', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return UploadedFile.objects.create(
+            original_filename=f'原始_{name}', file=f'uploads/{name}', storage_tier=storage_tier, **fields,
+        )
+
+    def bundle(self, **params):
+        response = self.client.get(reverse('download_bundle'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_bundle_contains_filtered_archives_and_manifest(self):
+        with self.bundle(group_name='集团1') as archive:
+            self.assertEqual(archive.namelist(), [
+                f'{self.hot.id}_原始_a.zip', f'{self.cold.id}_原始_b.zip', 'manifest.csv',
+            ])
+            self.assertEqual(archive.read(f'{self.hot.id}_原始_a.zip'), b'hot' * 100)
+            self.assertEqual(archive.read(f'{self.cold.id}_原始_b.zip'), b'cold' * 100)
+            # 压缩包原样存入，不二次压缩
+            self.assertEqual(archive.getinfo(f'{self.hot.id}_原始_a.zip').compress_type, zipfile.ZIP_STORED)
+            manifest = archive.read('manifest.csv').decode('utf-8')
+
+        self.assertTrue(manifest.startswith('\ufeff'))
+        rows = list(csv.reader(io.StringIO(manifest[1:])))
+        self.assertEqual(rows[0], BUNDLE_MANIFEST_HEADERS)
+        records = {row[0]: dict(zip(BUNDLE_MANIFEST_HEADERS, row)) for row in rows[1:]}
+        self.assertEqual(set(records), {str(self.hot.id), str(self.cold.id), str(self.missing.id)})
+        hot = records[str(self.hot.id)]
+        self.assertEqual((hot['包内路径'], hot['文件大小(字节)'], hot['状态']), (f'{self.hot.id}_原始_a.zip', '300', '已打包'))
+        self.assertEqual(hot['集团名称'], '集团1')
+        missing = records[str(self.missing.id)]
+        self.assertEqual((missing['包内路径'], missing['文件大小(字节)'], missing['状态']), ('', '', '文件缺失'))
+
+    def test_bundle_without_matches_has_only_manifest(self):
+        with self.bundle(start_date='2999-01-01') as archive:
+            self.assertEqual(archive.namelist(), ['manifest.csv'])
+            rows = list(csv.reader(io.StringIO(archive.read('manifest.csv').decode('utf-8')[1:])))
+        self.assertEqual(rows, [BUNDLE_MANIFEST_HEADERS])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BulkConstructionStatusTests(TestCase):
+    """批量更新建设进度：取消某一步清空其后步骤，完成前必须有资源地址，结果按请求中的 ID 逐条返回"""
+
+    def setUp(self):
+        cache.clear()
+        upload = seed_upload(1, documents=3, email_sent=True)
+        self.a, self.b, self.c = upload.extracted_infos.order_by('id')
+        self.earlier = timezone.now() - timedelta(days=3)
+
+    def post(self, payload):
+        return self.client.post(reverse('bulk_update_construction_status'), json.dumps(payload), content_type='application/json')
+
+    def statuses(self, info):
+        info.refresh_from_db()
+        return info.field_construction_at, info.resource_entry_at, info.construction_completed_at
+
+    def test_unsetting_a_stage_clears_later_stages(self):
+        ExtractedInfo.objects.update(
+            field_construction_at=self.earlier, resource_entry_at=self.earlier,
+            construction_completed_at=self.earlier, resource_address='昆明市某路1号',
+        )
+        response = self.post({'ids': [self.a.id], 'type': 'resource_entry', 'action': 'unset'})
+        self.assertEqual(response.json()['results'], [{
+            'id': self.a.id, 'ok': True,
+            'field_construction_at': format_beijing_datetime(self.earlier),
+            'resource_entry_at': None, 'construction_completed_at': None,
+        }])
+        self.assertEqual(self.statuses(self.a), (self.earlier, None, None))
+
+        self.post({'ids': [self.b.id], 'type': 'field_construction', 'action': 'unset'})
+        self.assertEqual(self.statuses(self.b), (None, None, None))
+        # 未选中的行不受影响
+        self.assertEqual(self.statuses(self.c), (self.earlier,) * 3)
+
+    def test_setting_a_stage_backfills_missing_earlier_stages(self):
+        ExtractedInfo.objects.filter(pk=self.a.pk).update(field_construction_at=self.earlier)
+        self.post({'ids': [self.a.id, self.b.id], 'type': 'resource_entry', 'action': 'set'})
+        field_a, entry_a, completed_a = self.statuses(self.a)
+        self.assertEqual(field_a, self.earlier)
+        self.assertIsNotNone(entry_a)
+        self.assertIsNone(completed_a)
+        field_b, entry_b, _ = self.statuses(self.b)
+        self.assertEqual(field_b, entry_b)
+
+    def test_completion_requires_resource_address_per_row(self):
+        ExtractedInfo.objects.filter(pk=self.a.pk).update(resource_address='昆明市某路1号')
+        ExtractedInfo.objects.filter(pk=self.b.pk).update(resource_address='')
+        response = self.post({'ids': [self.b.id, 'x', self.a.id, 999999, self.a.id, self.c.id], 'type': 'completed', 'action': 'set'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        # 无效 ID 在前，其余按请求顺序、去重
+        self.assertEqual([(r['id'], r['ok'], r.get('error')) for r in results], [
+            ('x', False, 'invalid_id'),
+            (self.b.id, False, 'resource_address_required'),
+            (self.a.id, True, None),
+            (999999, False, 'not_found'),
+            (self.c.id, False, 'resource_address_required'),
+        ])
+        field_a, entry_a, completed_a = self.statuses(self.a)
+        self.assertIsNotNone(completed_a)
+        self.assertEqual((field_a, entry_a), (completed_a, completed_a))
+        self.assertEqual(self.statuses(self.b), (None, None, None))
+        self.assertEqual(self.statuses(self.c), (None, None, None))
+        self.assertIsNone(results[1]['construction_completed_at'])
+
+    def test_invalid_requests_are_rejected(self):
+        cases = [
+            ({'ids': [], 'type': 'completed', 'action': 'set'}, 'empty_ids'),
+            ({'ids': [self.a.id], 'type': 'shipped', 'action': 'set'}, 'invalid_transition'),
+            ({'ids': [self.a.id], 'type': 'completed', 'action': 'toggle'}, 'invalid_transition'),
+            ({'ids': list(range(1, views.BULK_MAX_IDS + 2)), 'type': 'completed', 'action': 'unset'}, 'too_many_ids'),
+        ]
+        for payload, error in cases:
+            response = self.post(payload)
+            self.assertEqual((response.status_code, response.json()['error']), (400, error))
+        self.assertEqual(self.statuses(self.a), (None, None, None))
+
+
+XLSX_NS = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+
+
+def xlsx_rows(content):
+    """读出流式导出的 XLSX 中各行单元格的文本（空单元格为 ''）"""
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        root = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+    return [
+        [''.join(cell.itertext()) for cell in row.findall('x:c', XLSX_NS)]
+        for row in root.iterfind('.//x:row', XLSX_NS)
+    ]
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ExportTests(TestCase):
+    """按仪表盘筛选条件流式导出提取结果：CSV 与 XLSX 内容一致，只包含匹配的上传"""
+
+    def setUp(self):
+        cache.clear()
+        self.first = seed_upload(1, documents=2)
+        self.second = seed_upload(2, documents=1)
+        ExtractedInfo.objects.filter(uploaded_file=self.second).update(verification_passed=True, fee_anomaly=True)
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_results'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_has_bom_headers_and_formatted_values(self):
+        response, content = self.export()
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertIn('.csv', response['Content-Disposition'])
+        text = content.decode('utf-8')
+        self.assertTrue(text.startswith('\ufeff'))
+        rows = list(csv.reader(io.StringIO(text[1:])))
+        headers = export_headers()
+        self.assertEqual(rows[0], headers)
+        self.assertEqual(len(rows), 4)
+        records = [dict(zip(headers, row)) for row in rows[1:]]
+        # 按上传顺序，同一上传内按结果 ID
+        self.assertEqual([r['文档名称'] for r in records], ['1_0.docx', '1_1.docx', '2_0.docx'])
+        last = records[-1]
+        self.assertEqual(last['上传ID'], str(self.second.id))
+        self.assertEqual(last['集团名称'], '集团2')
+        self.assertEqual(last['单号'], 'EOSC_2_KC')
+        self.assertEqual(last['费用合计'], '120.50')
+        self.assertEqual(last['光缆总长(米)'], '100')
+        self.assertEqual((last['验算通过'], last['费用异常']), ('是', '是'))
+        self.assertEqual(records[0]['验算通过'], '否')
+        self.assertEqual(records[0]['建设完成时间'], '')
+
+    def test_csv_applies_dashboard_filters(self):
+        _, content = self.export(group_name='集团2')
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8')[1:])))
+        self.assertEqual([row[0] for row in rows[1:]], [str(self.second.id)])
+
+        _, content = self.export(order_code='EOSC_1')
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8')[1:])))
+        self.assertEqual([row[0] for row in rows[1:]], [str(self.first.id)] * 2)
+
+        _, content = self.export(start_date='2999-01-01')
+        self.assertEqual(len(list(csv.reader(io.StringIO(content.decode('utf-8')[1:])))), 1)
+
+    def test_xlsx_matches_filtered_rows(self):
+        response, content = self.export(format='xlsx', q='地址1')
+        self.assertEqual(response['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        self.assertIn('.xlsx', response['Content-Disposition'])
+        rows = xlsx_rows(content)
+        headers = export_headers()
+        self.assertEqual(rows[0], headers)
+        self.assertEqual(len(rows), 3)
+        records = [dict(zip(headers, row)) for row in rows[1:]]
+        self.assertEqual({r['上传ID'] for r in records}, {str(self.first.id)})
+        self.assertEqual([r['文档名称'] for r in records], ['1_0.docx', '1_1.docx'])
+        self.assertEqual(records[0]['费用合计'], '120.50')
+        self.assertEqual(records[0]['验算通过'], '否')
+
+    def test_xlsx_strips_characters_invalid_in_xml(self):
+        ExtractedInfo.objects.filter(uploaded_file=self.first).update(document_name='坏\x01名<称>.docx')
+        _, content = self.export(format='xlsx', group_name='集团1')
+        names = [row[export_headers().index('文档名称')] for row in xlsx_rows(content)[1:]]
+        self.assertEqual(names, ['坏名<称>.docx'] * 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DocumentTextTests(TestCase):
+    """文档原文不随仪表盘输出，由 document_text 接口按需分页加载"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.uploaded_file = seed_upload(1, documents=1)
+        cls.info = cls.uploaded_file.extracted_infos.get()
+        lines = ['工程概况', '宽带维护费（含税）：', '100元', '说明 <b>', '敷设光缆 120 米', '结束']
+        ExtractedInfo.objects.filter(id=cls.info.id).update(document_content='\n'.join(lines))
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('document_text', args=[self.info.id])
+
+    def test_dashboard_does_not_embed_document_text(self):
+        response = self.client.get(reverse('dashboard_with_id', args=[self.uploaded_file.id]))
+        self.assertNotContains(response, '工程概况')
+        self.assertContains(response, f'data-url="{self.url}"')
+        self.assertContains(response, '显示完整文本内容')
+
+    def test_paged_and_highlighted_text(self):
+        data = self.client.get(self.url, {'page_size': 2}).json()
+        self.assertEqual((data['page'], data['pages'], data['paragraph_count']), (1, 3, 6))
+        self.assertEqual([p['content'] for p in data['paragraphs']], [
+            '工程概况',
+            '<mark data-field="maintenance_fee" title="宽带维护费（含税）">宽带维护费（含税）：</mark>',
+        ])
+        self.assertEqual(
+            [(m['field'], m['paragraph'], m['page']) for m in data['matches']],
+            [('maintenance_fee', 1, 1), ('doc_maintenance_total', 1, 1), ('fiber_info', 4, 3)],
+        )
+
+        data = self.client.get(self.url, {'page_size': 2, 'page': 2}).json()
+        self.assertEqual([p['content'] for p in data['paragraphs']], [
+            '<mark data-field="maintenance_fee" title="宽带维护费（含税）">100元</mark>',
+            '说明 &lt;b&gt;',
+        ])
+
+        data = self.client.get(self.url, {'context': 0}).json()
+        self.assertEqual([p['index'] for p in data['paragraphs']], [1, 2, 4])
+
+        data = self.client.get(self.url, {'highlight': 0, 'page': 2, 'page_size': 3}).json()
+        self.assertEqual([p['content'] for p in data['paragraphs']], ['说明 <b>', '敷设光缆 120 米', '结束'])
+
+    def test_conditional_and_server_side_caching(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        # 重新提取等操作递增内容版本后 ETag 随之变化
+        UploadedFile.objects.filter(id=self.uploaded_file.id).update(content_version=F('content_version') + 1)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_missing_info(self):
+        self.assertEqual(self.client.get(reverse('document_text', args=[999999])).status_code, 404)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProfilingMiddlewareTests(TestCase):
+    """按需剖析：staff 通过请求头/查询参数触发，或按比例抽样，结果存入 RequestProfile"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.uploaded_file = seed_upload(1, documents=2, remarks=1)
+        cls.staff = User.objects.create_user('staff', password='pw', is_staff=True, is_superuser=True)
+        cls.user = User.objects.create_user('user', password='pw')
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('dashboard_with_id', args=[self.uploaded_file.id])
+
+    def test_staff_header_stores_profile_with_queries(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get(id=response['X-Profile-Id'])
+        self.assertEqual((profile.trigger, profile.view_name, profile.status_code), ('header', 'uploader.views.dashboard', 200))
+        self.assertEqual(profile.query_count, len(profile.queries))
+        self.assertTrue(any('uploader_extractedinfo' in query['sql'] for query in profile.queries))
+        self.assertIn('cumulative', profile.stats_text)
+        self.assertTrue(pstats.Stats(self.write_stats(profile)).total_calls)
+
+        response = self.client.get(self.url + '?_profile=1')
+        self.assertEqual(RequestProfile.objects.get(id=response['X-Profile-Id']).trigger, 'query')
+
+    def write_stats(self, profile):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'request.prof')
+        with open(path, 'wb') as fh:
+            fh.write(self.client.get(reverse('admin:uploader_requestprofile_download', args=[profile.id])).content)
+        return path
+
+    def test_non_staff_and_untriggered_requests_are_not_profiled(self):
+        self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.client.force_login(self.staff)
+        self.client.get(self.url)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_MAX_PROFILES=2)
+    def test_sampling_keeps_latest_profiles_for_uploader_views_only(self):
+        for _ in range(3):
+            self.client.get(self.url)
+        self.client.force_login(self.staff)
+        self.client.get(reverse('admin:index'))
+        self.assertEqual(list(RequestProfile.objects.values_list('trigger', flat=True)), ['sample', 'sample'])
+
+    def test_admin_lists_profiles(self):
+        self.client.force_login(self.staff)
+        profile_id = self.client.get(self.url, HTTP_X_PROFILE='1')['X-Profile-Id']
+        changelist = self.client.get(reverse('admin:uploader_requestprofile_changelist'))
+        self.assertContains(changelist, 'uploader.views.dashboard')
+        detail = self.client.get(reverse('admin:uploader_requestprofile_change', args=[profile_id]))
+        self.assertContains(detail, f'request-{profile_id}.prof')
+        self.assertContains(detail, 'uploader_extractedinfo')
+
+
+class ReaderBackendTests(SimpleTestCase):
+    """文档读取后端：按格式与平台选择，依赖延迟到读取时才导入"""
+
+    def write_docx(self, lines):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'a.docx')
+        with zipfile.ZipFile(io.BytesIO(make_zip({'a.docx': lines}))) as archive:
+            with open(path, 'wb') as fh:
+                fh.write(archive.read('a.docx'))
+        return path
+
+    def test_docx_prefers_python_docx_and_falls_back(self):
+        path = self.write_docx(['宽带维护费（含税）：100元', 'A &amp; B'])
+        self.assertEqual(readers.backends_for_format('.docx')[0].name, 'python-docx')
+        self.assertEqual(readers.read_document(path), ['宽带维护费（含税）：100元', 'A &amp; B'])
+        self.assertEqual(readers.read_docx_xml(path), ['宽带维护费（含税）：100元', 'A &amp; B'])
+
+        def broken(file_path):
+            raise ValueError('损坏')
+
+        readers.register_backend(readers.ReaderBackend('broken', ['.docx'], broken, priority=0))
+        self.addCleanup(readers.unregister_backend, 'broken')
+        self.assertEqual(readers.backends_for_format('.docx')[0].name, 'broken')
+        self.assertEqual(readers.read_document(path), ['宽带维护费（含税）：100元', 'A &amp; B'])
+
+    def test_streams_and_path_only_backends(self):
+        with open(self.write_docx(['宽带维护费（含税）：100元']), 'rb') as fh:
+            stream = io.BytesIO(fh.read())
+        self.assertEqual(readers.read_document(stream, 'a.docx'), ['宽带维护费（含税）：100元'])
+
+        # 只接受路径的后端拿到的是仅含该文档的临时文件，读取后删除
+        seen = []
+
+        def path_only(file_path):
+            seen.append(file_path)
+            self.assertTrue(file_path.endswith('.docx') and os.path.exists(file_path))
+            return []
+
+        readers.register_backend(readers.ReaderBackend('path-only', ['.docx'], path_only, priority=0, streams=False))
+        self.addCleanup(readers.unregister_backend, 'path-only')
+        self.assertEqual(readers.read_document(stream, 'a.docx'), ['宽带维护费（含税）：100元'])
+        self.assertEqual(len(seen), 1)
+        self.assertFalse(os.path.exists(seen[0]))
+
+    def test_platform_and_dependency_gating(self):
+        with mock.patch.object(readers.sys, 'platform', 'linux'):
+            readers.backends_for_format.cache_clear()
+            self.assertEqual(readers.backends_for_format('.doc'), ())
+        readers.backends_for_format.cache_clear()
+        missing = readers.ReaderBackend('native', ['.doc'], lambda path: [], requires=['no_such_reader_module'])
+        self.assertFalse(missing.available())
+
+    @override_settings(DOCUMENT_READERS=['docx-xml'])
+    def test_settings_select_backends(self):
+        readers.backends_for_format.cache_clear()
+        self.addCleanup(readers.backends_for_format.cache_clear)
+        self.assertEqual([backend.name for backend in readers.backends_for_format('.docx')], ['docx-xml'])
+
+    def test_importing_views_does_not_import_reader_libraries(self):
+        code = (
+            'import sys, django; django.setup(); import uploader.views; '
+            'print(sorted(m for m in ("docx", "docx2txt", "pythoncom", "win32com") if m in sys.modules))'
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'wordextractor.settings'}
+        output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip().splitlines()[-1], '[]')
+
+
+class QueryPlanTests(TestCase):
+    """热点查询的 EXPLAIN QUERY PLAN 中不能出现全表扫描"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.uploads = [seed_upload(index, email_sent=index % 2 == 0, remarks=1) for index in range(20)]
+
+    def assertNoFullScan(self, queryset):
+        plan = queryset.explain()
+        self.assertFalse(FULL_SCAN_RE.findall(plan), plan)
+        return plan
+
+    def test_history_ordered_by_uploaded_at_uses_index(self):
+        plan = self.assertNoFullScan(filter_uploaded_files({}).order_by('-uploaded_at')[:50])
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_date_range_uses_uploaded_at_index(self):
+        qs = filter_uploaded_files({'start_date': '2026-01-01', 'end_date': '2026-01-31'}).order_by('-uploaded_at')[:50]
+        plan = self.assertNoFullScan(qs)
+        self.assertIn('SEARCH uploader_uploadedfile USING INDEX', plan)
+
+    def test_construction_unit_filter_uses_email_sent_index(self):
+        qs = filter_uploaded_files({'construction_unit': '施工队'}).order_by('-uploaded_at')[:50]
+        plan = self.assertNoFullScan(qs)
+        self.assertIn('uploader_ex_email_sent_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_order_code_filter_searches_by_upload(self):
+        plan = self.assertNoFullScan(filter_uploaded_files({'order_code': 'EOSC_1'}).order_by('-uploaded_at')[:50])
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_extracted_infos_of_upload_use_composite_index(self):
+        plan = self.assertNoFullScan(self.uploads[0].extracted_infos.all())
+        self.assertIn('SEARCH', plan)
+        self.assertNotIn('TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_remarks_prefetch_searches_by_info(self):
+        ids = list(self.uploads[0].extracted_infos.values_list('id', flat=True))
+        self.assertNoFullScan(ConstructionRemark.objects.filter(extracted_info_id__in=ids).order_by('created_at'))
+
+    def test_retention_candidates_use_tier_index(self):
+        plan = self.assertNoFullScan(due_for_cold(timezone.now())[:50])
+        self.assertIn('uploader_up_tier_idx', plan)
+
+    def test_export_and_bundle_querysets_use_indexes(self):
+        uploads = filter_uploaded_files({'start_date': '2026-01-01', 'end_date': '2026-01-31'})
+        self.assertNoFullScan(export_queryset(uploads))
+        self.assertNoFullScan(bundle_queryset(uploads))
+
+
+class SqliteTuningTests(SimpleTestCase):
+    """新建的 SQLite 连接上 PRAGMA 与事务模式都已生效"""
+
+    def test_new_connection_applies_pragmas(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        # 内存数据库不支持 WAL，使用临时文件
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': os.path.join(directory, 'tuning.sqlite3')}, 'tuning')
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
@@ -11,10 +11,24 @@ urlpatterns = [
     path('extracted-construction-status/<int:info_id>/', views.update_construction_status, name='update_construction_status'),
     path('extracted-resource-address/<int:info_id>/', views.update_resource_address, name='update_resource_address'),
     path('extracted-construction-remark/<int:info_id>/', views.add_construction_remark, name='add_construction_remark'),
+    path('extracted-text/<int:info_id>/', views.document_text, name='document_text'),
     path('delete-construction-remark/<int:remark_id>/', views.delete_construction_remark, name='delete_construction_remark'),
+    path('bulk/upload-mark/', views.bulk_update_upload_mark, name='bulk_update_upload_mark'),
+    path('bulk/extracted-construction-order/', views.bulk_update_construction_order_code, name='bulk_update_construction_order_code'),
+    path('bulk/extracted-construction-email/', views.bulk_update_construction_email_sent, name='bulk_update_construction_email_sent'),
+    path('bulk/extracted-construction-status/', views.bulk_update_construction_status, name='bulk_update_construction_status'),
+    path('upload-progress/<str:token>/', views.upload_progress, name='upload_progress'),
+    path('chunked-upload/', views.chunked_upload_init, name='chunked_upload_init'),
+    path('chunked-upload/finalize/', views.chunked_upload_finalize, name='chunked_upload_finalize'),
+    path('chunked-upload/<str:upload_id>/', views.chunked_upload_status, name='chunked_upload_status'),
+    path('chunked-upload/<str:upload_id>/<int:index>/', views.chunked_upload_chunk, name='chunked_upload_chunk'),
     path('upload/', views.upload_file, name='upload_file'), # Keep for compatibility but redirects
     path('result/', views.show_result, name='show_result'),
     path('history/', views.file_history, name='file_history'),
     path('detail/<int:file_id>/', views.file_detail, name='file_detail'),
     path('download/<int:file_id>/', views.download_file, name='download_file'),
+    path('export/', views.export_results, name='export_results'),
+    path('bundle/', views.download_bundle, name='download_bundle'),
+    path('report/summary/', views.report_summary, name='report_summary'),
+    path('metrics', views.metrics, name='metrics'),
 ]
@@ -1,198 +1,53 @@
+import io
 import os
 import re
-import tempfile
 import zipfile
-import shutil
 import traceback
-import time
-import pythoncom
-
-# 尝试导入处理不同格式文档的库
-try:
-    from docx import Document  # 处理.docx文件
-except ImportError:
-    print("警告: python-docx库未安装，.docx文件处理功能将不可用")
-
-try:
-    import docx2txt  # 处理.doc和.docx文件的备选方案
-except ImportError:
-    print("警告: docx2txt库未安装，将尝试使用其他方法")
-    docx2txt = None
-
-def extract_text_with_win32com(file_path, max_retries=3):
-    """使用win32com优化提取Word文档内容，增加重试机制和错误处理"""
-    text = ""
-    word = None
-    doc = None
-    
-    for retry in range(max_retries):
-        try:
-            # 在多线程环境中需要初始化COM
-            import pythoncom
-            pythoncom.CoInitialize()
-            
-            # 使用 win32com 自动化 Word。某些情况下 win32com 的 gen_py 缓存会损坏，
-            # 导致类似 "module 'win32com.gen_py.xxx' has no attribute 'CLSIDToPackageMap'" 的错误。
-            # 为提高鲁棒性，按以下顺序尝试：
-            # 1) 优先使用 DispatchEx（更适合多线程，且通常能避免 gen_py 的一些问题）
-            # 2) 若失败，尝试使用 gencache.EnsureDispatch（可能会触发生成/修复 gen_py）
-            # 3) 若 EnsureDispatch 失败，尝试 gencache.Rebuild 再 EnsureDispatch
-            import win32com.client
-            try:
-                # DispatchEx 在多线程或并发环境下更安全
-                word = win32com.client.DispatchEx("Word.Application")
-            except Exception as de:
-                # DispatchEx 失败时，尝试通过 gencache 修复生成的缓存并使用 Dispatch
-                try:
-                    from win32com.client import gencache
-                    try:
-                        # EnsureDispatch 有时会修复缺失的 gen_py 模块
-                        gencache.EnsureDispatch("Word.Application")
-                    except Exception:
-                        # 如果 EnsureDispatch 也失败，尝试 Rebuild 再 EnsureDispatch
-                        try:
-                            gencache.Rebuild()
-                            gencache.EnsureDispatch("Word.Application")
-                        except Exception:
-                            # 如果仍然失败，让外层捕获并记录错误
-                            raise
-                    # 最终以普通 Dispatch 取得对象
-                    word = win32com.client.Dispatch("Word.Application")
-                except Exception as e_gencache:
-                    # 最后尝试使用动态派生（dynamic.Dispatch）以绕开 gen_py 缓存问题
-                    try:
-                        from win32com.client import dynamic
-                        word = dynamic.Dispatch("Word.Application")
-                    except Exception as e_dynamic:
-                        # 将原始错误与 gencache / dynamic 错误都记录并抛出，以便外层捕获
-                        raise RuntimeError(f"win32com Dispatch 失败: DispatchEx error={de}; gencache error={e_gencache}; dynamic error={e_dynamic}")
-
-            # 设置可见性和警告行为
-            word.Visible = False
-            word.DisplayAlerts = False
-            
-            # 使用绝对路径并确保文件存在
-            abs_path = os.path.abspath(file_path)
-            if not os.path.exists(abs_path):
-                raise FileNotFoundError(f"文件不存在: {abs_path}")
-            
-            # 尝试打开文档
-            if file_path.lower().endswith('.doc'):
-                doc = word.Documents.Open(abs_path)
-            else:
-                doc = word.Documents.Open(abs_path)
-            
-            # 短暂延迟确保文档完全加载
-            time.sleep(0.5)
-            
-            # 提取文本内容
-            text = doc.Content.Text
-            
-            # 清理资源
-            if doc:
-                doc.Close(SaveChanges=False)
-                doc = None
-            if word:
-                word.Quit()
-                word = None
-                
-            break  # 成功提取，退出重试循环
-            
-        except Exception as e:
-            # 清理资源
-            if doc:
-                try:
-                    doc.Close(SaveChanges=False)
-                except:
-                    pass
-            if word:
-                try:
-                    word.Quit()
-                except:
-                    pass
-            word = None
-            doc = None
-            
-            if retry < max_retries - 1:
-                print(f"win32com提取尝试 {retry+1} 失败: {e}，将重试...")
-                time.sleep(1)  # 重试前等待1秒
-            else:
-                print(f"win32com提取失败（所有尝试）: {e}")
-    
-    return text
+from contextlib import ExitStack
+from zoneinfo import ZoneInfo
 
-def read_word_document(file_path):
-    """读取Word文档内容，支持多种方法"""
-    full_text = []
-    
-    # 根据文件类型选择不同的读取方法
-    if file_path.lower().endswith('.docx') and 'Document' in globals():
-        # 使用python-docx处理.docx文件
-        doc = Document(file_path)
-        print(f"使用python-docx处理.docx文件")
-        
-        print(f"文档包含 {len(doc.paragraphs)} 个段落")
-        for i, para in enumerate(doc.paragraphs):
-            if para.text.strip():
-                full_text.append(para.text)
-                if i < 3:  # 只打印前3个段落内容作为示例
-                    print(f"段落 {i+1} 内容预览: {para.text[:50]}...")
-        
-        # 读取表格内容
-        print(f"文档包含 {len(doc.tables)} 个表格")
-        for table in doc.tables:
-            for row in table.rows:
-                row_text = []
-                for cell in row.cells:
-                    if cell.text.strip():
-                        row_text.append(cell.text.strip())
-                if row_text:
-                    full_text.append('\t'.join(row_text))
-    
-    elif docx2txt is not None:
-        # 尝试使用docx2txt处理
-        try:
-            print(f"尝试使用docx2txt处理文件")
-            text = docx2txt.process(file_path)
-            if text.strip():
-                full_text = text.split('\n')
-                print(f"成功提取文本内容，约 {len(full_text)} 行")
-                if len(full_text) > 0:
-                    print(f"内容预览: {full_text[0][:100]}...")
-        except Exception as e:
-            print(f"docx2txt处理失败: {e}，尝试使用win32com")
-    
-    # 无论前面是否成功，都尝试使用win32com作为备选方案
-    if not full_text:
-        try:
-            print("尝试使用win32com处理文档")
-            text = extract_text_with_win32com(file_path)
-            if text.strip():
-                full_text = text.split('\n')
-                print(f"成功提取文本内容，约 {len(full_text)} 行")
-                if len(full_text) > 0:
-                    print(f"内容预览: {full_text[0][:100]}...")
-        except Exception as inner_e:
-            print(f"win32com处理失败: {inner_e}")
-            # 最后尝试一个简单的方法 - 如果是.docx，可以作为zip解压读取XML内容
-            if file_path.lower().endswith('.docx'):
-                print("尝试将.docx作为zip文件解压读取")
-                try:
-                    with zipfile.ZipFile(file_path, 'r') as doc_zip:
-                        # 读取document.xml文件
-                        with doc_zip.open('word/document.xml') as xml_file:
-                            xml_content = xml_file.read().decode('utf-8')
-                            # 简单移除XML标签
-                            text = re.sub(r'<[^>]+>', '', xml_content)
-                            text = re.sub(r'\s+', ' ', text)
-                            full_text = text.split(' ')
-                            print(f"成功提取部分内容")
-                except Exception as inner_inner_e:
-                    print(f"XML解析失败: {inner_inner_e}")
-                    print("无法提取文档内容")
-    
-    return full_text
+from django.conf import settings
+
+from .metrics import observe_stage
+from .readers import read_document
+from .rules import get_rules
+
+# 归一化时移除的空白字符（含全角空格、不换行空格与零宽字符）
+EXTRACTION_WHITESPACE_RE = re.compile(r'[\s\u00A0\u3000\u2000-\u200B\u202F\u205F\uFEFF]+')
+
+
+def format_beijing_datetime(dt):
+    if not dt:
+        return None
+    try:
+        bj = dt.astimezone(ZoneInfo('Asia/Shanghai'))
+        return bj.strftime('%Y-%m-%d %H:%M:%S')
+    except Exception:
+        return None
+
+def get_default_construction_order_code(order_code):
+    if not order_code:
+        return None
+
+    code = str(order_code).strip()
+    if not code:
+        return None
 
+    m = re.match(r'^(.*)_KC$', code)
+    if m:
+        base = m.group(1)
+        if base:
+            return f"{base}_JS"
+        return None
+
+    if code.endswith('KC') and len(code) >= 2:
+        return f"{code[:-2]}JS"
+
+    return None
+
+def read_word_document(source, name=None):
+    """读取Word文档内容，按格式选择可用的读取后端（见 readers.py）；source 为路径或文件对象"""
+    return read_document(source, name)
 
 def normalize_text_for_extraction(text):
     """
@@ -206,12 +61,12 @@ def normalize_text_for_extraction(text):
     """
     if not text:
         return ''
-    return re.sub(r'[\s\u00A0\u3000\u2000-\u200B\u202F\u205F\uFEFF]+', '', text)
+    return EXTRACTION_WHITESPACE_RE.sub('', text)
 
 
 
-def extract_price_info(text, price_type, patterns):
-    """从文本中提取价格信息"""
+def extract_price_info(text, price_type, patterns, not_found=0.0):
+    """从文本中提取价格信息，patterns 已按优先级排序"""
     for pattern in patterns:
         match = pattern.search(text)
         if match:
@@ -219,96 +74,41 @@ def extract_price_info(text, price_type, patterns):
             print(f"{price_type}: {price_str}元")
             return float(price_str.replace(',', ''))
     print(f"未找到{price_type}")
-    return 0.0
+    return not_found
 
-def extract_maintenance_fee(text):
+def extract_maintenance_fee(text, rules=None):
     """提取维护费（含税）合计"""
-    patterns = [
-        re.compile(r'维护费（含税）合计[：:]*([\d,]+\.?\d*)元'),
-        re.compile(r'维护费合计[：:]*([\d,]+\.?\d*)元'),
-        re.compile(r'维护费（含税）[：:]*([\d,]+\.?\d*)元')
-    ]
-    return extract_price_info(text, "维护费（含税）", patterns)
-
-def extract_overall_total_price(text):
+    rules = rules or get_rules()
+    return extract_price_info(text, rules.label('doc_maintenance_total'), rules.patterns('doc_maintenance_total'))
+
+def extract_overall_total_price(text, rules=None):
     """提取总体估算价格"""
-    patterns = [
-        re.compile(r'总体估算[：:]*([\d,]+\.?\d*)元'),
-        re.compile(r'总体估算价格[：:]*([\d,]+\.?\d*)元'),
-        re.compile(r'总体估算([\d,]+\.?\d*)元'),
-        re.compile(r'项目总体合计（含税）[：:]*([\d,]+\.?\d*)元'),
-        re.compile(r'总体估算（含税）共计[：:]*([\d,]+\.?\d*)元'),
-        re.compile(r'和商务总体估算（含税）共计[：:]*([\d,]+\.?\d*)元'),
-        re.compile(r'.*?和商务总体估算（含税）共计[：:]*([\d,]+\.?\d*)元'),
-    ]
-    for pattern in patterns:
-        match = pattern.search(text)
-        if match:
-            overall_total_price_str = match.group(1)
-            print(f"总体估算价格: {overall_total_price_str}元")
-            return float(overall_total_price_str.replace(',', ''))
-    print("未在文本中找到明确的总体估算价格")
-    return None
+    rules = rules or get_rules()
+    return extract_price_info(text, rules.label('overall_total_price'), rules.patterns('overall_total_price'), not_found=None)
 
-def extract_total_price(text):
+def extract_total_price(text, rules=None):
     """提取总估算价格"""
-    patterns = [
-        re.compile(r'项目合计（含税）总估算([\d,]+\.?\d*)元'),
-        re.compile(r'总估算([\d,]+\.?\d*)元'),
-        re.compile(r'总估算[：:]*([\d,]+\.?\d*)元')
-    ]
-    for pattern in patterns:
-        match = pattern.search(text)
-        if match:
-            total_price_str = match.group(1)
-            print(f"总估算价格: {total_price_str}元")
-            return float(total_price_str.replace(',', ''))
-    print("未在文本中找到明确的总估算价格")
-    return None
+    rules = rules or get_rules()
+    return extract_price_info(text, rules.label('total_price'), rules.patterns('total_price'), not_found=None)
 
-def extract_broadband_maintenance_fee(text):
+def extract_broadband_maintenance_fee(text, rules=None):
     """提取宽带维护费价格"""
-    patterns = [
-        re.compile(r'宽带维护费（含税）[：:]*([\d,]+\.?\d*)元'),
-        re.compile(r'宽带维护费（含税）[：:]*[^=]*=([\d,]+\.?\d*)元'),
-        re.compile(r'宽带维护费（含税）合计[：:]*([\d,]+\.?\d*)元')
-    ]
-    return extract_price_info(text, "宽带维护费（含税）", patterns)
-
-def extract_broadband_service_fee(text):
+    rules = rules or get_rules()
+    return extract_price_info(text, rules.label('maintenance_fee'), rules.patterns('maintenance_fee'))
+
+def extract_broadband_service_fee(text, rules=None):
     """提取宽带服务费价格"""
-    patterns = [
-        re.compile(r'宽带服务费（含税）[：:]*([\d,]+\.?\d*)元'),
-        re.compile(r'宽带服务费（含税）[：:]*[^=]*=([\d,]+\.?\d*)元'),
-        re.compile(r'宽带服务费（含税）[：:]*([\d,]+\.?\d*)元')
-    ]
-    return extract_price_info(text, "宽带服务费（含税）", patterns)
-
-def extract_terminal_fee(text):
+    rules = rules or get_rules()
+    return extract_price_info(text, rules.label('service_fee'), rules.patterns('service_fee'))
+
+def extract_terminal_fee(text, rules=None):
     """提取终端费价格"""
-    patterns = [
-        re.compile(r'终端费（含税）[：:]*([\d,]+\.?\d*)元'),
-        re.compile(r'终端费（含税）[：:]*[^=]*=([\d,]+\.?\d*)元'),
-        re.compile(r'终端费（含税）[：:]*([\d,]+\.?\d*)元')
-    ]
-    return extract_price_info(text, "终端费（含税）", patterns)
-
-def extract_fiber_info(text):
+    rules = rules or get_rules()
+    return extract_price_info(text, rules.label('terminal_fee'), rules.patterns('terminal_fee'))
+
+def extract_fiber_info(text, rules=None):
     """提取光缆信息 - 支持多条光缆记录，返回JSON格式数据"""
-    # 尝试多种可能的光缆长度格式
-    fiber_patterns = [
-        re.compile(r'光缆([\d.]+)米'),         # 光缆123米
-        re.compile(r'光缆长度[：:]([\d.]+)米'),  # 光缆长度：123米
-        re.compile(r'光缆长度为([\d.]+)米'),  # 光缆长度为123米
-        re.compile(r'光缆约([\d.]+)米'),  # 光缆约123米
-        re.compile(r'([\d.]+)米光缆'),  # 123米光缆
-        # 添加更多可能的格式
-        re.compile(r'光缆总长度[：:]([\d.]+)米'),  # 光缆总长度：123米
-        re.compile(r'光缆总长[：:]([\d.]+)米'),    # 光缆总长：123米
-        re.compile(r'光纤([\d.]+)米'),         # 光纤123米
-        re.compile(r'光缆铺设([\d.]+)米'),  # 光缆铺设123米
-        re.compile(r'铺设光缆([\d.]+)米')   # 铺设光缆123米
-    ]
+    rules = rules or get_rules()
     
     # 首先在过滤后的文本中搜索
     print(f"\n=== 开始搜索光缆信息 ===")
@@ -317,7 +117,7 @@ def extract_fiber_info(text):
     fiber_info = []
     matched_positions = set()  # 用于记录已匹配的位置，避免重复
     
-    for pattern in fiber_patterns:
+    for pattern in rules.fiber_patterns:
         # 使用finditer找到所有匹配
         for match in pattern.finditer(text):
             start_pos = match.start()
@@ -335,11 +135,7 @@ def extract_fiber_info(text):
                 description = "光缆"
                 
                 # 尝试从上下文提取描述
-                description_patterns = [
-                    re.compile(r'(\w+)光缆'),
-                    re.compile(r'光缆(\w+)')
-                ]
-                for desc_pattern in description_patterns:
+                for desc_pattern in rules.fiber_description_patterns:
                     desc_match = desc_pattern.search(context)
                     if desc_match and desc_match.group(1):
                         description = desc_match.group(1) + "光缆"
@@ -358,6 +154,15 @@ def extract_fiber_info(text):
     
     return fiber_info
 
+def fiber_total_length(fiber_info):
+    """光缆信息列表中的长度合计"""
+    total = 0
+    for item in fiber_info or []:
+        length = item.get('length') if isinstance(item, dict) else None
+        if isinstance(length, (int, float)):
+            total += length
+    return total
+
 def verify_calculation(info):
     """进行验算比较"""
     if info['doc_maintenance_total'] is not None:
@@ -380,6 +185,50 @@ def debug_keyword_search(text):
         else:
             print(f"  - '{keyword}' 未找到")
 
+def extract_fields_from_text(normalized_text):
+    """匹配阶段：在归一化文本上运行费用、光缆规则并验算
+
+    不涉及解压和文档解析，规则变更后可直接对已存储的归一化文本重新执行。
+    """
+    # 整篇文档使用同一版规则，即使处理过程中规则被替换
+    rules = get_rules()
+    info = {}
+
+    # 提取维护费（含税）合计
+    info['doc_maintenance_total'] = extract_maintenance_fee(normalized_text, rules)
+
+    # 提取总体估算价格
+    info['overall_total_price'] = extract_overall_total_price(normalized_text, rules)
+
+    # 提取总估算价格
+    info['total_price'] = extract_total_price(normalized_text, rules)
+
+    # 提取宽带维护费价格
+    info['maintenance_fee'] = extract_broadband_maintenance_fee(normalized_text, rules)
+
+    # 提取宽带服务费价格
+    info['service_fee'] = extract_broadband_service_fee(normalized_text, rules)
+
+    # 提取终端费价格
+    info['terminal_fee'] = extract_terminal_fee(normalized_text, rules)
+
+    # 计算费用总和
+    info['total_fees'] = info['maintenance_fee'] + info['service_fee'] + info['terminal_fee']
+    print(f"宽带维护费、宽带服务费和终端费的总和: {info['total_fees']:.4f}元")
+
+    # 提取光缆信息
+    info['fiber_info'] = extract_fiber_info(normalized_text, rules)
+
+    if not info['fiber_info']:
+        print("未找到光缆信息")
+        debug_keyword_search(normalized_text)
+    print("========================\n")
+
+    # 进行验算比较
+    info['verification_passed'] = verify_calculation(info)
+    info['rules_version'] = rules.version
+    return info
+
 def extract_info_from_word(file_path, original_name=None):
     """从单个Word文档中提取信息
     
@@ -421,6 +270,7 @@ def extract_info_from_word(file_path, original_name=None):
                             'total_price': None,
                             'fiber_info': [],
                             'document_content': raw_text,
+                            'normalized_text': normalized_text,
                             'verification_passed': False,
                             'file_name': file_name,
                             'extraction_status': '成功'
@@ -429,39 +279,8 @@ def extract_info_from_word(file_path, original_name=None):
                         print(f"\n=== 提取到的价格信息 ===")
                         print(f"单号: {order_code}")
                         
-                        # 提取维护费（含税）合计
-                        info['doc_maintenance_total'] = extract_maintenance_fee(normalized_text)
-                        
-                        # 提取总体估算价格
-                        info['overall_total_price'] = extract_overall_total_price(normalized_text)
-                        
-                        # 提取总估算价格
-                        info['total_price'] = extract_total_price(normalized_text)
-                        
-                        # 提取宽带维护费价格
-                        info['maintenance_fee'] = extract_broadband_maintenance_fee(normalized_text)
-                        
-                        # 提取宽带服务费价格
-                        info['service_fee'] = extract_broadband_service_fee(normalized_text)
-                        
-                        # 提取终端费价格
-                        info['terminal_fee'] = extract_terminal_fee(normalized_text)
-                        
-                        # 计算费用总和
-                        info['total_fees'] = info['maintenance_fee'] + info['service_fee'] + info['terminal_fee']
-                        print(f"宽带维护费、宽带服务费和终端费的总和: {info['total_fees']:.4f}元")
-                        
-                        # 提取光缆信息
-                        fiber_info_list = extract_fiber_info(normalized_text)
-                        info['fiber_info'] = fiber_info_list
-                        
-                        if not info['fiber_info']:
-                            print("未找到光缆信息")
-                            debug_keyword_search(normalized_text)
-                        print("========================\n")
-                        
-                        # 进行验算比较
-                        info['verification_passed'] = verify_calculation(info)
+                        # 匹配阶段：费用、光缆与验算
+                        info.update(extract_fields_from_text(normalized_text))
                         
                         print(f"====================\n")
                         results.append(info)
@@ -501,22 +320,68 @@ def extract_info_from_word(file_path, original_name=None):
         
     return results
 
-def extract_info_from_zip(zip_path, original_name=None):
+ORDER_CODE_RE = re.compile(r'(EOSC_[A-Za-z0-9_\-]+)(?:[^A-Za-z0-9_\-]|$)')
+
+
+def _is_word_member(name):
+    return name.lower().endswith(('.doc', '.docx')) and not name.lower().endswith('.bak')
+
+
+def _archive_max_depth():
+    return getattr(settings, 'UPLOAD_ARCHIVE_MAX_DEPTH', 3)
+
+
+def _walk_archive(zip_ref, stack, archive_path, codes, depth, max_depth, entries):
+    """按压缩包内顺序收集 Word 文档，遇到内层 ZIP 时以流方式打开继续遍历
+
+    内层压缩包通过 zip_ref.open() 直接从外层解压流读取，不写入磁盘；打开的 ZipFile
+    登记在 stack 中，文档读取完后统一关闭。codes 为由外向内各层压缩包文件名中的单号。
+    超过层数或无法打开的内层压缩包以带 error 的条目记录，不会被静默跳过。
+    """
+    for member in zip_ref.infolist():
+        if member.is_dir():
+            continue
+        if _is_word_member(member.filename):
+            entries.append({'zip': zip_ref, 'member': member, 'archive_path': archive_path, 'codes': codes})
+        elif member.filename.lower().endswith('.zip'):
+            failed = {'zip': None, 'member': member, 'archive_path': archive_path, 'codes': codes}
+            if depth >= max_depth:
+                entries.append({**failed, 'error': f'嵌套压缩包超过 {max_depth} 层，未展开'})
+                continue
+            try:
+                inner = stack.enter_context(zipfile.ZipFile(stack.enter_context(zip_ref.open(member))))
+            except (zipfile.BadZipFile, OSError, RuntimeError, NotImplementedError) as e:
+                entries.append({**failed, 'error': f'无法打开内层压缩包: {e}'})
+                continue
+            inner_path = f'{archive_path}/{member.filename}' if archive_path else member.filename
+            match = ORDER_CODE_RE.search(os.path.basename(member.filename))
+            _walk_archive(inner, stack, inner_path, codes + [match.group(1)] if match else codes, depth + 1, max_depth, entries)
+
+
+def extract_info_from_zip(zip_path, original_name=None, progress=None, max_depth=None):
     """从ZIP文件中提取Word文档内容并解析价格信息
 
     Args:
         zip_path (str): ZIP文件的物理路径
         original_name (str, optional): 原始上传的ZIP文件名，用于提取单号
+        progress (callable, optional): 进度回调 progress(event, **data)，
+            解压完成时发送 archive_opened，每处理完一个文档发送 document
+        max_depth (int, optional): 内层 ZIP 最多展开的层数（0 表示不展开），默认 settings.UPLOAD_ARCHIVE_MAX_DEPTH
+
+    文档逐个从压缩包（含内层压缩包）中读入内存解析，不解压到磁盘；
+    每条结果的 archive_path 为文档所在的内层压缩包路径（如 “a/b.zip/c.zip”），直接位于上传压缩包中时为空。
     """
+    if progress is None:
+        progress = lambda event, **data: None
+    if max_depth is None:
+        max_depth = _archive_max_depth()
     print(f"开始处理压缩文件: {zip_path}")
     results = []
-    temp_dir = tempfile.mkdtemp()
-    extracted_files = []
     
     # 从ZIP文件名提取单号，优先使用原始文件名
     zip_file_name = original_name or os.path.basename(zip_path)
     # 使用更精确的正则表达式提取EOSC_开头的单号 (例如从 EOSC_4712508269337893_KC... 中提取 EOSC_4712508269337893)
-    zip_code_match = re.search(r'(EOSC_[A-Za-z0-9_\-]+)(?:[^A-Za-z0-9_\-]|$)', zip_file_name)
+    zip_code_match = ORDER_CODE_RE.search(zip_file_name)
     zip_code_part = zip_code_match.group(1) if zip_code_match else None
     if zip_code_part:
         print(f"从ZIP文件名提取到单号: {zip_code_part}")
@@ -524,67 +389,66 @@ def extract_info_from_zip(zip_path, original_name=None):
         print(f"无法从ZIP文件名 {zip_file_name} 中提取单号")
     
     try:
-        print(f"创建临时目录: {temp_dir}")
-        
         # 首先验证文件是否为有效的ZIP文件
         if not zipfile.is_zipfile(zip_path):
-            raise ValueError(f"提供的文件不是有效的ZIP文件: {zip_path}")
-        
-        # 解压zip文件
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            print(f"开始解压文件...")
-            zip_ref.extractall(temp_dir)
-            print(f"解压完成，解压到临时目录: {temp_dir}")
-            
-            # 获取解压后的所有文件
-            print("开始获取解压后的文件列表...")
-            for root, dirs, files in os.walk(temp_dir):
-                print(f"在目录 {root} 中发现 {len(files)} 个文件")
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    extracted_files.append(file_path)
-                    print(f"找到文件: {file_path}")
+            raise ValueError(f"提供的文件不是有效的ZIP文件: {zip_file_name}")
         
-        print(f"总共解压出 {len(extracted_files)} 个文件")
-        
-        # 处理每个Word文档，包括.doc和.docx格式
-        word_files = [f for f in extracted_files if f.lower().endswith(('.doc', '.docx')) and not f.lower().endswith('.bak')]
-        print(f"找到 {len(word_files)} 个Word文件(.doc或.docx)")
-        for file in word_files:
-            print(f"- {os.path.basename(file)}")
-        
-        for file_path in word_files:
-            print(f"\n处理Word文档: {file_path}")
-            file_name = os.path.basename(file_path)
-            print(f"文件名: {file_name}")
+        with ExitStack() as stack:
+            # 遍历压缩包（含内层压缩包）的目录，只读取中央目录，不解压文档
+            entries = []
+            with observe_stage('unzip'):
+                zip_ref = stack.enter_context(zipfile.ZipFile(zip_path, 'r'))
+                _walk_archive(zip_ref, stack, '', [zip_code_part] if zip_code_part else [], 0, max_depth, entries)
+            print(f"找到 {len(entries)} 个Word文件(.doc或.docx)或无法展开的内层压缩包")
             
-            # 优先使用来自原始ZIP文件名的单号，如果ZIP单号存在则直接使用，不再从Word文件名提取
-            if zip_code_part:
-                order_code = zip_code_part
-                print(f"使用ZIP文件名的单号: {order_code}")
-            else:
-                # 如果ZIP单号不存在，再尝试从Word文档文件名中提取
-                match = re.search(r'(EOSC_[A-Za-z0-9_\-]+)(?:[^A-Za-z0-9_\-]|$)', file_name)
-                if match:
-                    order_code = match.group(1)
-                    print(f"从Word文件名提取到单号: {order_code}")
-                else:
-                    print(f"无法从文件名 {file_name} 中提取单号")
+            progress('archive_opened', documents=len(entries))
+
+            for index, entry in enumerate(entries, 1):
+                member, archive_path, codes = entry['member'], entry['archive_path'], entry['codes']
+                file_name = os.path.basename(member.filename)
+                if entry['zip'] is None:
+                    # 超过层数或损坏的内层压缩包：记为失败，避免其中的文档被静默遗漏
+                    print(f"未展开内层压缩包 {member.filename}: {entry['error']}")
+                    results.append({
+                        'order_code': codes[0] if codes else '未知',
+                        'file_name': file_name,
+                        'archive_path': archive_path,
+                        'fiber_info': [],
+                        'document_content': '',
+                        'extraction_status': '失败',
+                        'error': entry['error'],
+                    })
+                    progress('document', current=index, total=len(entries), name=file_name, status='失败')
                     continue
+
+                print(f"\n处理Word文档: {archive_path + '/' if archive_path else ''}{member.filename}")
                 
-            # 读取Word文档内容
-            try:
-                print("开始读取Word文档内容...")
-                full_text = read_word_document(file_path)
-                
-                raw_text = '\n'.join(full_text)
-                normalized_text = normalize_text_for_extraction(raw_text)
-                marker_found = True
-                
-                if marker_found:
+                # 优先使用压缩包文件名（由外向内第一个带单号的）中的单号，不再从Word文件名提取
+                if codes:
+                    order_code = codes[0]
+                    print(f"使用ZIP文件名的单号: {order_code}")
+                else:
+                    # 如果ZIP单号不存在，再尝试从Word文档文件名中提取
+                    match = ORDER_CODE_RE.search(file_name)
+                    if match:
+                        order_code = match.group(1)
+                        print(f"从Word文件名提取到单号: {order_code}")
+                    else:
+                        print(f"无法从文件名 {file_name} 中提取单号")
+                        progress('document', current=index, total=len(entries), name=file_name, status='跳过')
+                        continue
+                    
+                # 读取Word文档内容
+                try:
+                    print("开始读取Word文档内容...")
+                    with observe_stage('read'):
+                        full_text = read_word_document(io.BytesIO(entry['zip'].read(member)), file_name)
+                    
+                    raw_text = '\n'.join(full_text)
+                    normalized_text = normalize_text_for_extraction(raw_text)
                     # 提取各类价格信息
                     info = {
-                            'order_code': order_code,
+                        'order_code': order_code,
                         'maintenance_fee': 0.0,
                         'service_fee': 0.0,
                         'terminal_fee': 0.0,
@@ -594,87 +458,48 @@ def extract_info_from_zip(zip_path, original_name=None):
                         'total_price': None,
                         'fiber_info': [],
                         'document_content': raw_text,
+                        'normalized_text': normalized_text,
                         'verification_passed': False,
                         'file_name': file_name,
+                        'archive_path': archive_path,
                         'extraction_status': '成功'
                     }
                     
                     print(f"\n=== 提取到的价格信息 ===")
                     print(f"单号: {order_code}")
                     
-                    # 提取维护费（含税）合计
-                    info['doc_maintenance_total'] = extract_maintenance_fee(normalized_text)
-                    
-                    # 提取总体估算价格
-                    info['overall_total_price'] = extract_overall_total_price(normalized_text)
-                    
-                    # 提取总估算价格
-                    info['total_price'] = extract_total_price(normalized_text)
-                    
-                    # 提取宽带维护费价格
-                    info['maintenance_fee'] = extract_broadband_maintenance_fee(normalized_text)
-                    
-                    # 提取宽带服务费价格
-                    info['service_fee'] = extract_broadband_service_fee(normalized_text)
-                    
-                    # 提取终端费价格
-                    info['terminal_fee'] = extract_terminal_fee(normalized_text)
-                    
-                    # 计算费用总和
-                    info['total_fees'] = info['maintenance_fee'] + info['service_fee'] + info['terminal_fee']
-                    print(f"宽带维护费、宽带服务费和终端费的总和: {info['total_fees']:.4f}元")
-                    
-                    # 提取光缆信息
-                    fiber_info_list = extract_fiber_info(normalized_text)
-                    info['fiber_info'] = fiber_info_list
-                    
-                    if not info['fiber_info']:
-                        print("未找到光缆信息")
-                        debug_keyword_search(normalized_text)
-                    print("========================\n")
-                    
-                    # 进行验算比较
-                    info['verification_passed'] = verify_calculation(info)
+                    # 匹配阶段：费用、光缆与验算
+                    with observe_stage('match'):
+                        info.update(extract_fields_from_text(normalized_text))
                     
                     print(f"====================\n")
                     results.append(info)
-                else:
-                    print(f"未找到标记文本，跳过后续处理")
+                except Exception as e:
+                    print(f"处理文件 {member.filename} 时出错: {e}")
+                    print(traceback.format_exc())
                     results.append({
-                    'order_code': order_code,
+                        'order_code': order_code,
                         'file_name': file_name,
+                        'archive_path': archive_path,
                         'fiber_info': [],
-                        'document_content': raw_text,
+                        'document_content': '',
                         'extraction_status': '失败',
-                        'error': '未找到关键标记文本'
+                        'error': str(e)
                     })
-            except Exception as e:
-                print(f"处理文件 {file_path} 时出错: {e}")
-                print(traceback.format_exc())
-                results.append({
-                    'order_code': order_code if 'order_code' in locals() else '未知',
-                    'file_name': file_name,
-                    'fiber_info': [],
-                    'document_content': '',
-                    'extraction_status': '失败',
-                    'error': str(e)
-                })
+                progress('document', current=index, total=len(entries), name=file_name, status=results[-1]['extraction_status'])
     except Exception as e:
         print(f"处理压缩文件 {zip_path} 时出错: {e}")
         print(traceback.format_exc())
-        # 添加错误信息到结果中，以便前端展示
+        # 添加错误信息到结果中，以便前端展示；archive_error 标记整个压缩包无法读取（不是某个文档失败）
+        # 内容寻址存储中 zip_path 是按哈希命名的文件，显示上传时的原始文件名
         results.append({
             'order_code': '未知',
-            'file_name': os.path.basename(zip_path),
+            'file_name': zip_file_name,
             'fiber_info': [],
             'document_content': '',
             'error': str(e),
-            'extraction_status': '失败'
+            'extraction_status': '失败',
+            'archive_error': True,
         })
 
-    finally:
-        # 清理临时目录
-        print(f"清理临时目录: {temp_dir}")
-        shutil.rmtree(temp_dir)
-
     return results
@@ -1,58 +1,54 @@
+import asyncio
+import contextlib
 import os
+import hashlib
 import logging
 import re
 import json
 import zipfile
+from datetime import date
+from decimal import Decimal
 from functools import lru_cache
 from zoneinfo import ZoneInfo
 from xml.etree import ElementTree
 from urllib.parse import urlencode
 from urllib.request import Request, urlopen
 from urllib.error import URLError, HTTPError
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
+from django.urls import reverse
+from django.template.loader import render_to_string
 from django.conf import settings
 from django.contrib import messages
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import BooleanField, Case, ExpressionWrapper, Prefetch, Q, Sum, Value, When
 from django.utils import timezone
-from django.http import HttpResponse, JsonResponse
-from django.views.decorators.http import require_POST
-from wsgiref.util import FileWrapper
-import mimetypes
-from .utils import extract_info_from_zip, extract_info_from_word
-from .models import UploadedFile, ExtractedInfo
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+from .utils import extract_info_from_word, format_beijing_datetime, get_default_construction_order_code
+from .models import UploadedFile, ExtractedInfo, ConstructionRemark, ReportSummary
+from .filters import parse_upload_filters, filter_uploaded_files
+from .documents import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, document_page
+from .downloads import serve_file
+from .retention import stored_file_path
+from .reporting import track_summary_changes, SUMMARY_VALUE_FIELDS
+from .scheduler import process_archives
+from .chunked import ChunkedUploadError, assemble, discard, init_upload, upload_status, write_chunk
+from .fragments import (
+    abump_sidebar_version, abump_upload_versions, bump_info_upload_versions, bump_sidebar_version, bump_upload_versions,
+    cached_fragment, sidebar_version,
+)
+from .metrics import GEOCODE_REQUESTS, GEOCODE_SECONDS, render_metrics, timed
+from .rules import current_rules_version
+from .progress import DONE_EVENT, aevent_stream, event_stream, progress_reporter, valid_token
+from .exports import export_queryset, iter_export_rows, stream_csv, stream_xlsx, bundle_queryset, stream_upload_bundle
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
-def format_beijing_datetime(dt):
-    if not dt:
-        return None
-    try:
-        bj = dt.astimezone(ZoneInfo('Asia/Shanghai'))
-        return bj.strftime('%Y-%m-%d %H:%M:%S')
-    except Exception:
-        return None
-
-def get_default_construction_order_code(order_code):
-    if not order_code:
-        return None
-
-    code = str(order_code).strip()
-    if not code:
-        return None
-
-    m = re.match(r'^(.*)_KC$', code)
-    if m:
-        base = m.group(1)
-        if base:
-            return f"{base}_JS"
-        return None
-
-    if code.endswith('KC') and len(code) >= 2:
-        return f"{code[:-2]}JS"
-
-    return None
-
 def _normalize_street_name(value):
     if value is None:
         return ''
@@ -214,100 +210,166 @@ def get_construction_unit_from_township(township):
 
     return None
 
-def _amap_get_json(endpoint, params, timeout_seconds=6):
+# 高德接口地址；基准测试（benchmark_asgi）中指向本地模拟服务
+def _amap_url(path):
+    return getattr(settings, 'AMAP_API_BASE', 'https://restapi.amap.com').rstrip('/') + path
+
+# 高德请求失败时 get_township_from_address 视为未解析到街道的异常
+AMAP_ERRORS = (HTTPError, URLError, json.JSONDecodeError, TimeoutError, ValueError)
+
+def _amap_fetch(endpoint, params, timeout_seconds):
     url = f"{endpoint}?{urlencode(params)}"
     req = Request(url, headers={'User-Agent': 'wordextractor/1.0'})
     with urlopen(req, timeout=timeout_seconds) as resp:
         raw = resp.read().decode('utf-8', errors='replace')
     return json.loads(raw)
 
-def get_township_from_address(address):
-    amap_key = getattr(settings, 'AMAP_API_KEY', None)
-    if not amap_key:
-        return None
+def _amap_metric_name(endpoint):
+    return endpoint.rstrip('/').rsplit('/', 1)[-1]
+
+def _amap_get_json(endpoint, params, timeout_seconds=6):
+    name = _amap_metric_name(endpoint)
+    try:
+        with timed(GEOCODE_SECONDS, name):
+            data = _amap_fetch(endpoint, params, timeout_seconds)
+    except Exception:
+        GEOCODE_REQUESTS.labels(name, 'error').inc()
+        raise
+    GEOCODE_REQUESTS.labels(name, 'ok' if str(data.get('status')) == '1' else 'error').inc()
+    return data
 
-    if not address:
+def _async_http_client():
+    """安装了 httpx 时返回 AsyncClient（请求在事件循环中原生异步执行）；否则返回 None，改为在线程中执行同步请求"""
+    try:
+        import httpx
+    except ImportError:
         return None
+    return httpx.AsyncClient(headers={'User-Agent': 'wordextractor/1.0'})
+
+async def _amap_get_json_async(endpoint, params, client=None, timeout_seconds=6):
+    name = _amap_metric_name(endpoint)
+    try:
+        with timed(GEOCODE_SECONDS, name):
+            if client is None:
+                data = await asyncio.to_thread(_amap_fetch, endpoint, params, timeout_seconds)
+            else:
+                data = await _httpx_get_json(client, endpoint, params, timeout_seconds)
+    except Exception:
+        GEOCODE_REQUESTS.labels(name, 'error').inc()
+        raise
+    GEOCODE_REQUESTS.labels(name, 'ok' if str(data.get('status')) == '1' else 'error').inc()
+    return data
 
+async def _httpx_get_json(client, endpoint, params, timeout_seconds):
+    import httpx
+    try:
+        resp = await client.get(endpoint, params=params, timeout=timeout_seconds)
+        resp.raise_for_status()
+    except httpx.HTTPError as e:
+        # 与 urllib 的异常统一，调用方只需处理 AMAP_ERRORS
+        raise URLError(e)
+    return json.loads(resp.content.decode('utf-8', errors='replace'))
+
+async def _geocode_address_async(address):
+    """上传时在调度器的事件循环中调用：地址 -> (街道, 施工单位)，等待高德响应时不占用线程"""
+    township = await get_township_from_address_async(address)
+    return township, get_construction_unit_from_township(township)
+
+def _amap_geo_params(address):
+    amap_key = getattr(settings, 'AMAP_API_KEY', None)
+    if not amap_key or not address:
+        return None
     normalized_address = str(address).replace('+', ' ').strip()
     if not normalized_address:
         return None
+    return {'key': amap_key, 'address': normalized_address, 'city': '昆明'}
 
-    try:
-        geo = _amap_get_json(
-            'https://restapi.amap.com/v3/geocode/geo',
-            {'key': amap_key, 'address': normalized_address, 'city': '昆明'},
-        )
-        if str(geo.get('status')) != '1':
-            return None
+def _amap_regeo_params(geo):
+    """地理编码结果 -> 逆地理编码参数；未解析到坐标时返回 None"""
+    if str(geo.get('status')) != '1':
+        return None
+    geocodes = geo.get('geocodes') or []
+    if not geocodes:
+        return None
+    location = geocodes[0].get('location')
+    if not location:
+        return None
+    return {'key': settings.AMAP_API_KEY, 'location': location, 'radius': 1000, 'extensions': 'base'}
 
-        geocodes = geo.get('geocodes') or []
-        if not geocodes:
-            return None
+def _amap_township(regeo):
+    """逆地理编码结果 -> 街道（乡镇），没有时退回道路名"""
+    if str(regeo.get('status')) != '1':
+        return None
 
-        location = geocodes[0].get('location')
-        if not location:
-            return None
+    address_component = (regeo.get('regeocode') or {}).get('addressComponent') or {}
+    township = address_component.get('township') or ''
+    if township:
+        return township
 
-        regeo = _amap_get_json(
-            'https://restapi.amap.com/v3/geocode/regeo',
-            {'key': amap_key, 'location': location, 'radius': 1000, 'extensions': 'base'},
-        )
-        if str(regeo.get('status')) != '1':
-            return None
+    street = ((address_component.get('streetNumber') or {}).get('street')) or ''
+    if street:
+        return street
+
+    return None
 
-        address_component = (regeo.get('regeocode') or {}).get('addressComponent') or {}
-        township = address_component.get('township') or ''
-        if township:
-            return township
+def get_township_from_address(address):
+    params = _amap_geo_params(address)
+    if params is None:
+        return None
 
-        street = ((address_component.get('streetNumber') or {}).get('street')) or ''
-        if street:
-            return street
+    try:
+        regeo_params = _amap_regeo_params(_amap_get_json(_amap_url('/v3/geocode/geo'), params))
+        if regeo_params is None:
+            return None
+        return _amap_township(_amap_get_json(_amap_url('/v3/geocode/regeo'), regeo_params))
+    except AMAP_ERRORS:
+        return None
 
+async def get_township_from_address_async(address):
+    """get_township_from_address 的异步版本，两次请求共用一个连接"""
+    params = _amap_geo_params(address)
+    if params is None:
         return None
-    except (HTTPError, URLError, json.JSONDecodeError, TimeoutError, ValueError):
+
+    try:
+        client = _async_http_client()
+        async with client or contextlib.nullcontext():
+            regeo_params = _amap_regeo_params(await _amap_get_json_async(_amap_url('/v3/geocode/geo'), params, client))
+            if regeo_params is None:
+                return None
+            return _amap_township(await _amap_get_json_async(_amap_url('/v3/geocode/regeo'), regeo_params, client))
+    except AMAP_ERRORS:
         return None
 
+def _finish_upload(outcomes, progress_token):
+    """上传处理完成：返回跳转地址（按提交顺序最后一个写入的上传）并发送结束事件"""
+    last_processed_id = None
+    for outcome in outcomes:
+        if outcome['upload'] is not None:
+            last_processed_id = outcome['upload'].id
+    if last_processed_id:
+        bump_sidebar_version()
+        url = reverse('dashboard_with_id', args=[last_processed_id])
+    else:
+        url = reverse('dashboard')
+    progress_reporter(progress_token)(DONE_EVENT, url=url)
+    return url
+
 def dashboard(request, file_id=None):
     """统一的仪表盘视图，处理上传和显示结果"""
     # 获取历史记录供侧边栏使用
-    filters = {
-        'q': (request.GET.get('q') or '').strip(),
-        'order_code': (request.GET.get('order_code') or '').strip(),
-        'group_name': (request.GET.get('group_name') or '').strip(),
-        'construction_unit': (request.GET.get('construction_unit') or '').strip(),
-    }
-
-    history_qs = UploadedFile.objects.all()
-    if filters['order_code']:
-        history_qs = history_qs.filter(extracted_infos__order_code__icontains=filters['order_code'])
-    if filters['group_name']:
-        history_qs = history_qs.filter(group_name__icontains=filters['group_name'])
-    if filters['construction_unit']:
-        history_qs = history_qs.filter(construction_unit__icontains=filters['construction_unit'], extracted_infos__construction_email_sent=True)
-    if filters['q']:
-        q = filters['q']
-        history_qs = history_qs.filter(
-            Q(original_filename__icontains=q)
-            | Q(group_name__icontains=q)
-            | Q(address__icontains=q)
-            | Q(township__icontains=q)
-            | Q(construction_unit__icontains=q)
-            | Q(extracted_infos__order_code__icontains=q)
-        )
+    filters = parse_upload_filters(request.GET)
+    history_qs = filter_uploaded_files(filters)
 
-    history_list = history_qs.distinct().order_by('-uploaded_at')[:50]
+    history_list = history_qs.order_by('-uploaded_at')[:50]
     history_query_string = request.GET.urlencode()
     
     context = {
-        'history_list': history_list,
         'selected_file_id': file_id,
-        'results': [],
-        'unique_codes': [],
         'selected_upload_id': file_id,
         'filters': filters,
         'history_query_string': history_query_string,
+        'chunked_threshold': getattr(settings, 'UPLOAD_CHUNKED_THRESHOLD', 16 * 1024 * 1024),
     }
 
     # 处理上传
@@ -322,103 +384,28 @@ def dashboard(request, file_id=None):
             messages.error(request, '请上传至少一个文件！')
             return redirect('dashboard')
 
-        # 处理文件
-        last_processed_id = None
-        for file in uploaded_files:
-            try:
-                # 验证文件类型
-                name_lower = file.name.lower()
-                is_zip = name_lower.endswith('.zip')
-                if not is_zip:
-                    messages.error(request, f'仅支持ZIP文件: {file.name}')
-                    continue
-
-                # 创建记录
-                filename_base = os.path.splitext(file.name)[0]
-                filename_base = re.sub(r'\(\d+\)$', '', filename_base)
-                parts = filename_base.split('+')
-                zip_group_name = parts[1] if len(parts) > 1 else ''
-                zip_address = '+'.join(parts[2:]) if len(parts) > 2 else ''
-                zip_township = get_township_from_address(zip_address)
-                zip_construction_unit = get_construction_unit_from_township(zip_township)
-                uploaded_file = UploadedFile(
-                    original_filename=file.name,
-                    file_size=file.size,
-                    file_type='zip',
-                    group_name=zip_group_name or None,
-                    address=zip_address or None,
-                    township=zip_township or None,
-                    construction_unit=zip_construction_unit or None,
-                    is_marked=True
-                )
-                uploaded_file.file = file
-                uploaded_file.save()
-                
-                last_processed_id = uploaded_file.id
-                file_path = uploaded_file.file.path
-                
-                # 提取
-                results = extract_info_from_zip(file_path, file.name)
-                
-                # 保存结果到数据库
-                if results:
-                    for result in results:
-                        maintenance_fee = float(result.get('maintenance_fee', 0))
-                        service_fee = float(result.get('service_fee', 0))
-                        terminal_fee = float(result.get('terminal_fee', 0))
-                        total_fees = float(result.get('total_fees', 0))
-                        doc_maintenance_total = float(result.get('doc_maintenance_total', 0)) if result.get('doc_maintenance_total') else None
-                        overall_total_price = float(result.get('overall_total_price', 0)) if result.get('overall_total_price') else None
-                        total_price = float(result.get('total_price', 0)) if result.get('total_price') else None
-                        other_fees = float(result.get('other_fees', 0)) if result.get('other_fees') else 0
-                        
-                        ExtractedInfo.objects.create(
-                            uploaded_file=uploaded_file,
-                            order_code=result.get('order_code'),
-                            construction_order_code=get_default_construction_order_code(result.get('order_code')),
-                            document_name=result.get('file_name', ''),
-                            document_content=result.get('document_content'),
-                            extraction_status=result.get('extraction_status', '成功'),
-                            extraction_error=result.get('error'),
-                            maintenance_fee=maintenance_fee,
-                            service_fee=service_fee,
-                            terminal_fee=terminal_fee,
-                            other_fees=other_fees,
-                            total_fees=total_fees,
-                            doc_maintenance_total=doc_maintenance_total,
-                            overall_total_price=overall_total_price,
-                            total_price=total_price,
-                            fiber_info=result.get('fiber_info'),
-                            equipment_items=result.get('equipment_items'),
-                            verification_passed=result.get('verification_passed', False),
-                            verification_message=result.get('verification_message')
-                        )
-                    uploaded_file.document_count = len(results)
-                
-                uploaded_file.is_processed = True
-                uploaded_file.processed_at = timezone.now()
-                uploaded_file.save()
+        # 进度事件写入共享缓存，由 upload_progress 以 SSE 推送给浏览器
+        progress_token = request.POST.get('progress_token')
+        progress_reporter(progress_token)('received', files=[file.name for file in uploaded_files])
 
-            except Exception as e:
-                logger.error(f"Error processing {file.name}: {e}")
-                if 'uploaded_file' in locals():
-                    uploaded_file.processing_error = str(e)
-                    uploaded_file.save()
+        # 多个压缩包并发处理：街道解析与文档提取分别在事件循环、进程池中执行，每个压缩包单独一个事务写库
+        outcomes = process_archives(uploaded_files, _geocode_address_async, progress_token)
 
-        # 上传完成后，重定向到该文件的详情页（如果只上传了一个，或者是最后一个）
-        if last_processed_id:
-            return redirect('dashboard_with_id', file_id=last_processed_id)
-        return redirect('dashboard')
+        # 提示消息按提交顺序给出，与各压缩包的完成先后无关
+        for outcome in outcomes:
+            if outcome['message']:
+                messages.error(request, outcome['message'])
+        return redirect(_finish_upload(outcomes, progress_token))
 
     # 处理显示结果 (GET)
     if file_id:
         try:
             uploaded_file = UploadedFile.objects.get(id=file_id)
-            extracted_infos = uploaded_file.extracted_infos.all()
+            # 文档原文不随页面输出，由 document_text 接口按需加载
+            extracted_infos = uploaded_file.extracted_infos.defer('normalized_text', 'document_content').annotate(
+                has_document_content=ExpressionWrapper(Q(document_content__gt=''), output_field=BooleanField()),
+            )
             
-            # 构造结果列表
-            results = []
-            unique_codes = set()
             filename_base = os.path.splitext(uploaded_file.original_filename)[0]
             filename_base = re.sub(r'\(\d+\)$', '', filename_base)
             parts = filename_base.split('+')
@@ -434,96 +421,128 @@ def dashboard(request, file_id=None):
                 zip_township = get_township_from_address(zip_address)
                 if zip_township:
                     uploaded_file.township = zip_township
-                    uploaded_file.save(update_fields=['township'])
+                    with transaction.atomic(), track_summary_changes(extracted_infos):
+                        uploaded_file.save(update_fields=['township'])
+                        bump_upload_versions([uploaded_file.id], sidebar=True)
+                    uploaded_file.refresh_from_db(fields=['content_version'])
 
             zip_construction_unit = uploaded_file.construction_unit
             if not zip_construction_unit and zip_township:
                 zip_construction_unit = get_construction_unit_from_township(zip_township)
                 if zip_construction_unit:
                     uploaded_file.construction_unit = zip_construction_unit
-                    uploaded_file.save(update_fields=['construction_unit'])
-
-            for info in extracted_infos:
-                # 确定显示单号
-                code = info.order_code
-                if not code or code == '未知':
-                    # 尝试从文件名提取简化的单号用于过滤
-                    base = os.path.splitext(info.document_name)[0]
-                    m = re.search(r'(EOSC_[A-Za-z0-9_\-]+)', base)
-                    code = m.group(1) if m else base
+                    with transaction.atomic(), track_summary_changes(extracted_infos):
+                        uploaded_file.save(update_fields=['construction_unit'])
+                        bump_upload_versions([uploaded_file.id], sidebar=True)
+                    uploaded_file.refresh_from_db(fields=['content_version'])
+
+            def render_results():
+                # 构造结果列表
+                results = []
+                unique_codes = set()
+                remarks = Prefetch('remarks', queryset=ConstructionRemark.objects.order_by('created_at'))
+                for info in extracted_infos.prefetch_related(remarks):
+                    # 确定显示单号
+                    code = info.order_code
+                    if not code or code == '未知':
+                        # 尝试从文件名提取简化的单号用于过滤
+                        base = os.path.splitext(info.document_name)[0]
+                        m = re.search(r'(EOSC_[A-Za-z0-9_\-]+)', base)
+                        code = m.group(1) if m else base
                 
-                unique_codes.add(code)
-
-                construction_order_code = info.construction_order_code
-                if not construction_order_code and info.order_code:
-                    construction_order_code = get_default_construction_order_code(info.order_code)
-                    if construction_order_code:
-                        info.construction_order_code = construction_order_code
-                        info.save(update_fields=['construction_order_code'])
+                    unique_codes.add(code)
+
+                    construction_order_code = info.construction_order_code
+                    if not construction_order_code and info.order_code:
+                        construction_order_code = get_default_construction_order_code(info.order_code)
+                        if construction_order_code:
+                            info.construction_order_code = construction_order_code
+                            info.save(update_fields=['construction_order_code'])
                 
-                results.append({
-                    'extracted_info_id': info.id,
-                    'file_name': info.document_name,
-                    'order_code': info.order_code,
-                    'display_code': code, # 用于前端过滤
-                    'construction_order_code': construction_order_code,
-                    'construction_email_sent': info.construction_email_sent,
-                    'construction_email_sent_at': format_beijing_datetime(info.construction_email_sent_at),
-                    'field_construction_at': format_beijing_datetime(info.field_construction_at),
-                    'resource_entry_at': format_beijing_datetime(info.resource_entry_at),
-                    'construction_completed_at': format_beijing_datetime(info.construction_completed_at),
-                    'resource_address': info.resource_address,
-                    'remarks': [{'id': r.id, 'content': r.content, 'created_at': format_beijing_datetime(r.created_at)} for r in info.remarks.order_by('created_at')],
-                    'extraction_status': info.extraction_status,
-                    'error': info.extraction_error,
-                    'maintenance_fee': info.maintenance_fee,
-                    'service_fee': info.service_fee,
-                    'terminal_fee': info.terminal_fee,
-                    'total_fees': info.total_fees,
-                    'doc_maintenance_total': info.doc_maintenance_total,
-                    'overall_total_price': info.overall_total_price,
-                    'total_price': info.total_price,
-                    'fiber_info': info.fiber_info,
-                    'equipment_items': info.equipment_items,
-                    'verification_passed': info.verification_passed,
-                    'document_content': info.document_content,
-                    'zip_order_code': zip_order_code,
-                    'zip_group_name': zip_group_name,
-                    'zip_address': zip_address,
-                    'zip_township': zip_township,
-                    'zip_construction_unit': zip_construction_unit,
-                })
+                    results.append({
+                        'extracted_info_id': info.id,
+                        'file_name': info.document_name,
+                        'archive_path': info.archive_path,
+                        'order_code': info.order_code,
+                        'display_code': code, # 用于前端过滤
+                        'construction_order_code': construction_order_code,
+                        'construction_email_sent': info.construction_email_sent,
+                        'construction_email_sent_at': format_beijing_datetime(info.construction_email_sent_at),
+                        'field_construction_at': format_beijing_datetime(info.field_construction_at),
+                        'resource_entry_at': format_beijing_datetime(info.resource_entry_at),
+                        'construction_completed_at': format_beijing_datetime(info.construction_completed_at),
+                        'resource_address': info.resource_address,
+                        'remarks': [{'id': r.id, 'content': r.content, 'created_at': format_beijing_datetime(r.created_at)} for r in info.remarks.all()],
+                        'extraction_status': info.extraction_status,
+                        'error': info.extraction_error,
+                        'maintenance_fee': info.maintenance_fee,
+                        'service_fee': info.service_fee,
+                        'terminal_fee': info.terminal_fee,
+                        'total_fees': info.total_fees,
+                        'doc_maintenance_total': info.doc_maintenance_total,
+                        'overall_total_price': info.overall_total_price,
+                        'total_price': info.total_price,
+                        'fiber_info': info.fiber_info,
+                        'equipment_items': info.equipment_items,
+                        'verification_passed': info.verification_passed,
+                        'fee_anomaly': info.fee_anomaly,
+                        'fee_anomaly_score': info.fee_anomaly_score,
+                        'has_document_content': info.has_document_content,
+                        'zip_order_code': zip_order_code,
+                        'zip_group_name': zip_group_name,
+                        'zip_address': zip_address,
+                        'zip_township': zip_township,
+                        'zip_construction_unit': zip_construction_unit,
+                    })
             
-            context['results'] = results
-            context['unique_codes'] = sorted(list(unique_codes))
-            context['zip_order_code'] = zip_order_code
-            context['zip_group_name'] = zip_group_name
-            context['zip_address'] = zip_address
-            context['zip_township'] = zip_township
-            context['zip_construction_unit'] = zip_construction_unit
+                return render_to_string('uploader/_results_panel.html', {
+                    'results': results,
+                    'unique_codes': sorted(unique_codes),
+                    'selected_upload_id': uploaded_file.id,
+                })
+
+            # 结果面板按 (上传ID, 内容版本) 缓存；任何修改提取结果或建设信息的接口都会递增 content_version
+            context['results_html'] = cached_fragment('results', [uploaded_file.id, uploaded_file.content_version], render_results)
             context['selected_upload_id'] = uploaded_file.id
             
         except UploadedFile.DoesNotExist:
             pass
 
+    if 'results_html' not in context:
+        context['results_html'] = render_to_string('uploader/_results_panel.html', {'results': []})
+
+    # 侧边栏历史列表按 (全局侧边栏版本, 筛选参数, 选中上传) 缓存，命中时不查询历史记录
+    context['history_html'] = cached_fragment(
+        'sidebar',
+        [sidebar_version(), history_query_string, file_id],
+        lambda: render_to_string('uploader/_history_list.html', {
+            'history_list': history_list,
+            'history_query_string': history_query_string,
+            'selected_file_id': file_id,
+        }),
+    )
     return render(request, 'uploader/dashboard.html', context)
 
 
+# 以下小型 JSON 接口为异步视图：ASGI 下在事件循环中处理，数据库操作尽量使用异步 ORM；
+# 需要在一个事务中同时维护汇总表的部分放到 sync_to_async 中执行（异步 ORM 不支持事务）
+
 @require_POST
-def toggle_upload_mark(request, file_id):
+async def toggle_upload_mark(request, file_id):
     try:
-        uploaded_file = UploadedFile.objects.get(id=file_id)
+        uploaded_file = await UploadedFile.objects.only('id', 'is_marked').aget(id=file_id)
     except UploadedFile.DoesNotExist:
         return JsonResponse({'ok': False, 'error': 'not_found'}, status=404)
 
     uploaded_file.is_marked = not uploaded_file.is_marked
-    uploaded_file.save(update_fields=['is_marked'])
+    await uploaded_file.asave(update_fields=['is_marked'])
+    await abump_sidebar_version()
     return JsonResponse({'ok': True, 'is_marked': uploaded_file.is_marked})
 
 @require_POST
-def update_construction_unit(request, file_id):
+async def update_construction_unit(request, file_id):
     try:
-        uploaded_file = UploadedFile.objects.get(id=file_id)
+        uploaded_file = await UploadedFile.objects.aget(id=file_id)
     except UploadedFile.DoesNotExist:
         return JsonResponse({'ok': False, 'error': 'not_found'}, status=404)
 
@@ -539,13 +558,19 @@ def update_construction_unit(request, file_id):
     else:
         uploaded_file.construction_unit = unit[:255]
 
-    uploaded_file.save(update_fields=['construction_unit'])
+    @sync_to_async
+    def save():
+        with transaction.atomic(), track_summary_changes(uploaded_file.extracted_infos.all()):
+            uploaded_file.save(update_fields=['construction_unit'])
+            bump_upload_versions([uploaded_file.id], sidebar=True)
+
+    await save()
     return JsonResponse({'ok': True, 'construction_unit': uploaded_file.construction_unit})
 
 @require_POST
-def update_construction_order_code(request, info_id):
+async def update_construction_order_code(request, info_id):
     try:
-        info = ExtractedInfo.objects.get(id=info_id)
+        info = await ExtractedInfo.objects.only('id', 'uploaded_file_id', 'construction_order_code').aget(id=info_id)
     except ExtractedInfo.DoesNotExist:
         return JsonResponse({'ok': False, 'error': 'not_found'}, status=404)
 
@@ -561,13 +586,14 @@ def update_construction_order_code(request, info_id):
     else:
         info.construction_order_code = code[:100]
 
-    info.save(update_fields=['construction_order_code'])
+    await info.asave(update_fields=['construction_order_code'])
+    await abump_upload_versions([info.uploaded_file_id])
     return JsonResponse({'ok': True, 'construction_order_code': info.construction_order_code})
 
 @require_POST
-def update_construction_email_sent(request, info_id):
+async def update_construction_email_sent(request, info_id):
     try:
-        info = ExtractedInfo.objects.get(id=info_id)
+        info = await ExtractedInfo.objects.only('id', 'uploaded_file_id').aget(id=info_id)
     except ExtractedInfo.DoesNotExist:
         return JsonResponse({'ok': False, 'error': 'not_found'}, status=404)
 
@@ -586,7 +612,14 @@ def update_construction_email_sent(request, info_id):
         info.construction_email_sent = False
         info.construction_email_sent_at = None
 
-    info.save(update_fields=['construction_email_sent', 'construction_email_sent_at'])
+    @sync_to_async
+    def save():
+        with transaction.atomic(), track_summary_changes(ExtractedInfo.objects.filter(pk=info.pk)):
+            info.save(update_fields=['construction_email_sent', 'construction_email_sent_at'])
+            # 施工单位筛选只包含已发送建设邮件的上传，侧边栏也需失效
+            bump_upload_versions([info.uploaded_file_id], sidebar=True)
+
+    await save()
     return JsonResponse({
         'ok': True,
         'construction_email_sent': info.construction_email_sent,
@@ -597,70 +630,74 @@ from .models import UploadedFile, ExtractedInfo, ConstructionRemark
 
 # ... (existing imports)
 
-@require_POST
-def update_construction_status(request, info_id):
-    """更新建设单进度状态"""
-    try:
-        info = ExtractedInfo.objects.get(id=info_id)
-    except ExtractedInfo.DoesNotExist:
-        return JsonResponse({'ok': False, 'error': 'not_found'}, status=404)
-
-    try:
-        payload = json.loads((request.body or b'{}').decode('utf-8', errors='replace'))
-    except json.JSONDecodeError:
-        payload = {}
+def _apply_construction_status(queryset, status_type, action, now):
+    """以集合 UPDATE 执行建设进度变更，返回未通过校验的行 {info_id: error}
 
-    status_type = payload.get('type')  # field_construction, resource_entry, completed
-    action = payload.get('action')     # set, unset
-
-    now = timezone.now()
-    updated_fields = []
+    规则：取消某一步会同时清空其后的步骤；设置某一步时补齐缺失的前置步骤；
+    设置“完成”前必须已填写资源地址。
+    """
+    errors = {}
 
     if status_type == 'field_construction':
         if action == 'set':
-            info.field_construction_at = now
-            updated_fields.append('field_construction_at')
+            queryset.update(field_construction_at=now)
         else:
             # Unset field construction -> Unset EVERYTHING
-            info.field_construction_at = None
-            info.resource_entry_at = None
-            info.construction_completed_at = None
-            updated_fields.extend(['field_construction_at', 'resource_entry_at', 'construction_completed_at'])
-        
+            queryset.update(field_construction_at=None, resource_entry_at=None, construction_completed_at=None)
+
     elif status_type == 'resource_entry':
         if action == 'set':
-            info.resource_entry_at = now
-            updated_fields.append('resource_entry_at')
+            queryset.update(resource_entry_at=now)
             # Auto-set previous step if missing
-            if not info.field_construction_at:
-                info.field_construction_at = now
-                updated_fields.append('field_construction_at')
+            queryset.filter(field_construction_at__isnull=True).update(field_construction_at=now)
         else:
             # Unset resource entry -> Unset completed
-            info.resource_entry_at = None
-            info.construction_completed_at = None
-            updated_fields.extend(['resource_entry_at', 'construction_completed_at'])
-        
+            queryset.update(resource_entry_at=None, construction_completed_at=None)
+
     elif status_type == 'completed':
         if action == 'set':
             # 校验资源地址
-            if not info.resource_address:
-                return JsonResponse({'ok': False, 'error': 'resource_address_required', 'msg': '请先填写资源地址'}, status=400)
-            info.construction_completed_at = now
-            updated_fields.append('construction_completed_at')
+            missing = queryset.filter(Q(resource_address__isnull=True) | Q(resource_address=''))
+            for pk in missing.values_list('pk', flat=True):
+                errors[pk] = 'resource_address_required'
+            eligible = queryset.exclude(pk__in=list(errors)) if errors else queryset
+            eligible.update(construction_completed_at=now)
             # Auto-set previous steps if missing (理论上前端会限制，这里做个兜底)
-            if not info.resource_entry_at:
-                info.resource_entry_at = now
-                updated_fields.append('resource_entry_at')
-            if not info.field_construction_at:
-                info.field_construction_at = now
-                updated_fields.append('field_construction_at')
+            eligible.filter(resource_entry_at__isnull=True).update(resource_entry_at=now)
+            eligible.filter(field_construction_at__isnull=True).update(field_construction_at=now)
         else:
-            info.construction_completed_at = None
-            updated_fields.append('construction_completed_at')
-    
-    if updated_fields:
-        info.save(update_fields=updated_fields)
+            queryset.update(construction_completed_at=None)
+
+    return errors
+
+@require_POST
+async def update_construction_status(request, info_id):
+    """更新建设单进度状态"""
+    try:
+        info = await ExtractedInfo.objects.only('id', 'uploaded_file_id').aget(id=info_id)
+    except ExtractedInfo.DoesNotExist:
+        return JsonResponse({'ok': False, 'error': 'not_found'}, status=404)
+
+    try:
+        payload = json.loads((request.body or b'{}').decode('utf-8', errors='replace'))
+    except json.JSONDecodeError:
+        payload = {}
+
+    status_type = payload.get('type')  # field_construction, resource_entry, completed
+    action = payload.get('action')     # set, unset
+
+    @sync_to_async
+    def apply():
+        with transaction.atomic(), track_summary_changes(ExtractedInfo.objects.filter(pk=info.pk)):
+            errors = _apply_construction_status(ExtractedInfo.objects.filter(pk=info.pk), status_type, action, timezone.now())
+            bump_upload_versions([info.uploaded_file_id])
+        return errors
+
+    errors = await apply()
+    if errors.get(info.pk) == 'resource_address_required':
+        return JsonResponse({'ok': False, 'error': 'resource_address_required', 'msg': '请先填写资源地址'}, status=400)
+
+    await info.arefresh_from_db(fields=['field_construction_at', 'resource_entry_at', 'construction_completed_at'])
 
     return JsonResponse({
         'ok': True,
@@ -670,10 +707,10 @@ def update_construction_status(request, info_id):
     })
 
 @require_POST
-def update_resource_address(request, info_id):
+async def update_resource_address(request, info_id):
     """更新资源地址"""
     try:
-        info = ExtractedInfo.objects.get(id=info_id)
+        info = await ExtractedInfo.objects.only('id', 'uploaded_file_id').aget(id=info_id)
     except ExtractedInfo.DoesNotExist:
         return JsonResponse({'ok': False, 'error': 'not_found'}, status=404)
 
@@ -684,15 +721,16 @@ def update_resource_address(request, info_id):
 
     address = payload.get('resource_address', '').strip()
     info.resource_address = address
-    info.save(update_fields=['resource_address'])
+    await info.asave(update_fields=['resource_address'])
+    await abump_upload_versions([info.uploaded_file_id])
 
     return JsonResponse({'ok': True, 'resource_address': info.resource_address})
 
 @require_POST
-def add_construction_remark(request, info_id):
+async def add_construction_remark(request, info_id):
     """添加建设单备注"""
     try:
-        info = ExtractedInfo.objects.get(id=info_id)
+        info = await ExtractedInfo.objects.only('id', 'uploaded_file_id').aget(id=info_id)
     except ExtractedInfo.DoesNotExist:
         return JsonResponse({'ok': False, 'error': 'not_found'}, status=404)
 
@@ -705,7 +743,8 @@ def add_construction_remark(request, info_id):
     if not content:
         return JsonResponse({'ok': False, 'error': 'empty_content'}, status=400)
 
-    remark = ConstructionRemark.objects.create(extracted_info=info, content=content)
+    remark = await ConstructionRemark.objects.acreate(extracted_info=info, content=content)
+    await abump_upload_versions([info.uploaded_file_id])
 
     return JsonResponse({
         'ok': True,
@@ -717,14 +756,392 @@ def add_construction_remark(request, info_id):
     })
 
 @require_POST
-def delete_construction_remark(request, remark_id):
+async def delete_construction_remark(request, remark_id):
     """删除建设单备注"""
     try:
-        remark = ConstructionRemark.objects.get(id=remark_id)
-        remark.delete()
-        return JsonResponse({'ok': True})
+        remark = await ConstructionRemark.objects.select_related('extracted_info').aget(id=remark_id)
     except ConstructionRemark.DoesNotExist:
         return JsonResponse({'ok': False, 'error': 'not_found'}, status=404)
+    await remark.adelete()
+    await abump_upload_versions([remark.extracted_info.uploaded_file_id])
+    return JsonResponse({'ok': True})
+
+def _int_param(params, name, default, minimum, maximum):
+    try:
+        value = int(params.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return min(max(value, minimum), maximum)
+
+@require_GET
+def document_text(request, info_id):
+    """单个文档的完整文本，展开“显示完整文本内容”时按需加载
+
+    按段落分页（page / page_size），默认高亮命中提取规则的片段（highlight=0 关闭）；
+    传 context=N 时只返回命中段落及前后 N 段。ETag 由上传的内容版本与当前规则版本决定，
+    未变化时返回 304，渲染结果同时按相同的键缓存在服务端。
+    """
+    meta = ExtractedInfo.objects.filter(id=info_id).values('uploaded_file__content_version').first()
+    if meta is None:
+        return JsonResponse({'ok': False, 'error': 'not_found'}, status=404)
+
+    page = _int_param(request.GET, 'page', 1, 1, 100000)
+    page_size = _int_param(request.GET, 'page_size', DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    highlight = request.GET.get('highlight', '1') != '0'
+    context_size = _int_param(request.GET, 'context', 0, 0, 20) if request.GET.get('context') else None
+    parts = [info_id, meta['uploaded_file__content_version'], current_rules_version(), page, page_size, highlight, context_size]
+    etag = '"{}"'.format(hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest())
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        def render_page():
+            text = ExtractedInfo.objects.filter(id=info_id).values_list('document_content', flat=True).first()
+            payload = document_page(text, page=page, page_size=page_size, highlight=highlight, context=context_size)
+            return json.dumps({'ok': True, **payload}, ensure_ascii=False)
+
+        response = HttpResponse(cached_fragment('document_text', parts, render_page), content_type='application/json')
+    response['ETag'] = etag
+    # 每次都向服务器确认（ETag 未变时 304），文本更新后不会读到旧内容
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+@require_GET
+def metrics(request):
+    """Prometheus 指标（文本格式）"""
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
+
+@require_GET
+def upload_progress(request, token):
+    """上传进度事件流（SSE）
+
+    事件只从共享缓存读取，流式响应期间不占用数据库连接；断线重连时按 Last-Event-ID 续传。
+    """
+    if not valid_token(token):
+        return JsonResponse({'ok': False, 'error': 'invalid_token'}, status=400)
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.GET.get('last_id') or 0)
+    except ValueError:
+        last_id = 0
+    # ASGI 下用异步生成器，等待新事件时不占用线程；WSGI 会把异步迭代器整个读完再发送，只能用同步生成器
+    stream = aevent_stream if isinstance(request, ASGIRequest) else event_stream
+    response = StreamingHttpResponse(stream(token, last_id), content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    # 关闭 nginx 的代理缓冲，事件才能即时送达
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _chunked_error(e):
+    return JsonResponse({'ok': False, 'error': e.error, **e.extra}, status=e.status)
+
+@require_POST
+def chunked_upload_init(request):
+    """分块上传第一步：{filename, size, sha256?} -> 会话ID、分块大小、分块数"""
+    try:
+        payload = json.loads((request.body or b'{}').decode('utf-8', errors='replace'))
+    except json.JSONDecodeError:
+        payload = {}
+    try:
+        state = init_upload(payload.get('filename'), payload.get('size'), payload.get('sha256'))
+    except ChunkedUploadError as e:
+        return _chunked_error(e)
+    return JsonResponse({'ok': True, **state}, status=201)
+
+@require_http_methods(['GET', 'DELETE'])
+def chunked_upload_status(request, upload_id):
+    """GET 返回已收到的分块（断线后据此续传），DELETE 放弃上传"""
+    if request.method == 'DELETE':
+        discard(upload_id)
+        return JsonResponse({'ok': True})
+    try:
+        return JsonResponse({'ok': True, **upload_status(upload_id)})
+    except ChunkedUploadError as e:
+        return _chunked_error(e)
+
+@require_http_methods(['PUT'])
+def chunked_upload_chunk(request, upload_id, index):
+    """上传一个分块：请求体为分块原始字节，X-Chunk-SHA256 为其校验和；可乱序、可重传"""
+    try:
+        write_chunk(upload_id, index, request, request.headers.get('X-Chunk-SHA256'))
+    except ChunkedUploadError as e:
+        return _chunked_error(e)
+    return JsonResponse({'ok': True, 'index': index})
+
+@require_POST
+def chunked_upload_finalize(request):
+    """分块上传最后一步：{upload_ids, progress_token?}，各文件与表单上传一样交给 process_archives 处理"""
+    try:
+        payload = json.loads((request.body or b'{}').decode('utf-8', errors='replace'))
+    except json.JSONDecodeError:
+        payload = {}
+    upload_ids = payload.get('upload_ids')
+    if not isinstance(upload_ids, list) or not upload_ids:
+        return JsonResponse({'ok': False, 'error': 'upload_ids_required'}, status=400)
+    upload_ids = list(dict.fromkeys(str(upload_id) for upload_id in upload_ids))
+
+    archives = []
+    for upload_id in upload_ids:
+        try:
+            archives.append(assemble(upload_id))
+        except ChunkedUploadError as e:
+            return JsonResponse({'ok': False, 'error': e.error, 'upload_id': upload_id, **e.extra}, status=e.status)
+
+    progress_token = payload.get('progress_token')
+    progress_reporter(progress_token)('received', files=[archive.name for archive in archives])
+    try:
+        outcomes = process_archives(archives, _geocode_address_async, progress_token)
+    finally:
+        for upload_id in upload_ids:
+            discard(upload_id)
+
+    results = [{
+        'upload_id': upload_id,
+        'name': outcome['name'],
+        'ok': outcome['upload'] is not None and not outcome['upload'].processing_error,
+        'id': outcome['upload'].id if outcome['upload'] is not None else None,
+        'error': outcome['message'] or (outcome['upload'].processing_error if outcome['upload'] is not None else 'save_failed'),
+    } for upload_id, outcome in zip(upload_ids, outcomes)]
+    return JsonResponse({'ok': True, 'results': results, 'url': _finish_upload(outcomes, progress_token)})
+
+@require_GET
+def export_results(request):
+    """按仪表盘筛选条件流式导出提取结果（CSV / XLSX）"""
+    filters = parse_upload_filters(request.GET)
+    export_format = (request.GET.get('format') or 'csv').lower()
+    rows = iter_export_rows(export_queryset(filter_uploaded_files(filters)))
+    stamp = timezone.now().astimezone(ZoneInfo('Asia/Shanghai')).strftime('%Y%m%d_%H%M%S')
+
+    if export_format == 'xlsx':
+        response = StreamingHttpResponse(
+            stream_xlsx(rows),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+        filename = f'提取结果_{stamp}.xlsx'
+    else:
+        response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv; charset=utf-8')
+        filename = f'提取结果_{stamp}.csv'
+
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+@require_GET
+def download_bundle(request):
+    """按仪表盘筛选条件把匹配的原始压缩包流式打包下载（附 manifest.csv）"""
+    filters = parse_upload_filters(request.GET)
+    uploads = bundle_queryset(filter_uploaded_files(filters))
+    stamp = timezone.now().astimezone(ZoneInfo('Asia/Shanghai')).strftime('%Y%m%d_%H%M%S')
+
+    response = StreamingHttpResponse(stream_upload_bundle(uploads), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, f'原始压缩包_{stamp}.zip')
+    return response
+
+REPORT_GROUP_FIELDS = {
+    'month': 'month',
+    'construction_unit': 'construction_unit',
+    'township': 'township',
+}
+
+def _parse_report_month(value):
+    m = re.match(r'^(\d{4})-(\d{1,2})$', (value or '').strip())
+    if not m or not 1 <= int(m.group(2)) <= 12:
+        return None
+    return date(int(m.group(1)), int(m.group(2)), 1)
+
+@require_GET
+def report_summary(request):
+    """费用与建设进度汇总报表（只读取汇总表，不扫描提取结果）"""
+    qs = ReportSummary.objects.all()
+    construction_unit = (request.GET.get('construction_unit') or '').strip()
+    township = (request.GET.get('township') or '').strip()
+    start_month = _parse_report_month(request.GET.get('start_month'))
+    end_month = _parse_report_month(request.GET.get('end_month'))
+    if construction_unit:
+        qs = qs.filter(construction_unit__icontains=construction_unit)
+    if township:
+        qs = qs.filter(township__icontains=township)
+    if start_month:
+        qs = qs.filter(month__gte=start_month)
+    if end_month:
+        qs = qs.filter(month__lte=end_month)
+
+    # group_by=month,construction_unit 之类，按所选维度合并；缺省为最细粒度
+    group_by = [g for g in (request.GET.get('group_by') or '').split(',') if g in REPORT_GROUP_FIELDS]
+    if not group_by:
+        group_by = list(REPORT_GROUP_FIELDS)
+
+    rows = []
+    totals = {field: 0 for field in SUMMARY_VALUE_FIELDS}
+    grouped = qs.values(*group_by).annotate(**{f'sum_{f}': Sum(f) for f in SUMMARY_VALUE_FIELDS}).order_by(*group_by)
+    for item in grouped:
+        row = {g: item[g] for g in group_by}
+        if 'month' in row:
+            row['month'] = row['month'].strftime('%Y-%m')
+        for field in SUMMARY_VALUE_FIELDS:
+            value = item[f'sum_{field}'] or 0
+            totals[field] += value
+            row[field] = float(value) if isinstance(value, Decimal) else value
+        rows.append(row)
+
+    totals = {k: (float(v) if isinstance(v, Decimal) else v) for k, v in totals.items()}
+    return JsonResponse({'ok': True, 'group_by': group_by, 'rows': rows, 'totals': totals})
+
+# 批量接口单次最多处理的记录数
+BULK_MAX_IDS = 1000
+
+def _parse_bulk_ids(values):
+    """解析批量接口的ID列表，返回 (有序去重的有效ID, {原始值: 错误})"""
+    ids, errors = [], {}
+    for value in values if isinstance(values, list) else []:
+        try:
+            pk = int(value)
+        except (TypeError, ValueError):
+            errors[str(value)] = 'invalid_id'
+            continue
+        if pk not in ids:
+            ids.append(pk)
+    return ids, errors
+
+def _bulk_error_response(error, msg):
+    return JsonResponse({'ok': False, 'error': error, 'msg': msg}, status=400)
+
+def _bulk_results(ids, invalid, rows, errors, serialize):
+    """按请求顺序汇总每个ID的处理结果"""
+    results = [{'id': raw, 'ok': False, 'error': err} for raw, err in invalid.items()]
+    for pk in ids:
+        if pk not in rows:
+            results.append({'id': pk, 'ok': False, 'error': 'not_found'})
+        elif pk in errors:
+            results.append({'id': pk, 'ok': False, 'error': errors[pk], **serialize(rows[pk])})
+        else:
+            results.append({'id': pk, 'ok': True, **serialize(rows[pk])})
+    return JsonResponse({'ok': True, 'results': results})
+
+def _serialize_status(row):
+    return {
+        'field_construction_at': format_beijing_datetime(row['field_construction_at']),
+        'resource_entry_at': format_beijing_datetime(row['resource_entry_at']),
+        'construction_completed_at': format_beijing_datetime(row['construction_completed_at']),
+    }
+
+@require_POST
+def bulk_update_construction_status(request):
+    """批量更新建设单进度：{"ids": [...], "type": "...", "action": "set|unset"}"""
+    try:
+        payload = json.loads((request.body or b'{}').decode('utf-8', errors='replace'))
+    except json.JSONDecodeError:
+        payload = {}
+
+    ids, invalid = _parse_bulk_ids(payload.get('ids'))
+    if not ids and not invalid:
+        return _bulk_error_response('empty_ids', '请至少选择一条记录')
+    if len(ids) > BULK_MAX_IDS:
+        return _bulk_error_response('too_many_ids', f'单次最多处理 {BULK_MAX_IDS} 条记录')
+
+    status_type = payload.get('type')
+    action = payload.get('action')
+    if status_type not in ('field_construction', 'resource_entry', 'completed') or action not in ('set', 'unset'):
+        return _bulk_error_response('invalid_transition', '无效的进度类型或操作')
+
+    queryset = ExtractedInfo.objects.filter(pk__in=ids)
+    with transaction.atomic(), track_summary_changes(queryset):
+        errors = _apply_construction_status(queryset, status_type, action, timezone.now())
+        bump_info_upload_versions(queryset)
+
+    rows = {row['id']: row for row in queryset.values('id', 'field_construction_at', 'resource_entry_at', 'construction_completed_at')}
+    return _bulk_results(ids, invalid, rows, errors, _serialize_status)
+
+@require_POST
+def bulk_update_construction_email_sent(request):
+    """批量设置建设邮件发送状态：{"ids": [...], "construction_email_sent": true|false}"""
+    try:
+        payload = json.loads((request.body or b'{}').decode('utf-8', errors='replace'))
+    except json.JSONDecodeError:
+        payload = {}
+
+    ids, invalid = _parse_bulk_ids(payload.get('ids'))
+    if not ids and not invalid:
+        return _bulk_error_response('empty_ids', '请至少选择一条记录')
+    if len(ids) > BULK_MAX_IDS:
+        return _bulk_error_response('too_many_ids', f'单次最多处理 {BULK_MAX_IDS} 条记录')
+
+    checked = payload.get('construction_email_sent') is True
+    queryset = ExtractedInfo.objects.filter(pk__in=ids)
+    with transaction.atomic(), track_summary_changes(queryset):
+        queryset.update(
+            construction_email_sent=checked,
+            construction_email_sent_at=timezone.now() if checked else None,
+        )
+        bump_info_upload_versions(queryset, sidebar=True)
+
+    rows = {row['id']: row for row in queryset.values('id', 'construction_email_sent', 'construction_email_sent_at')}
+    return _bulk_results(ids, invalid, rows, {}, lambda row: {
+        'construction_email_sent': row['construction_email_sent'],
+        'construction_email_sent_at': format_beijing_datetime(row['construction_email_sent_at']),
+    })
+
+@require_POST
+def bulk_update_construction_order_code(request):
+    """批量修改建设单号：{"items": [{"id": 1, "construction_order_code": "..."}, ...]}"""
+    try:
+        payload = json.loads((request.body or b'{}').decode('utf-8', errors='replace'))
+    except json.JSONDecodeError:
+        payload = {}
+
+    items = [item for item in payload.get('items') or [] if isinstance(item, dict)] if isinstance(payload.get('items'), list) else []
+    ids, invalid = _parse_bulk_ids([item.get('id') for item in items])
+    codes = {}
+    for item in items:
+        try:
+            pk = int(item.get('id'))
+        except (TypeError, ValueError):
+            continue
+        code = item.get('construction_order_code')
+        code = (str(code).strip() if code is not None else '')
+        codes[pk] = code[:100] if code else None
+
+    if not ids and not invalid:
+        return _bulk_error_response('empty_ids', '请至少选择一条记录')
+    if len(ids) > BULK_MAX_IDS:
+        return _bulk_error_response('too_many_ids', f'单次最多处理 {BULK_MAX_IDS} 条记录')
+
+    queryset = ExtractedInfo.objects.filter(pk__in=ids)
+    with transaction.atomic():
+        queryset.update(construction_order_code=Case(
+            *[When(pk=pk, then=Value(code)) for pk, code in codes.items()],
+            default='construction_order_code',
+        ))
+        bump_info_upload_versions(queryset)
+
+    rows = {row['id']: row for row in queryset.values('id', 'construction_order_code')}
+    return _bulk_results(ids, invalid, rows, {}, lambda row: {
+        'construction_order_code': row['construction_order_code'],
+    })
+
+@require_POST
+def bulk_update_upload_mark(request):
+    """批量标记上传记录：{"ids": [...], "is_marked": true|false}，省略 is_marked 时逐条取反"""
+    try:
+        payload = json.loads((request.body or b'{}').decode('utf-8', errors='replace'))
+    except json.JSONDecodeError:
+        payload = {}
+
+    ids, invalid = _parse_bulk_ids(payload.get('ids'))
+    if not ids and not invalid:
+        return _bulk_error_response('empty_ids', '请至少选择一条记录')
+    if len(ids) > BULK_MAX_IDS:
+        return _bulk_error_response('too_many_ids', f'单次最多处理 {BULK_MAX_IDS} 条记录')
+
+    queryset = UploadedFile.objects.filter(pk__in=ids)
+    is_marked = payload.get('is_marked')
+    with transaction.atomic():
+        if isinstance(is_marked, bool):
+            queryset.update(is_marked=is_marked)
+        else:
+            queryset.update(is_marked=Case(When(is_marked=True, then=Value(False)), default=Value(True)))
+        bump_sidebar_version()
+
+    rows = {row['id']: row for row in queryset.values('id', 'is_marked')}
+    return _bulk_results(ids, invalid, rows, {}, lambda row: {'is_marked': row['is_marked']})
 
 def upload_file(request):
     """(已弃用) 文件上传页面"""
@@ -749,24 +1166,14 @@ def download_file(request, file_id):
         # 获取上传文件记录
         uploaded_file = UploadedFile.objects.get(id=file_id)
         
-        # 检查文件是否存在
-        if not uploaded_file.file or not os.path.exists(uploaded_file.file.path):
+        # 检查文件是否存在（热/冷存储层级由 storage_tier 决定）
+        path = stored_file_path(uploaded_file)
+        if not path or not os.path.exists(path):
             messages.error(request, '文件不存在或已被删除')
             return redirect('file_detail', file_id=file_id)
         
-        # 获取文件的MIME类型
-        content_type = mimetypes.guess_type(uploaded_file.file.path)[0] or 'application/octet-stream'
-        
-        # 创建文件包装器
-        file_wrapper = FileWrapper(open(uploaded_file.file.path, 'rb'))
-        
-        # 创建响应
-        response = HttpResponse(file_wrapper, content_type=content_type)
-        response['Content-Length'] = os.path.getsize(uploaded_file.file.path)
-        response['Content-Disposition'] = f'attachment; filename="{uploaded_file.original_filename}"'
-        
-        return response
-        
+        return serve_file(request, path, uploaded_file.original_filename)
+
     except UploadedFile.DoesNotExist:
         messages.error(request, '找不到指定的文件记录')
         return redirect('file_history')
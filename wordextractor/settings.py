@@ -44,9 +44,25 @@ INSTALLED_APPS = [
 # 配置文件上传路径
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# 上传压缩包按内容 SHA-256 存放（见 uploader/storage.py），相同内容只保存一份
+STORAGES = {
+    'default': {'BACKEND': 'uploader.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
 
 AMAP_API_KEY = os.environ.get('AMAP_API_KEY', '153784f37d6d65dbaae9c568fdc650db')
+# 高德接口地址（基准测试中指向本地模拟服务）
+AMAP_API_BASE = os.environ.get('AMAP_API_BASE', 'https://restapi.amap.com')
 STREET_TEAM_XLSX_PATH = os.environ.get('STREET_TEAM_XLSX_PATH', str(BASE_DIR / '街道_施工队.xlsx'))
+# 费用/光缆提取规则文件；修改规则后递增其中的 version，运行中的进程会自动加载新版本
+EXTRACTION_RULES_PATH = os.environ.get('EXTRACTION_RULES_PATH', str(BASE_DIR / 'uploader' / 'extraction_rules.json'))
+
+# 下载转发：留空由 Django 直接输出文件；'nginx' 使用 X-Accel-Redirect；'sendfile' 使用 X-Sendfile（Apache/lighttpd）
+DOWNLOAD_SENDFILE_MODE = os.environ.get('DOWNLOAD_SENDFILE_MODE') or None
+# nginx 中映射到 MEDIA_ROOT 的 internal location
+DOWNLOAD_ACCEL_REDIRECT_PREFIX = os.environ.get('DOWNLOAD_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+# 冷存储（RETENTION_COLD_ROOT）对应的 internal location
+DOWNLOAD_ACCEL_REDIRECT_COLD_PREFIX = os.environ.get('DOWNLOAD_ACCEL_REDIRECT_COLD_PREFIX', '/protected-cold-media/')
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -56,6 +72,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'uploader.metrics.RequestMetricsMiddleware',
+    # 须位于末尾：触发剖析时由它调用视图
+    'uploader.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'wordextractor.urls'
@@ -85,9 +104,77 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # 写事务开始时即获取写锁，避免读锁升级为写锁时直接报 database is locked
+            'transaction_mode': 'IMMEDIATE',
+            # 等待锁的秒数（与 SQLITE_PRAGMAS 的 busy_timeout 一致）
+            'timeout': 20,
+        },
     }
 }
 
+# 缓存：多个工作进程共享，用于仪表盘结果面板/侧边栏片段缓存。
+# 默认使用本机文件缓存；设置 REDIS_URL 后改用 Redis（需安装 redis 包），可跨多台服务器共享
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('DJANGO_CACHE_DIR', str(BASE_DIR / 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+# 仪表盘片段缓存有效期（秒）；失效由版本号保证，这里只用于回收不再访问的条目
+DASHBOARD_FRAGMENT_TIMEOUT = 7 * 24 * 3600
+
+# 上传进度事件在缓存中的保留时间（秒），也是单个 SSE 连接的最长时长
+UPLOAD_PROGRESS_TIMEOUT = 3600
+
+# 一次上传多个压缩包时的并发度（见 uploader/scheduler.py），线程池/进程池在进程内共享，是所有请求的总上限；
+# 提取进程数为 0 时在请求线程中逐个提取
+UPLOAD_GEOCODE_WORKERS = int(os.environ.get('UPLOAD_GEOCODE_WORKERS', 4))
+UPLOAD_EXTRACT_WORKERS = int(os.environ.get('UPLOAD_EXTRACT_WORKERS', min(4, os.cpu_count() or 1)))
+
+# 压缩包中的内层 ZIP 最多展开的层数（以流方式读取，不解压到磁盘）；更深的内层压缩包记为一条失败结果
+UPLOAD_ARCHIVE_MAX_DEPTH = 3
+
+# 上传结果写入方式（见 uploader/ingest.py）：append（默认）每次上传都新建一组结果，
+# upsert 按 (单号, 文档名) 更新已有的提取结果并保留人工录入的信息
+UPLOAD_INGEST_MODE = os.environ.get('UPLOAD_INGEST_MODE', 'append')
+
+# 分块上传（见 uploader/chunked.py）：大于 UPLOAD_CHUNKED_THRESHOLD 的文件由仪表盘按 UPLOAD_CHUNK_SIZE 分块上传，
+# 断线后只补传缺失的分块；未完成的会话保留 UPLOAD_CHUNKED_TIMEOUT 秒
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+UPLOAD_CHUNKED_THRESHOLD = 16 * 1024 * 1024
+UPLOAD_CHUNKED_MAX_SIZE = 2 * 1024 * 1024 * 1024
+UPLOAD_CHUNKED_TIMEOUT = 24 * 3600
+
+# 上传压缩包保留策略（见 uploader/retention.py，由 python manage.py apply_retention 执行）：
+# 上传超过 cold_after_days 天的压缩包迁移到 RETENTION_COLD_ROOT，提取成功的可重新压缩；下载时自动从所在层级读取
+RETENTION_COLD_ROOT = os.environ.get('RETENTION_COLD_ROOT', str(BASE_DIR / 'cold_media'))
+RETENTION_POLICY = {
+    'cold_after_days': int(os.environ['RETENTION_COLD_AFTER_DAYS']) if os.environ.get('RETENTION_COLD_AFTER_DAYS') else 180,
+    'recompress': True,
+    'compression': 'deflate',
+    'batch_size': 50,
+}
+
+# 请求剖析（见 uploader/profiling.py）：staff 用户以请求头 X-Profile: 1 或 ?_profile=1 触发，
+# 另按 PROFILING_SAMPLE_RATE 比例抽样；结果在 admin 的“Request profiles”中浏览，只保留最近 PROFILING_MAX_PROFILES 条
+PROFILING_ENABLED = True
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_MAX_PROFILES = 500
+
+# 每个 SQLite 连接建立时执行的 PRAGMA（见 uploader/dbtuning.py），可按需覆盖单项，值为 None 表示不设置
+SQLITE_PRAGMAS = {}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators